@@ -5,8 +5,8 @@ a = Analysis(
     ['run_app.py'],
     pathex=[],
     binaries=[],
-    datas=[('app.py', '.')],
-    hiddenimports=[],
+    datas=[('app.py', '.'), ('ingest.py', '.'), ('parse_cache.py', '.'), ('amounts.py', '.'), ('coverage.py', '.'), ('invoice_index.py', '.'), ('ledger.py', '.'), ('excel_export.py', '.'), ('template_registry.py', '.'), ('bulk_export.py', '.'), ('nc_engine.py', '.'), ('dataset_store.py', '.'), ('chunked_ingest.py', '.'), ('column_resolver.py', '.'), ('config.py', '.'), ('local_sheet.py', '.'), ('sheet_mirror.py', '.'), ('sheet_writer.py', '.'), ('history_search.py', '.'), ('credit_store.py', '.'), ('historial_creditos.db', '.')],
+    hiddenimports=['sqlite3', 'concurrent.futures.process', 'openpyxl', 'pyarrow.compute', 'pyarrow.csv', 'pyarrow.ipc', 'python_calamine'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,116 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from column_resolver import resolve_columns
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = 'string[pyarrow]'
+except ImportError:
+    STRING_DTYPE = str
+
+# --- CONVERSIÓN DE MONTOS ---
+# Formatos admitidos: "1.234,56", "1,234.56" con coma y punto (el punto se toma
+# como separador de miles), "$ 1,5", "1234.", ".5". Los valores no válidos dan NaN.
+
+# Patrones como texto (no compilados) para que pandas pueda delegarlos a pyarrow
+_NON_NUMERIC_PATTERN = r'[^\d.,]'
+_VALID_NUMBER_PATTERN = r'\d+(\.\d*)?|\.\d+'
+
+# Columna float64 con el monto de cada línea, calculada una sola vez al cargar el archivo
+AMOUNT_COLUMN = '__monto_numeric__'
+
+
+def find_amount_column(columns):
+    """Columna de precio/monto del extracto (ver column_resolver)."""
+    return resolve_columns([c for c in columns if c != AMOUNT_COLUMN])['monto']
+
+
+def add_amount_column(df, col_monto=None):
+    """Agrega AMOUNT_COLUMN (float64) a partir de la columna de precio detectada. Devuelve la columna usada."""
+    col_monto = col_monto or find_amount_column(df.columns)
+    if col_monto is not None:
+        df[AMOUNT_COLUMN] = convert_series_to_float(df[col_monto])
+    return col_monto
+
+
+def convert_value_to_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        processed_value = value.strip().replace('$', '').replace('€', '').replace(' ', '')
+        if ',' in processed_value and '.' in processed_value:
+            processed_value = processed_value.replace('.', '')
+            processed_value = processed_value.replace(',', '.')
+        elif ',' in processed_value:
+            processed_value = processed_value.replace(',', '.')
+        processed_value = re.sub(r'[^\d.]', '', processed_value)
+        try:
+            if processed_value.startswith('.'):
+                processed_value = '0' + processed_value
+            if processed_value.endswith('.'):
+                processed_value = processed_value[:-1]
+            return float(processed_value)
+        except ValueError:
+            return None
+    return None
+
+
+def _parse_strings(values):
+    """Versión vectorizada de convert_value_to_float para un Series de textos."""
+    cleaned = values.str.replace(_NON_NUMERIC_PATTERN, '', regex=True)
+    # Con coma presente los puntos son de miles y la coma es el decimal
+    has_comma = cleaned.str.contains(',', regex=False)
+    if has_comma.any():
+        cleaned = cleaned.where(
+            ~has_comma,
+            cleaned.str.replace('.', '', regex=False).str.replace(',', '.', regex=False),
+        )
+    cleaned = cleaned.where(~cleaned.str.startswith('.'), '0' + cleaned)
+    cleaned = cleaned.where(~cleaned.str.endswith('.'), cleaned.str[:-1])
+    valid = cleaned.str.fullmatch(_VALID_NUMBER_PATTERN).to_numpy(dtype=bool)
+    result = np.full(len(cleaned), np.nan)
+    result[valid] = cleaned[valid].astype('float64').to_numpy()
+    return pd.Series(result, index=values.index)
+
+
+def convert_series_to_float(series):
+    """
+    Convierte un Series completo de montos a float64 (NaN si no es válido) con el
+    mismo criterio que convert_value_to_float. Cada valor distinto se procesa una
+    sola vez, lo que en extractos SAP con precios repetidos reduce mucho el trabajo.
+    """
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return series.astype('float64')
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    uniques = pd.Series(np.asarray(uniques, dtype=object))
+    if uniques.empty:
+        return pd.Series(np.nan, index=series.index, dtype='float64')
+
+    if pd.api.types.infer_dtype(uniques, skipna=False) == 'string':
+        is_str = np.ones(len(uniques), dtype=bool)
+    else:
+        is_str = uniques.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    parsed = np.full(len(uniques), np.nan)
+    if is_str.any():
+        parsed[is_str] = _parse_strings(uniques[is_str].astype(STRING_DTYPE)).to_numpy()
+    if not is_str.all():
+        # Números sueltos en columnas de texto (p. ej. celdas numéricas de Excel)
+        others = uniques[~is_str].map(convert_value_to_float)
+        parsed[~is_str] = pd.to_numeric(others, errors='coerce').to_numpy(dtype='float64')
+
+    result = np.where(codes >= 0, parsed[np.maximum(codes, 0)], np.nan)
+    return pd.Series(result, index=series.index, dtype='float64', name=series.name)
+
+
+def format_monto_local(monto):
+    if pd.isna(monto) or monto is None:
+        return ''
+    try:
+        monto = float(monto)
+        return f"{monto:,.2f}".replace(",", "_TEMP_").replace(".", ",").replace("_TEMP_", ".")
+    except (ValueError, TypeError):
+        return str(monto)
@@ -1,404 +1,40 @@
 import streamlit as st
 import pandas as pd
-import io
-import openpyxl
 import os
 from datetime import datetime
-from openpyxl.styles import Font, Border, Side, Alignment, PatternFill, Protection, numbers
-import numpy as np
-import re
 import base64
+from ingest import IngestError
+from nc_engine import (NCF_MAPPING, PORTFOLIO_ACRONYM_MAP, NCError, CoverageError, clean_input_codes, detect_portfolio_code, get_file_name,
+                       detect_columns, prepare_lines, build_index, available_lines, check_clients,
+                       cover_amount, browse_invoices, enrich_ticket, PipelineCache, codes_key, ledger_key)
+from coverage import SOLVER_MODES, DEFAULT_SOLVER_MODE
+from ledger import add_ticket_to_ledger, build_ledger, history_ledger
+from template_registry import TEMPLATES
+from bulk_export import export_tickets_zip, tag_ticket
+from amounts import convert_value_to_float, convert_series_to_float, format_monto_local
+from dataset_store import DATASETS
+from chunked_ingest import read_table_chunked
+from parse_cache import hash_file
+from credit_store import CREDITS
 
 # --- FUNCIONES AUXILIARES ---
 
-def clean_leading_zeros(code_str):
-    if pd.isna(code_str) or code_str is None:
-        return ''
-    code_str = str(code_str).strip()
-    if not code_str:
-        return ''
-    return code_str.lstrip('0')
-
-def clean_input_codes(input_raw):
-    """
-    MODIFICADO PARA SAP: Permite saltos de línea (al pegar desde Excel), 
-    espacios, tabulaciones y comas.
-    """
-    if not input_raw:
-        return []
-    # Usamos regex para reconocer cualquier separador de espacio/línea o comas
-    codes = re.split(r'[\n\r\s,;]+', input_raw)
-    cleaned_codes = [clean_leading_zeros(c.strip()) for c in codes if c.strip()]
-    return list(set([c for c in cleaned_codes if c]))
-
-def detect_portfolio_code(df):
-    # ESTRATEGIA 1: Buscar por columna "Organización de Ventas"
-    col_org_venta = None
-    for col in df.columns:
-        c_clean = str(col).lower().replace(' ', '').replace('.', '').replace('_', '')
-        if 'org' in c_clean and ('ven' in c_clean or 'vta' in c_clean):
-            col_org_venta = col
-            break
-            
-    if col_org_venta:
-        unique_vals = set(df[col_org_venta].astype(str).str.strip().str.upper().unique())
-        unique_set = set()
-        for val in unique_vals:
-            unique_set.add(val) 
-            unique_set.add(clean_leading_zeros(val)) 
-        
-        if '0702' in unique_set or '702' in unique_set: return '0700'
-        if '0602' in unique_set or '602' in unique_set: return '0600'
-        if 'R200' in unique_set: return 'R100'
-        if 'C001' in unique_set: return 'C001'
-
-    # ESTRATEGIA 2: Buscar por columna "Sociedad"
-    col_sociedad = None
-    for col in df.columns:
-        c_clean = str(col).lower().replace(' ', '')
-        if 'sociedad' in c_clean:
-            col_sociedad = col
-            break
-    
-    if col_sociedad:
-        unique_soc = set(df[col_sociedad].astype(str).str.strip().str.lower().unique())
-        for val in unique_soc:
-            if 'alimentos' in val and 'polar' in val: return '0700'
-            if 'pepsi' in val: return 'R100'
-            if 'cervecer' in val or 'cerveceria' in val: return 'C001'
-            if 'efe' in val: return '0600'
-
-    # ESTRATEGIA 3: Fallback por Clase de Factura
-    clase_factura_keys = ['clase de factura', 'clasefactura', 'clase_factura', 'clase.factura', 'cl.f'] 
-    col_clase_factura = next((c for c in df.columns if any(k in str(c).lower().replace(' ', '') for k in clase_factura_keys)), None)
-
-    if col_clase_factura:
-        unique_factura_codes = set(df[col_clase_factura].astype(str).str.strip().str.upper().unique())
-        if any(code in unique_factura_codes for code in ['YP01', 'YP04', 'YP10']): return 'R100'
-        if 'YC00' in unique_factura_codes: return 'C001'
-        if any(code in unique_factura_codes for code in ['ZSPN', 'X|', 'ZSCC']): return '0700'
-
-    return '--'
-
-def convert_value_to_float(value):
-    if isinstance(value, (int, float)):
-        return float(value)
-    if isinstance(value, str):
-        processed_value = value.strip().replace('$', '').replace('€', '').replace(' ', '')
-        if ',' in processed_value and '.' in processed_value:
-            processed_value = processed_value.replace('.', '')
-            processed_value = processed_value.replace(',', '.')
-        elif ',' in processed_value:
-            processed_value = processed_value.replace(',', '.')
-        processed_value = re.sub(r'[^\d.]', '', processed_value)
-        try:
-            if processed_value.startswith('.'): 
-                processed_value = '0' + processed_value
-            if processed_value.endswith('.'): 
-                processed_value = processed_value[:-1]
-            return float(processed_value)
-        except ValueError:
-            return None
-    return None
-
-def format_monto_local(monto):
-    if pd.isna(monto) or monto is None:
-        return ''
-    try:
-        monto = float(monto)
-        return f"{monto:,.2f}".replace(",", "_TEMP_").replace(".", ",").replace("_TEMP_", ".")
-    except (ValueError, TypeError):
-        return str(monto) 
-
-def find_invoices_by_total_sum(df_candidates, target_amount, invoice_col, price_col, client_col, product_col, assignment_mode):
-    if df_candidates.empty or invoice_col not in df_candidates.columns or price_col not in df_candidates.columns:
-        return None, None, 0
-
-    df_candidates_copy = df_candidates.copy() 
-    if '__monto_numeric__' not in df_candidates_copy.columns:
-        df_candidates_copy['__monto_numeric__'] = df_candidates_copy[price_col].apply(convert_value_to_float)
-    
-    df_candidates_copy.dropna(subset=['__monto_numeric__'], inplace=True)
-    df_candidates_copy = df_candidates_copy[df_candidates_copy['__monto_numeric__'] > 0.01]
-
-    if df_candidates_copy.empty:
-        return None, None, 0
-
-    invoice_sums_df = df_candidates_copy.groupby(invoice_col).agg(
-        total_sum=('__monto_numeric__', 'sum'),
-        client_code=(client_col, 'first'),
-        product_code=(product_col, 'first') 
-    ).reset_index()
-
-    invoice_sums_df.columns = [invoice_col, 'total_sum', client_col, product_col]
-
-    sufficient_invoices = invoice_sums_df[invoice_sums_df['total_sum'] >= target_amount]
-
-    if not sufficient_invoices.empty:
-        best_single_invoice_df = sufficient_invoices.sort_values(by='total_sum', ascending=True).iloc[0:1]
-        df_selected_invoices = pd.DataFrame(best_single_invoice_df)
-    else:
-        invoice_sums_df.sort_values(by='total_sum', ascending=False, inplace=True)
-        chosen_invoices_data = []
-        current_sum = 0
-        for _, row in invoice_sums_df.iterrows():
-            if current_sum >= target_amount:
-                break
-            chosen_invoices_data.append(row.to_dict())
-            current_sum += row['total_sum']
-        df_selected_invoices = pd.DataFrame(chosen_invoices_data)
-    
-    if df_selected_invoices.empty:
-        total_available_sum = invoice_sums_df['total_sum'].sum()
-        return None, None, total_available_sum
-
-    current_sum = df_selected_invoices['total_sum'].sum()
-    if current_sum < target_amount:
-        total_available_sum = invoice_sums_df['total_sum'].sum()
-        return None, None, total_available_sum
-
-    first_client_code = df_selected_invoices[client_col].iloc[0]
-    monto_cubierto_final = df_selected_invoices['total_sum'].sum()
-
-    if assignment_mode == 'Estricto (Truncar)' and not df_selected_invoices.empty:
-        sum_excluding_last = df_selected_invoices['total_sum'].iloc[:-1].sum() if len(df_selected_invoices) > 1 else 0
-        required_from_last = target_amount - sum_excluding_last
-        required_from_last = max(0, required_from_last)
-
-        df_selected_invoices_copy = df_selected_invoices.copy()
-        last_idx_in_df = df_selected_invoices_copy.index[-1]
-        df_selected_invoices_copy.loc[last_idx_in_df, 'total_sum'] = required_from_last
-        
-        monto_cubierto_final = target_amount
-        df_selected_invoices_copy['Monto NC Asignado'] = df_selected_invoices_copy['total_sum']
-        return df_selected_invoices_copy, first_client_code, monto_cubierto_final
-    else:
-        df_selected_invoices['Monto NC Asignado'] = df_selected_invoices['total_sum']
-        return df_selected_invoices, first_client_code, monto_cubierto_final
-
-def create_excel_for_all_invoices(df_to_export, selected_portfolio, ticket_number_for_name="", multiple_invoices=False):
-    portfolio_template_map = {
-        '0700': 'plantilla_APC.xlsx',
-        'R100': 'plantilla_PCV.xlsx',
-        'C001': 'plantilla_CYM.xlsx',
-        '0600': 'plantilla_EFE.xlsx',
-    }
-    
-    try:
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    except NameError:
-        BASE_DIR = os.getcwd()
-
-    default_template_path = os.path.join(BASE_DIR, 'plantilla_default.xlsx')
-    specific_template_name = portfolio_template_map.get(selected_portfolio)
- 
-    template_path = os.path.join(BASE_DIR, specific_template_name) if specific_template_name and os.path.exists(os.path.join(BASE_DIR, specific_template_name)) else default_template_path
-    
-    try:
-        workbook = openpyxl.load_workbook(template_path)
-        sheet = workbook.active
-    except Exception as e:
-        try:
-             workbook = openpyxl.load_workbook(default_template_path)
-             sheet = workbook.active
-        except Exception as e_default:
-             st.error(f"Error: No se pudo cargar ninguna plantilla de Excel (ni específica ni por defecto). Detalles: {e_default}")
-             return None
-             
-    header_row = 1
-    df_column_map = {
-        "Clase de pedido": "Clase de pedido",
-        "Organizacion de Venta": "Organizacion de Venta",
-        "Canal de Distribucion": "Canal de Distribucion",
-        "Sector": "Sector",
-        "Solicitante": "Solicitante",
-        "Fecha de Pedido": "Fecha de Pedido",
-        "Fecha de Precio": "Fecha de Precio",
-        "Fecha de Factura": "Fecha de Factura",
-        "Motivo": "Motivo",
-        "Pedido Cliente": "Pedido Cliente",
-        "Material": "Material",
-        "Cantidad": "Cantidad",
-        "U. MEDIDA": "U. MEDIDA", 
-        "CONDICION": "CONDICION", 
-        "VARIACION DE PRECIO": "VARIACION DE PRECIO",
-        "ASIGNACION": "ASIGNACION",
-        "UTILIZACION": "UTILIZACION",
-        "TEXTO CABECERA": "TEXTO CABECERA",
-        "Peso %": "Peso %",
-        "Monto NC Asignado": "Monto NC Asignado",
-        "Observación": "Observación",
-    }
-    excel_template_structure = []
-    template_headers = {}
-    used_df_columns = set()
-
-    for cell in sheet[header_row]:
-        template_header = str(cell.value).strip() if cell.value is not None else ''
-        if not template_header: 
-            continue
-        normalized_template_header = template_header.replace(' ', '').lower()
-        df_column_name = None
-        
-        for df_col, template_col_match in df_column_map.items():
-            if template_col_match.replace(' ', '').lower() == normalized_template_header:
-                df_column_name = df_col
-                break
-        
-        if df_column_name is None:
-            if "clase" in normalized_template_header and "pedido" in normalized_template_header:
-                df_column_name = "Clase de pedido"
-            elif "org" in normalized_template_header and ("ven" in normalized_template_header or "vta" in normalized_template_header):
-                df_column_name = "Organizacion de Venta"
-            elif "canal" in normalized_template_header:
-                df_column_name = "Canal de Distribucion"
-            elif "sector" in normalized_template_header:
-                df_column_name = "Sector"
-
-        if df_column_name == "TEXTO CABECERA" and "TEXTO CABECERA" in used_df_columns:
-            continue
-
-        excel_template_structure.append({
-            'letter': cell.column_letter,
-            'df_column': df_column_name,
-        })
-        template_headers[template_header] = cell.column_letter
-        
-        if df_column_name:
-            used_df_columns.add(df_column_name)
-    
-    start_row = 2
-    max_rows = sheet.max_row
-    
-    if max_rows >= start_row:
-        sheet.delete_rows(start_row, max_rows - start_row + 1)
-        
-    if df_to_export.empty:
-        output_buffer = io.BytesIO()
-        workbook.save(output_buffer)
-        output_buffer.seek(0)
-        return output_buffer
-
-    required_df_cols = [col for col in df_column_map.keys() if col is not None]
-    df_final = df_to_export.reindex(columns=required_df_cols, fill_value='')
-
-    NUMBER_FORMAT = '0.00' 
-    
-    for row_idx, data_tuple in enumerate(df_final.itertuples(index=False), start=start_row):
-        for col_data in excel_template_structure:
-            excel_col_letter = col_data['letter']
-            df_col_name = col_data['df_column']
-            cell_value = None 
-
-            if df_col_name and df_col_name in df_final.columns:
-                try:
-                    col_position_in_tuple = df_final.columns.get_loc(df_col_name)
-                    value = data_tuple[col_position_in_tuple]
-                    
-                    if pd.isna(value) or value == '':
-                        cell_value = ''
-                    elif df_col_name in ["Fecha de Pedido", "Fecha de Precio", "Fecha de Factura"]:
-                        cell_value = str(value) 
-                    elif df_col_name in ["VARIACION DE PRECIO", "Monto NC Asignado"]:
-                        try:
-                            numeric_value = convert_value_to_float(value)
-                            if numeric_value is not None:
-                                cell_value = numeric_value
-                                sheet[f"{excel_col_letter}{row_idx}"].number_format = NUMBER_FORMAT 
-                            else:
-                                cell_value = str(value)
-                        except Exception:
-                             cell_value = str(value)
-                    else:
-                        cell_value = str(value)
-                except KeyError:
-                     cell_value = ''
-                except IndexError as ie:
-                     st.error(f"Error de índice al acceder a la tupla para la columna '{df_col_name}' en la fila {row_idx}: {ie}. Data tuple length: {len(data_tuple)}, requested index: {col_position_in_tuple}")
-                     cell_value = ''
-
-            if cell_value is not None:
-                sheet[f"{excel_col_letter}{row_idx}"] = cell_value
-            
-            if df_col_name in ["ASIGNACION", "TEXTO CABECERA", "Observación", "Solicitante", "Material", "Pedido Cliente"]:
-                 sheet[f"{excel_col_letter}{row_idx}"].alignment = Alignment(horizontal='left')
-            if df_col_name in ["Cantidad", "Peso %", "VARIACION DE PRECIO", "Monto NC Asignado"]:
-                sheet[f"{excel_col_letter}{row_idx}"].alignment = Alignment(horizontal='right')
-
-    cols_to_resize = [
-        "Clase de pedido", "Organizacion de Venta", "Canal de Distribucion", "Sector", "Solicitante", 
-        "Fecha de Pedido", "Fecha de Precio", "Fecha de Factura", "Material", "Pedido Cliente",
-        "Cantidad", "U. MEDIDA", "CONDICION", "VARIACION DE PRECIO", "ASIGNACION", "Peso %", 
-        "Monto NC Asignado"
-    ]
-    large_text_cols = {
-        "VARIACION DE PRECIO": 18,
-        "TEXTO CABECERA": 35,
-        "Pedido Cliente": 35,
-        "Observación": 25,
-        "Motivo": 8 
-    }
-    default_width = 15
-    
-    for col_name, col_letter in template_headers.items():
-        if col_name in large_text_cols:
-             sheet.column_dimensions[col_letter].width = large_text_cols[col_name]
-        elif col_name in cols_to_resize:
-            sheet.column_dimensions[col_letter].width = default_width
-    
-    output_buffer = io.BytesIO()
-    
+def load_simple_table(uploaded_file):
+    """Referencia (DatasetHandle) al extracto compartido entre sesiones, o None si no se pudo leer."""
     try:
-        workbook.save(output_buffer)
-        output_buffer.seek(0)
-    except Exception as e:
-        st.error(f"Error al guardar el archivo Excel: {e}")
+        return DATASETS.acquire(uploaded_file)
+    except IngestError as e:
+        st.error(f"Error al cargar el archivo. Asegúrese de que sea un Excel .xlsx, .xls o CSV: {e}")
         return None
-        
-    return output_buffer
 
-@st.cache_data
-def load_simple_table(uploaded_file):
-    try:
-        df = pd.read_excel(uploaded_file, dtype=str)
-    except Exception:
-        try:
-            uploaded_file.seek(0)
-            df = pd.read_csv(uploaded_file, sep=',', dtype=str)
-        except Exception:
-            try:
-                 uploaded_file.seek(0)
-                 df = pd.read_csv(uploaded_file, sep=';', dtype=str)
-            except Exception as e:
-                 st.error(f"Error al cargar el archivo. Asegúrese de que sea un Excel .xlsx, .xls o CSV: {e}")
-                 return None
-                 
-    df.columns = df.columns.str.strip()
-    df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-    return df
-
-def get_file_name(portfolio_cod, ticket, is_first=False, multiple_invoices=False):
-    global BASE_DIR
-    try:
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    except NameError:
-        BASE_DIR = os.getcwd()
-
-    PORTFOLIO_ACRONYM_MAP = {
-        '0700': 'APC',
-        'R100': 'PCV',
-        'C001': 'CYM',
-        '0600': 'EFE',
-        '--': 'SIN_PORTAFOLIO'
-    }
 
-    acronym = PORTFOLIO_ACRONYM_MAP.get(portfolio_cod, 'SIN_PORTAFOLIO')
-    if multiple_invoices:
-        return f"NC_Multiples_{acronym}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    elif ticket:
-        return f"TICKET#SR-{ticket}-{acronym}.xlsx"
-    else:
-        return f"TICKET_SIN_NUMERO-{acronym}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+def load_chunked_table(uploaded_file, client_codes, portfolio=None):
+    """Lectura por bloques: (líneas de los clientes, tabla por factura, stats) o (None, None, None)."""
+    try:
+        return read_table_chunked(uploaded_file, client_codes, portfolio)
+    except (IngestError, NCError) as e:
+        st.error(f"Error al cargar el archivo. Asegúrese de que sea un Excel .xlsx, .xls o CSV: {e}")
+        return None, None, None
 
 # --- FUNCIÓN DE LIMPIEZA ---
 def clear_form_data():
@@ -432,16 +68,6 @@ st.set_page_config(
     }
 ) 
 
-# --- CONFIGURACIÓN DE MAPEO DE MOTIVOS ---
-NCF_MAPPING = {
-    "Diferencia en Precio": "NCF.1",
-    "Descuento no Reflejado": "NCF.2",
-    "Promoción / Sell Out / Reconocimiento": "NCF.3",
-    "Grand Slam": "NCF.4",
-    "Avisos / Cabezales / Publicidad": "NCF.5",
-    "Anulación documento": "NCF.6"
-}
-
 st.markdown("""
     <style>
         header { visibility: hidden; }
@@ -533,21 +159,6 @@ try:
 except NameError:
     BASE_DIR = os.getcwd()
 
-PORTFOLIO_ACRONYM_MAP = {
-    '0700': 'APC',
-    'R100': 'PCV',
-    'C001': 'CYM',
-    '0600': 'EFE',
-    '--': 'SIN_PORTAFOLIO'
-}
-
-ALLOWED_INVOICE_CLASSES = {
-    '0700': ['ZSPN', 'X|', 'ZSCC'],
-    'R100': ['YP01', 'YP04', 'YP10'],
-    'C001': ['YC00'],
-    '0600': ['ZSPN', 'ZSCC'], 
-}
-
 LOGO_FILENAME_MAP = {
     '0700': 'Alimentos Polar (Completo).webp',
     'R100': 'Pepsi-Cola.webp',
@@ -574,6 +185,14 @@ if 'portafolio_cod' not in st.session_state:
     st.session_state['portafolio_cod'] = '--' 
 if 'stacked_invoices' not in st.session_state:
     st.session_state['stacked_invoices'] = []
+if 'invoice_ledger' not in st.session_state:
+    st.session_state['invoice_ledger'] = {}
+# Por portafolio: lo de los tickets apilados que no se pudieron guardar en el historial local
+if 'unrecorded_ledger' not in st.session_state:
+    st.session_state['unrecorded_ledger'] = {}
+
+# Plantillas en memoria (solo se vuelven a leer si cambia el archivo)
+TEMPLATES.preload()
 
 
 limpiar_button = False
@@ -592,20 +211,71 @@ with st.sidebar:
         short_name = full_name[:25] + "..." if len(full_name) > 25 else full_name
         st.info(f"📄 Archivo: {short_name}")
     
+    st.checkbox(
+        "Archivo grande (lectura por bloques)", key='modo_bloques',
+        help="Para extractos que no caben en memoria: solo se guardan las líneas de los clientes consultados "
+             "y el total por factura. Al cambiar de cliente o portafolio el archivo se vuelve a recorrer."
+    )
     analyze_button = st.button("Analizar y Cargar", disabled=(uploaded_file is None), use_container_width=True, type="primary")
 
     if analyze_button and uploaded_file:
         with st.spinner("Procesando archivo..."):
-            df_loaded = load_simple_table(uploaded_file)
+            previous_handle = st.session_state.pop('dataset_handle', None)
+            if previous_handle is not None:
+                previous_handle.release()
+            st.session_state['chunked_source'] = None
+            if st.session_state.get('modo_bloques'):
+                # Primera pasada sin clientes: solo la tabla por factura y el portafolio
+                df_loaded, chunked_invoices, load_stats = load_chunked_table(uploaded_file, [])
+                handle = None
+                if df_loaded is not None:
+                    chunked_digest = hash_file(uploaded_file)
+                    st.session_state['chunked_source'] = uploaded_file
+                    st.session_state['chunked_invoices'] = chunked_invoices
+                    st.session_state['chunked_key'] = (load_stats['portafolio'], ())
+                    st.session_state['chunked_digest'] = chunked_digest
+                    st.session_state['dataset_key'] = (chunked_digest, load_stats['portafolio'], ())
+            else:
+                handle = load_simple_table(uploaded_file)
+                df_loaded = handle.df if handle else None
+                load_stats = handle.stats if handle else None
+                st.session_state['dataset_key'] = handle.key if handle else None
+            st.session_state['dataset_handle'] = handle
             st.session_state.df_full = df_loaded
             st.session_state.file_name = uploaded_file.name
+            st.session_state['load_stats'] = load_stats
+            st.session_state['pipeline_cache'] = PipelineCache()
             
             if df_loaded is not None:
-                detected_code = detect_portfolio_code(df_loaded.copy())
+                if st.session_state['chunked_source'] is not None:
+                    detected_code = load_stats['portafolio']
+                else:
+                    detected_code = detect_portfolio_code(df_loaded)
                 st.session_state['portafolio_cod'] = detected_code
             
         st.rerun()
 
+    load_stats = st.session_state.get('load_stats')
+    if st.session_state.get('df_full') is not None and load_stats:
+        st.caption(
+            f"⏱️ {load_stats['filas']:,} filas en {load_stats['segundos']:.2f} s "
+            f"({load_stats['filas_por_seg']:,.0f} filas/s, {load_stats['motor']})".replace(",", ".")
+        )
+        if 'memoria_mb' in load_stats:
+            st.caption(
+                f"🧠 Memoria: {load_stats['memoria_texto_mb']:,.1f} MB como texto → "
+                f"{load_stats['memoria_mb']:,.1f} MB compactado"
+            )
+        if load_stats.get('sesiones', 1) > 1:
+            st.caption(f"👥 Extracto compartido con {load_stats['sesiones'] - 1} sesión(es) más")
+        if 'filas_leidas' in load_stats:
+            filas_leidas = f"{load_stats['filas_leidas']:,}".replace(",", ".")
+            facturas = f"{load_stats['facturas']:,}".replace(",", ".")
+            st.caption(
+                f"📦 Por bloques: {filas_leidas} filas leídas, {facturas} facturas; "
+                f"en memoria {load_stats['memoria_retenida_mb']:.1f} MB"
+            )
+
     if st.session_state.get('df_full') is not None:
         
         with st.form(key='parametros_nc_form'):
@@ -639,6 +309,8 @@ with st.sidebar:
                 
             st.text_input("N° de Ticket:", key="filtro_ticket_cod")
             
+            st.selectbox("Cobertura:", options=list(SOLVER_MODES.keys()), key="filtro_cobertura")
+            
             st.session_state['assignment_mode'] = 'Prorrateo (Recomendado)'
             
             submit_button = st.form_submit_button("Cargar", use_container_width=True)
@@ -702,46 +374,13 @@ with tab1:
         else:
             st.title("Notas de Crédito")
         
-        df = st.session_state.df_full.copy()
+        df = st.session_state.df_full
         df_para_mostrar = pd.DataFrame()
         monto_nc = st.session_state.get('filtro_monto')
         
-        condicion_forzada = None  
-        template_condicion = 'ZNOT'
-
-        PORTFOLIO_DEFAULTS = {
-            'R100': {
-                'Clase de pedido': 'YNCR', 
-                'Organizacion de Venta': 'R200', 
-                'Canal de Distribucion': 'FB', 
-                'Sector': 'E2',                
-                'CONDICION': 'YLIQ'            
-            },
-            'C001': {
-                'Clase de pedido': 'ZCDF', 
-                'Organizacion de Venta': 'C001', 
-                'Canal de Distribucion': 'FB', 
-                'Sector': 'E2',                
-                'CONDICION': 'ZXAM'            
-            },
-            '0700': {
-                'Clase de pedido': 'Z1MA', 
-                'Organizacion de Venta': '0702', 
-                'Canal de Distribucion': 'FB', 
-                'Sector': 'E2',
-                'CONDICION': 'ZNOT'
-            },
-            '0600': {
-                'Clase de pedido': 'Z1MA', 
-                'Organizacion de Venta': '0602', 
-                'Canal de Distribucion': 'FB', 
-                'Sector': 'E2',                
-                'CONDICION': 'ZNOT'
-            },
-        }
-
         selected_portfolio_cod = st.session_state.get('portafolio_cod')
         assignment_mode = st.session_state.get('assignment_mode') 
+        solver_mode = SOLVER_MODES.get(st.session_state.get('filtro_cobertura'), DEFAULT_SOLVER_MODE)
         ticket_number = st.session_state.get('filtro_ticket_cod', '').strip() 
 
         client_code_input_raw = st.session_state.get('filtro_cliente_cod', '').strip()
@@ -750,202 +389,108 @@ with tab1:
         product_code_input_raw = st.session_state.get('filtro_producto_cod', '').strip()
         product_code_list = clean_input_codes(product_code_input_raw) 
 
-        cliente_a_usar = None
-        
+        # Lectura por bloques: el archivo se recorre de nuevo con los clientes y el portafolio actuales
+        chunked_source = st.session_state.get('chunked_source')
+        chunked_key = (selected_portfolio_cod, codes_key(client_code_list))
+        if chunked_source is not None and st.session_state.get('chunked_key') != chunked_key:
+            same_portfolio = st.session_state['chunked_key'][0] == selected_portfolio_cod
+            known_clients = set(st.session_state['chunked_invoices']['cliente'].astype(str))
+            if same_portfolio and not known_clients.intersection(client_code_list):
+                # Ningún cliente aparece en la tabla por factura: no hace falta recorrer el archivo
+                df_chunk = df.iloc[:0]
+            else:
+                with st.spinner("Recorriendo el archivo por bloques..."):
+                    df_chunk, chunked_invoices, chunk_stats = load_chunked_table(chunked_source, client_code_list, selected_portfolio_cod)
+                if df_chunk is None:
+                    st.stop()
+                st.session_state['chunked_invoices'] = chunked_invoices
+                st.session_state['load_stats'] = chunk_stats
+            df = st.session_state.df_full = df_chunk
+            st.session_state['chunked_key'] = chunked_key
+            st.session_state['dataset_key'] = (st.session_state['chunked_digest'],) + chunked_key
+
         st.session_state['df_for_export_single_line'] = None
         df_para_mostrar_editor = pd.DataFrame() 
 
+        # Cada etapa se recalcula solo si cambian sus entradas (ver nc_engine.PipelineCache)
+        pipeline = st.session_state.get('pipeline_cache')
+        if pipeline is None:
+            pipeline = st.session_state['pipeline_cache'] = PipelineCache()
+        dataset_key = st.session_state.get('dataset_key') or id(df)
+        # Líneas e índice por portafolio se comparten con las demás sesiones del mismo extracto
+        dataset_handle = st.session_state.get('dataset_handle')
+        shared = dataset_handle.derived if dataset_handle is not None else (lambda key, compute: compute())
+
         try:
-            df_pre_filtros = df.copy()
-            
-            factura_keys = ['factura', 'nofactura', 'numerofactura', 'asignacion']
-            col_factura = next((c for c in df_pre_filtros.columns if any(k in str(c).lower().replace(" ", "").replace("°", "") for k in factura_keys)), None)
-
-            col_monto = next((c for c in df_pre_filtros.columns if 'precio' in str(c).lower() and 'total' not in str(c).lower()), None)
-            if col_monto is None:
-                 col_monto = next((c for c in df_pre_filtros.columns if any(k in str(c).lower() for k in ['precio', 'neto', 'valor', 'monto']) and 'total' not in str(c).lower()), None)
-            if col_monto is None:
-                 col_monto = next((c for c in df_pre_filtros.columns if any(k in str(c).lower() for k in ['total'])), None)
-            
-            cliente_keys = ['cliente', 'codcliente', 'solicitante']
-            col_cliente = next((c for c in df_pre_filtros.columns if any(k in str(c).lower() for k in cliente_keys)), None)
-            
-            producto_keys = ['producto', 'material', 'codigoproducto'] 
-            col_producto = next((c for c in df_pre_filtros.columns if any(k in str(c).lower() for k in producto_keys)), None)
-            
-            unidad_medida_keys = ['u.m venta', 'um venta', 'unidad venta', 'u. medida', 'umedida', 'um'] 
-            col_unidad_medida = next((c for c in df_pre_filtros.columns if any(k in str(c).lower() for k in unidad_medida_keys)), None)
-            
-            condicion_keys = ['condicion', 'codigocondicion', 'cond']
-            col_condicion = next((c for c in df_pre_filtros.columns if any(k in str(c).lower() for k in condicion_keys)), None)
-            
-            clase_factura_keys = ['clase de factura', 'clasefactura', 'clase_factura', 'clase.factura', 'cl.f'] 
-            col_clase_factura = next((c for c in df.columns if any(k in str(c).lower().replace(' ', '') for k in clase_factura_keys)), None)
+            columns = pipeline.get('columns', dataset_key, lambda: detect_columns(df.columns))
+            lines_key = (dataset_key, selected_portfolio_cod)
+            df_lines, columns, warnings = pipeline.get('lines', lines_key, lambda: shared(('lines', selected_portfolio_cod), lambda: prepare_lines(df, selected_portfolio_cod, columns)))
+            for warning in warnings:
+                st.warning(warning)
+            col_factura = columns['factura']
+
+            # Índice cliente/producto: se construye una vez por archivo y portafolio
+            invoice_index = pipeline.get('index', lines_key, lambda: shared(('index', selected_portfolio_cod), lambda: build_index(df_lines, selected_portfolio_cod, columns)))
+
+            session_ledger = st.session_state['invoice_ledger']
+            if st.session_state['stacked_invoices'] and not session_ledger:
+                session_ledger = build_ledger(st.session_state['stacked_invoices'], col_factura)
+                st.session_state['invoice_ledger'] = session_ledger
+
+            # Lo acreditado en el historial local del portafolio (días anteriores, otras
+            # sesiones, esta sesión) descuenta saldo; solo se recalcula cuando hay notas
+            # nuevas. Si no se puede leer, se descuenta solo lo apilado en la sesión.
+            try:
+                consumed, history_version = CREDITS.consumed_amounts(selected_portfolio_cod)
+                pending_ledger = st.session_state['unrecorded_ledger'].get(selected_portfolio_cod, {})
+            except Exception as e:
+                consumed, history_version = None, None
+                pending_ledger = session_ledger
+                st.warning(f"No se pudo leer el historial local de notas de crédito: {e}")
+            available_key = lines_key + (history_version, ledger_key(pending_ledger))
+            used_amount_map = pipeline.get('history', available_key, lambda: history_ledger(
+                consumed, invoice_index.invoice_totals().index.astype(str).str.strip(), pending_ledger))
+            df_pre_filtros = pipeline.get('available', available_key, lambda: available_lines(df_lines, columns, invoice_index, used_amount_map))
 
-            if not col_cliente or not col_factura or not col_monto:
-                st.error("Error: Revise los encabezados de su archivo.")
-                st.stop()
-                
-            if not col_producto:
-                 col_producto = 'Material_Dummy'
-                 df_pre_filtros[col_producto] = ''
-            
-            if col_producto in df_pre_filtros.columns:
-                df_pre_filtros[col_producto] = df_pre_filtros[col_producto].astype(str).apply(clean_leading_zeros)
-
-            if selected_portfolio_cod != '--':
-                 allowed_classes = ALLOWED_INVOICE_CLASSES.get(selected_portfolio_cod, [])
-                 if allowed_classes:
-                    if col_clase_factura is None:
-                        st.warning(f"Advertencia: No se encontró la columna 'Clase de Factura'.")
-                    elif col_clase_factura in df_pre_filtros.columns:
-                        df_pre_filtros[col_clase_factura] = df_pre_filtros[col_clase_factura].astype(str).str.strip().str.upper()
-                        df_pre_filtros = df_pre_filtros[df_pre_filtros[col_clase_factura].isin(allowed_classes)].copy()
-            
-            if col_factura:
-                all_invoices_list = df_pre_filtros[col_factura].astype(str).fillna('').str.strip().unique().tolist()
-                norm_to_originals = {}
-                for orig in all_invoices_list:
-                    digits = re.sub(r'\D', '', orig)
-                    norm = clean_leading_zeros(digits)
-                    if norm: norm_to_originals.setdefault(norm, set()).add(orig)
-                    else: norm_to_originals.setdefault(orig.strip(), set()).add(orig)
-
-                used_amount_map = {}
-                if st.session_state['stacked_invoices']:
-                    for batch_df in st.session_state['stacked_invoices']:
-                        inv_col_name = 'ASIGNACION' if 'ASIGNACION' in batch_df.columns else col_factura
-                        amount_col_name = 'Monto NC Asignado'
-                        if inv_col_name in batch_df.columns and amount_col_name in batch_df.columns:
-                            for idx, row in batch_df.iterrows():
-                                inv_id = str(row[inv_col_name]).strip()
-                                val = convert_value_to_float(row[amount_col_name])
-                                if val: used_amount_map[inv_id] = used_amount_map.get(inv_id, 0.0) + val
-
-                if used_amount_map:
-                    df_pre_filtros['__monto_numeric__'] = df_pre_filtros[col_monto].apply(convert_value_to_float)
-                    def reduce_balance(group):
-                        inv_id = str(group.name).strip() 
-                        if inv_id in used_amount_map:
-                            total_used = used_amount_map[inv_id]
-                            for idx in group.index:
-                                if total_used <= 0.01: break
-                                current_val = group.at[idx, '__monto_numeric__']
-                                if pd.isna(current_val): continue
-                                if current_val > total_used:
-                                    group.at[idx, '__monto_numeric__'] = current_val - total_used
-                                    total_used = 0
-                                else:
-                                    group.at[idx, '__monto_numeric__'] = 0
-                                    total_used -= current_val
-                        return group
-                    df_pre_filtros = df_pre_filtros.groupby(col_factura, group_keys=False).apply(reduce_balance)
-                    df_pre_filtros = df_pre_filtros[df_pre_filtros['__monto_numeric__'] > 0.01].copy()
-                    df_pre_filtros[col_monto] = df_pre_filtros['__monto_numeric__'].apply(format_monto_local)
-                
-                referenced_originals = set()
-                for idx, row in df_pre_filtros.iterrows():
-                    row_invoice = str(row.get(col_factura, '')).strip()
-                    for col_name in df_pre_filtros.columns:
-                        cell_content = str(row[col_name]).strip()
-                        if not cell_content: continue
-                        for num_in_cell in re.findall(r'\d{7,}', cell_content):
-                            norm_num = clean_leading_zeros(num_in_cell)
-                            if norm_num in norm_to_originals:
-                                for original_invoice in norm_to_originals[norm_num]:
-                                    if str(original_invoice).strip() != row_invoice: referenced_originals.add(original_invoice)
-                if referenced_originals:
-                    df_pre_filtros = df_pre_filtros[~df_pre_filtros[col_factura].astype(str).str.strip().isin(referenced_originals)].copy()
-
-            df_temp_validation = df_pre_filtros.copy()
-            if client_code_list and col_cliente and col_cliente in df_temp_validation.columns:
-                df_temp_validation[col_cliente] = df_temp_validation[col_cliente].astype(str)
-                if not df_temp_validation[col_cliente].isin(client_code_list).any():
-                    st.error(f"Error: Códigos de Cliente no encontrados.")
-                    st.stop()
-            
+            check_clients(df_pre_filtros, columns, invoice_index, client_code_list)
+
+            request_key = available_key + (codes_key(client_code_list), codes_key(product_code_list))
             if monto_nc is not None and monto_nc > 0:
-                if not client_code_list:
-                    st.error(" **ERROR:** Debe ingresar al menos un **Código de Cliente**.")
-                    st.stop()
-                
-                df_temp_all_lines = df_pre_filtros.copy()
-                if client_code_list:
-                    df_temp_all_lines = df_temp_all_lines[df_temp_all_lines[col_cliente].isin(client_code_list)].copy()
-                
-                df_temp_for_coverage = df_temp_all_lines.copy()
-                if product_code_list:
-                    df_temp_for_coverage = df_temp_for_coverage[df_temp_for_coverage[col_producto].astype(str).isin(product_code_list)].copy()
-                
-                df_temp_for_coverage['__monto_numeric__'] = df_temp_for_coverage[col_monto].apply(convert_value_to_float)
-                df_temp_for_coverage.dropna(subset=['__monto_numeric__'], inplace=True)
-                
-                if df_temp_for_coverage.empty:
-                     st.info("No hay facturas que coincidan.")
-                else:
+                result_key = ('coverage', request_key, monto_nc, assignment_mode, solver_mode)
+                try:
                     with st.spinner("Calculando..."):
-                        chosen_invoices_df, cliente_a_usar, monto_cubierto = find_invoices_by_total_sum(df_temp_for_coverage, monto_nc, col_factura, col_monto, col_cliente, col_producto, assignment_mode)
-                    
-                    if chosen_invoices_df is None:
-                        st.error(f"Error de Cobertura: {format_monto_local(monto_cubierto)}")
-                    elif not chosen_invoices_df.empty:
-                        df_para_mostrar_editor = chosen_invoices_df.copy()
-                        df_para_mostrar_editor['Monto Filas Selecc.'] = df_para_mostrar_editor['total_sum']
-                        total_available_sum = df_para_mostrar_editor['Monto Filas Selecc.'].sum()
-                        
-                        if total_available_sum > 0:
-                            if assignment_mode == 'Prorrateo (Recomendado)':
-                                prorate_factor = monto_nc / monto_cubierto if monto_cubierto != 0 else 0
-                                df_para_mostrar_editor['Monto NC Asignado'] = (df_para_mostrar_editor['total_sum'] * prorate_factor).round(2)
-                                diff = monto_nc - df_para_mostrar_editor['Monto NC Asignado'].sum()
-                                if not np.isclose(diff, 0): df_para_mostrar_editor.loc[df_para_mostrar_editor.index[-1], 'Monto NC Asignado'] += diff
-                            
-                            df_para_mostrar_editor[col_cliente] = cliente_a_usar 
-                            df_para_mostrar_editor['Peso %'] = df_para_mostrar_editor['Monto NC Asignado'] / monto_nc * 100.0 if monto_nc != 0 else 0.0
-                            df_para_mostrar_editor['Cantidad'] = '1'
-                            df_para_mostrar_editor['VARIACION DE PRECIO'] = df_para_mostrar_editor['Monto NC Asignado']
-                            df_para_mostrar_editor['CONDICION'] = template_condicion
-                            df_para_mostrar_editor['U. MEDIDA'] = 'UN'
-                            st.session_state['df_for_export_single_line'] = df_para_mostrar_editor.copy() 
+                        ticket_df = pipeline.get('coverage', result_key, lambda: cover_amount(df_pre_filtros, columns, invoice_index, client_code_list, product_code_list, monto_nc, assignment_mode, solver_mode))
+                except CoverageError as e:
+                    st.error(str(e))
+                else:
+                    if ticket_df is None:
+                        st.info("No hay facturas que coincidan.")
+                    elif not ticket_df.empty:
+                        df_para_mostrar_editor = ticket_df
+                        st.session_state['df_for_export_single_line'] = ticket_df
             else: 
-                df_filtrado = df_pre_filtros.copy()
-                if client_code_list: df_filtrado = df_filtrado[df_filtrado[col_cliente].isin(client_code_list)].copy()
-                if product_code_list: df_filtrado = df_filtrado[df_filtrado[col_producto].astype(str).isin(product_code_list)].copy()
-                if not df_filtrado.empty:
-                    df_para_mostrar = df_filtrado.drop_duplicates(subset=[col_factura]).copy()
-                    df_para_mostrar['CONDICION'] = template_condicion
-                    df_all_client_invoices = df_pre_filtros.copy()
-                    if client_code_list: df_all_client_invoices = df_all_client_invoices[df_all_client_invoices[col_cliente].isin(client_code_list)].copy()
-                    df_all_client_invoices['__monto_numeric__'] = df_all_client_invoices[col_monto].apply(convert_value_to_float)
-                    invoice_sums_dict = df_all_client_invoices.groupby(col_factura)['__monto_numeric__'].sum().to_dict()
-                    df_para_mostrar['Monto Filas Selecc.'] = df_para_mostrar[col_factura].map(invoice_sums_dict)
-                    df_para_mostrar_editor = df_para_mostrar.copy()
+                result_key = ('browse', request_key)
+                df_para_mostrar_editor = pipeline.get('browse', result_key, lambda: browse_invoices(df_pre_filtros, columns, invoice_index, client_code_list, product_code_list, bool(used_amount_map)))
 
+        except NCError as e:
+            st.error(str(e))
+            st.stop()
         except Exception as e:
             st.error(f"Ocurrió un error: {e}")
 
         if not df_para_mostrar_editor.empty:
-            df_para_mostrar_editor = df_para_mostrar_editor.rename(columns={
-                col_factura: 'ASIGNACION', col_cliente: 'Solicitante', col_producto: 'Material'
-            }, errors='ignore')
-            df_para_mostrar_editor['Observación'] = ''
-            df_para_mostrar_editor['Motivo'] = 'R02'
-            curr_date = datetime.now().date().strftime('%d/%m/%Y')
-            for col in ["Fecha de Pedido", "Fecha de Precio", "Fecha de Factura"]: df_para_mostrar_editor[col] = curr_date
             sel_motivo = st.session_state.get('filtro_motivo')
-            ncf_code = NCF_MAPPING.get(sel_motivo, "NCF.1") 
-            texto_cabecera = f"{ncf_code} {sel_motivo}"
-            if ticket_number: texto_cabecera += f" (Ticket {ticket_number})"
-            df_para_mostrar_editor['TEXTO CABECERA'] = texto_cabecera
-            df_para_mostrar_editor['Pedido Cliente'] = texto_cabecera 
-            
-            sel_defaults = PORTFOLIO_DEFAULTS.get(selected_portfolio_cod)
-            if sel_defaults: df_para_mostrar_editor = df_para_mostrar_editor.assign(**sel_defaults)
+            today = datetime.now().date()
+            source_df = df_para_mostrar_editor
+            df_para_mostrar_editor = pipeline.get(
+                'enrich', (result_key, selected_portfolio_cod, sel_motivo, ticket_number, today),
+                lambda: enrich_ticket(source_df, columns, selected_portfolio_cod, sel_motivo, ticket_number, today),
+            )
                 
             df_display_editor = df_para_mostrar_editor.copy()
             for col_name in ['Monto Filas Selecc.', 'Monto NC Asignado']:
                 if col_name in df_display_editor.columns:
-                    df_display_editor[col_name] = df_display_editor[col_name].apply(convert_value_to_float).apply(format_monto_local)
+                    df_display_editor[col_name] = convert_series_to_float(df_display_editor[col_name]).apply(format_monto_local)
             
             # --- MANTENIENDO TU LÓGICA DE VISUALIZACIÓN ORIGINAL ---
             df_display_editor_renamed = df_display_editor.rename(columns={
@@ -963,7 +508,88 @@ with tab1:
             st.dataframe(df_display_editor_filtered, column_config=col_config_dict, hide_index=True, use_container_width=True)
             
             if st.button("Añadir Ticket", use_container_width=True):
-                st.session_state['stacked_invoices'].append(df_para_mostrar_editor.copy())
+                st.session_state['stacked_invoices'].append(tag_ticket(df_para_mostrar_editor, ticket_number, selected_portfolio_cod))
+                add_ticket_to_ledger(st.session_state['invoice_ledger'], df_para_mostrar_editor)
+                # Historial local (historial_creditos.db): una transacción por ticket
+                try:
+                    CREDITS.add_ticket(df_para_mostrar_editor, ticket_number, selected_portfolio_cod, sel_motivo, st.session_state.get('file_name'))
+                except Exception as e:
+                    add_ticket_to_ledger(st.session_state['unrecorded_ledger'].setdefault(selected_portfolio_cod, {}), df_para_mostrar_editor)
+                    st.warning(f"No se pudo registrar el ticket en el historial local: {e}")
+                st.session_state.pop('bulk_zip', None)
                 st.success("Ticket añadido.")
                 st.rerun()
 
+        # --- EXPORTACIÓN MASIVA DE TICKETS APILADOS ---
+        stacked_count = len(st.session_state['stacked_invoices'])
+        if stacked_count:
+            st.markdown("---")
+            if st.button(f"Generar ZIP con los {stacked_count} tickets apilados", use_container_width=True):
+                with st.spinner("Generando archivos Excel..."):
+                    zip_buffer, generated, export_errors = export_tickets_zip(
+                        st.session_state['stacked_invoices'],
+                        lambda portfolio, ticket: get_file_name(portfolio, ticket),
+                    )
+                for ticket, portfolio, message in export_errors:
+                    st.error(f"Ticket {ticket or 'sin número'} ({portfolio}): {message}")
+                st.session_state['bulk_zip'] = zip_buffer.getvalue()
+                st.session_state['bulk_zip_count'] = generated
+            if st.session_state.get('bulk_zip'):
+                st.download_button(
+                    f"Descargar ZIP ({st.session_state.get('bulk_zip_count', 0)} archivos)",
+                    data=st.session_state['bulk_zip'],
+                    file_name=f"NC_Tickets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                    mime="application/zip",
+                    use_container_width=True,
+                )
+
+# --- TICKETS GENERADOS (RESUMEN DEL HISTORIAL LOCAL) ---
+# Se leen los totales precalculados de credit_store (resumen_tickets): unas pocas
+# filas por dimensión, sin agrupar el historial completo en cada rerun.
+DASHBOARD_DAYS = 60
+DASHBOARD_TOP_CLIENTS = 50
+
+def rollup_table(frame, key_label, key_format=None):
+    table = frame.rename(columns={'clave': key_label, 'tickets': 'Tickets', 'lineas': 'Líneas', 'monto': 'Monto'})
+    if key_format:
+        table[key_label] = table[key_label].map(key_format)
+    table['Monto'] = table['Monto'].apply(format_monto_local)
+    return table
+
+with tab2:
+    st.title("Tickets Generados")
+    try:
+        by_portfolio = CREDITS.rollup('portafolio')
+        by_motivo = CREDITS.rollup('motivo')
+        by_client = CREDITS.rollup('cliente')
+        by_day = CREDITS.rollup('dia')
+    except Exception as e:
+        st.warning(f"No se pudo leer el historial local de notas de crédito: {e}")
+        by_portfolio = pd.DataFrame()
+
+    if by_portfolio.empty:
+        st.info("Todavía no hay tickets registrados en el historial local.")
+    else:
+        col_tickets, col_lines, col_amount = st.columns(3)
+        col_tickets.metric("Tickets", f"{int(by_portfolio['tickets'].sum()):,}".replace(",", "."))
+        col_lines.metric("Líneas", f"{int(by_portfolio['lineas'].sum()):,}".replace(",", "."))
+        col_amount.metric("Monto total", format_monto_local(by_portfolio['monto'].sum()))
+
+        col_portfolio, col_motivo = st.columns(2)
+        with col_portfolio:
+            st.subheader("Por portafolio")
+            st.dataframe(rollup_table(by_portfolio, 'Portafolio', lambda p: f"{p} ({PORTFOLIO_ACRONYM_MAP[p]})" if p in PORTFOLIO_ACRONYM_MAP else (p or '--')),
+                         hide_index=True, use_container_width=True)
+        with col_motivo:
+            st.subheader("Por motivo")
+            st.dataframe(rollup_table(by_motivo, 'Motivo', lambda m: f"{NCF_MAPPING.get(m, 'NCF.1')} {m}" if m else "Sin Motivo"),
+                         hide_index=True, use_container_width=True)
+
+        st.subheader(f"Por día (últimos {DASHBOARD_DAYS})")
+        recent_days = by_day.sort_values('clave').tail(DASHBOARD_DAYS)
+        st.bar_chart(recent_days.set_index('clave')['monto'].rename('Monto'))
+
+        st.subheader(f"Clientes con mayor monto (top {DASHBOARD_TOP_CLIENTS})")
+        # Las notas anteriores a los tickets no tienen código de cliente (clave vacía)
+        by_client = by_client[by_client['clave'] != '']
+        st.dataframe(rollup_table(by_client.head(DASHBOARD_TOP_CLIENTS), 'Cod. Cliente'), hide_index=True, use_container_width=True)
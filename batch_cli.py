@@ -0,0 +1,243 @@
+"""
+Procesamiento por lotes sin Streamlit: un extracto SAP y un CSV de solicitudes
+(clientes, productos, monto, motivo, ticket) -> un Excel de NC por solicitud.
+
+Uso:
+    python batch_cli.py extracto.xlsx solicitudes.csv --salida notas/ [--portafolio 0700]
+                        [--procesos 4] [--cobertura greedy] [--acumular] [--bloques]
+
+Con --acumular las solicitudes se procesan en orden y cada una descuenta lo ya
+asignado por las anteriores (como los tickets apilados en la app); sin esa opción
+son independientes y se reparten entre varios procesos. Con --bloques el extracto
+se recorre por bloques y solo se guardan las líneas de los clientes del lote
+(para extractos que no caben en memoria).
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from amounts import convert_value_to_float
+from coverage import DEFAULT_SOLVER_MODE, SOLVER_MODES
+from excel_export import ExportError, create_excel_for_all_invoices
+from chunked_ingest import read_table_chunked
+from ingest import IngestError, sniff_delimiter
+from ledger import add_ticket_to_ledger
+from nc_engine import (NCF_MAPPING, NCError, clean_input_codes, detect_portfolio_code, get_file_name,
+                       detect_columns, prepare_lines, build_index, available_lines, check_clients,
+                       cover_amount, enrich_ticket)
+from parse_cache import read_table_cached
+
+REQUEST_COLUMNS = {
+    'clientes': ['clientes', 'cliente', 'cod cliente', 'solicitante'],
+    'productos': ['productos', 'producto', 'cod producto', 'material'],
+    'monto': ['monto', 'monto nc', 'importe'],
+    'motivo': ['motivo'],
+    'ticket': ['ticket', 'n° de ticket', 'nro ticket'],
+}
+DEFAULT_MOTIVO = next(iter(NCF_MAPPING))
+# Cada proceso recibe su copia del extracto preparado: más procesos, más memoria
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# Contexto de cada proceso: extracto preparado e índice, cargado una vez en el proceso principal
+_context = None
+
+
+def load_context(extract_path, portfolio=None, client_codes=None):
+    """Extracto preparado e índice; con client_codes se lee por bloques y solo con esos clientes."""
+    if client_codes is None:
+        df, _ = read_table_cached(extract_path)
+        portfolio = portfolio or detect_portfolio_code(df)
+    else:
+        df, _, stats = read_table_chunked(extract_path, client_codes, portfolio)
+        portfolio = stats['portafolio']
+    columns = detect_columns(df.columns)
+    df_lines, columns, warnings = prepare_lines(df, portfolio, columns)
+    invoice_index = build_index(df_lines, portfolio, columns)
+    return {
+        'portfolio': portfolio,
+        'columns': columns,
+        'lines': df_lines,
+        'index': invoice_index,
+        'warnings': warnings,
+    }
+
+
+def read_requests(path):
+    """Solicitudes del CSV como lista de dict con las claves de REQUEST_COLUMNS."""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    for encoding in ('utf-8-sig', 'cp1252'):
+        try:
+            text = raw.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    df = pd.read_csv(io.StringIO(text), sep=sniff_delimiter(text[:65536]), dtype=str, keep_default_na=False)
+
+    normalized = {str(c).strip().lower(): c for c in df.columns}
+    rename = {}
+    for key, aliases in REQUEST_COLUMNS.items():
+        source = next((normalized[a] for a in aliases if a in normalized), None)
+        if source is not None:
+            rename[source] = key
+    df = df.rename(columns=rename)
+    if 'clientes' not in df.columns or 'monto' not in df.columns:
+        raise ValueError("El CSV de solicitudes debe tener al menos las columnas 'clientes' y 'monto'.")
+    for key in REQUEST_COLUMNS:
+        if key not in df.columns:
+            df[key] = ''
+    return df[list(REQUEST_COLUMNS)].to_dict('records')
+
+
+def build_ticket(context, request, solver_mode, ledger=None):
+    """DataFrame del ticket para una solicitud (NCError si no se puede generar)."""
+    monto_nc = convert_value_to_float(request['monto'])
+    if monto_nc is None or monto_nc <= 0:
+        raise NCError(f"Monto inválido: '{request['monto']}'")
+    client_codes = clean_input_codes(request['clientes'])
+    product_codes = clean_input_codes(request['productos'])
+    columns, invoice_index = context['columns'], context['index']
+
+    df_available = available_lines(context['lines'], columns, invoice_index, ledger)
+    check_clients(df_available, columns, invoice_index, client_codes)
+    ticket_df = cover_amount(df_available, columns, invoice_index, client_codes, product_codes, monto_nc, solver_mode=solver_mode)
+    if ticket_df is None or ticket_df.empty:
+        raise NCError("No hay facturas que coincidan.")
+    return enrich_ticket(ticket_df, columns, context['portfolio'], request['motivo'] or DEFAULT_MOTIVO, request['ticket'].strip())
+
+
+def output_names(requests, portfolio):
+    """Nombre de archivo de cada solicitud; sin ticket o con ticket repetido se agrega la fila."""
+    counts = Counter(r['ticket'].strip() for r in requests)
+    names = []
+    for position, request in enumerate(requests, start=1):
+        ticket = request['ticket'].strip()
+        name = get_file_name(portfolio, ticket)
+        if not ticket or counts[ticket] > 1:
+            name = name.replace('.xlsx', f"_{position}.xlsx")
+        names.append(name)
+    return names
+
+
+def write_ticket(context, ticket_df, path):
+    buffer = create_excel_for_all_invoices(ticket_df, context['portfolio'])
+    with open(path, 'wb') as f:
+        f.write(buffer.getvalue())
+    return path
+
+
+def _process(context, position, request, solver_mode, path, ledger=None):
+    try:
+        ticket_df = build_ticket(context, request, solver_mode, ledger)
+        write_ticket(context, ticket_df, path)
+        return position, 'ok', path, ticket_df
+    except (NCError, ExportError) as e:
+        return position, 'error', str(e).replace('*', '').strip(), None
+    except Exception as e:
+        return position, 'error', f"Ocurrió un error: {e}", None
+
+
+def _init_worker(context):
+    # El extracto ya se leyó y preparó en el proceso principal: cada proceso solo
+    # recibe el resultado, no vuelve a leer el archivo
+    global _context
+    _context = context
+
+
+def _process_in_worker(job):
+    position, request, solver_mode, path = job
+    position, status, detail, _ = _process(_context, position, request, solver_mode, path)
+    return position, status, detail
+
+
+def run_batch(extract_path, requests_path, output_dir, portfolio=None, workers=1, solver_mode=DEFAULT_SOLVER_MODE,
+              accumulate=False, chunked=False):
+    """
+    Procesa todas las solicitudes. Devuelve (resultados por fila, solicitudes,
+    contexto, tiempos) con tiempos = {'carga': s, 'solicitudes': s}.
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    requests = read_requests(requests_path)
+    client_codes = None
+    if chunked:
+        client_codes = sorted({code for request in requests for code in clean_input_codes(request['clientes'])})
+    context = load_context(extract_path, portfolio, client_codes)
+    paths = [os.path.join(output_dir, name) for name in output_names(requests, context['portfolio'])]
+    loaded = time.perf_counter()
+    results = []
+
+    if accumulate or workers <= 1 or len(requests) < 2:
+        ledger = {} if accumulate else None
+        for position, (request, path) in enumerate(zip(requests, paths), start=1):
+            position, status, detail, ticket_df = _process(context, position, request, solver_mode, path, ledger)
+            if accumulate and ticket_df is not None:
+                add_ticket_to_ledger(ledger, ticket_df)
+            results.append((position, status, detail))
+    else:
+        jobs = [(position, request, solver_mode, path) for position, (request, path) in enumerate(zip(requests, paths), start=1)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(context,)) as pool:
+            results = list(pool.map(_process_in_worker, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+    timings = {'carga': loaded - start, 'solicitudes': time.perf_counter() - loaded}
+    return results, requests, context, timings
+
+
+def write_summary(results, requests, output_dir):
+    path = os.path.join(output_dir, 'resumen_lote.csv')
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['fila', 'ticket', 'clientes', 'monto', 'estado', 'detalle'])
+        for (position, status, detail), request in zip(results, requests):
+            writer.writerow([position, request['ticket'], request['clientes'], request['monto'], status, detail])
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera las notas de crédito de un lote de solicitudes sin abrir la app.")
+    parser.add_argument('extracto', help="Extracto SAP (.xlsx, .xls o .csv)")
+    parser.add_argument('solicitudes', help="CSV con columnas clientes, productos, monto, motivo, ticket")
+    parser.add_argument('--salida', default='notas_generadas', help="Carpeta de salida (por defecto: notas_generadas)")
+    parser.add_argument('--portafolio', default=None, help="Código de portafolio (0700, R100, C001, 0600); por defecto se detecta")
+    parser.add_argument('--procesos', type=int, default=DEFAULT_WORKERS, help=f"Procesos en paralelo (por defecto: {DEFAULT_WORKERS})")
+    parser.add_argument('--cobertura', default=DEFAULT_SOLVER_MODE, choices=sorted(set(SOLVER_MODES.values())), help="Modo de cobertura")
+    parser.add_argument('--acumular', action='store_true', help="Cada solicitud descuenta lo asignado por las anteriores (en serie)")
+    parser.add_argument('--bloques', action='store_true', help="Lee el extracto por bloques y guarda solo los clientes del lote")
+    args = parser.parse_args(argv)
+
+    try:
+        results, requests, context, timings = run_batch(
+            args.extracto, args.solicitudes, args.salida, args.portafolio,
+            workers=args.procesos, solver_mode=args.cobertura, accumulate=args.acumular, chunked=args.bloques,
+        )
+    except (IngestError, NCError, ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    for warning in context['warnings']:
+        print(warning, file=sys.stderr)
+    summary_path = write_summary(results, requests, args.salida)
+
+    ok = sum(1 for _, status, _ in results if status == 'ok')
+    for position, status, detail in results:
+        if status != 'ok':
+            print(f"  fila {position}: {detail}", file=sys.stderr)
+    elapsed = timings['solicitudes']
+    rate = len(results) / elapsed if elapsed > 0 else float(len(results))
+    print(
+        f"Portafolio {context['portfolio']}: {ok}/{len(results)} notas generadas. "
+        f"Carga del extracto {timings['carga']:.2f} s, solicitudes {elapsed:.2f} s "
+        f"({rate:,.1f} solicitudes/s). Resumen: {summary_path}"
+    )
+    return 0 if ok == len(results) else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+# Compara convert_value_to_float (Series.apply) con convert_series_to_float.
+# Uso: python benchmarks/bench_amounts.py [n_celdas]
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from amounts import convert_value_to_float, convert_series_to_float
+
+
+def build_sample(n, distinct):
+    rng = np.random.default_rng(42)
+    montos = rng.uniform(0, 100000, distinct)
+    formatos = [
+        lambda m: f"{m:,.2f}".replace(",", "_").replace(".", ",").replace("_", "."),
+        lambda m: f"$ {m:.1f}".replace(".", ","),
+        lambda m: f"{m:.0f}.",
+        lambda m: f"{m:.2f}",
+        lambda m: "N/D",
+    ]
+    pool = [formatos[i % len(formatos)](m) for i, m in enumerate(montos)]
+    return pd.Series(rng.choice(np.array(pool, dtype=object), n), dtype=object)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    for distinct in (1_000, n):
+        serie = build_sample(n, distinct)
+        esperado, t_apply = timed(lambda: serie.apply(convert_value_to_float).astype('float64'))
+        obtenido, t_vector = timed(lambda: convert_series_to_float(serie))
+        iguales = np.array_equal(esperado.to_numpy(), obtenido.to_numpy(), equal_nan=True)
+        print(
+            f"{n:,} celdas, {distinct:,} valores distintos: apply {t_apply:.2f} s | "
+            f"vectorizado {t_vector:.2f} s | x{t_apply / t_vector:.1f} | paridad: {'OK' if iguales else 'ERROR'}"
+        )
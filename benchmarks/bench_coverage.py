@@ -0,0 +1,38 @@
+# Compara los modos de cobertura de coverage.select_invoices con 100, 1.000 y 10.000 facturas.
+# Uso: python benchmarks/bench_coverage.py
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coverage import SOLVER_MODES, select_invoices
+
+
+def build_totals(n, rng):
+    # Montos por factura con cola larga, como en los extractos SAP
+    return np.round(rng.lognormal(mean=7, sigma=1.2, size=n), 2)
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(7)
+    for n in (100, 1_000, 10_000):
+        totals = build_totals(n, rng)
+        # Objetivos por encima de la factura más grande para forzar combinaciones
+        targets = [round(float(totals.max() * f), 2) for f in (1.3, 2.7, 5.1)]
+        for label, mode in SOLVER_MODES.items():
+            elapsed = 0.0
+            overshoots = []
+            counts = []
+            for target in targets:
+                start = time.perf_counter()
+                chosen = select_invoices(totals, target, mode)
+                elapsed += time.perf_counter() - start
+                overshoots.append(totals[chosen].sum() - target)
+                counts.append(len(chosen))
+            print(
+                f"{n:>6,} facturas | {label:<24} | {elapsed / len(targets) * 1000:8.1f} ms | "
+                f"excedente medio {np.mean(overshoots):12,.2f} | facturas medias {np.mean(counts):5.1f}"
+            )
@@ -0,0 +1,38 @@
+# Compara el modo clásico y el modo rápido de excel_export.create_excel_for_all_invoices con 10.000 líneas.
+# Uso: python benchmarks/bench_excel.py
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from excel_export import create_excel_for_all_invoices
+from template_registry import DF_COLUMN_MAP, PORTFOLIO_TEMPLATE_MAP
+
+
+def build_lines(n, rng):
+    df = pd.DataFrame({col: [f"{col[:4].upper()}{i % 97}" for i in range(n)] for col in DF_COLUMN_MAP})
+    df['Fecha de Factura'] = '2024-05-17'
+    df['Cantidad'] = rng.integers(1, 50, n).astype(str)
+    df['VARIACION DE PRECIO'] = [f"{v:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.') for v in rng.uniform(1, 5_000, n)]
+    df['Monto NC Asignado'] = np.round(rng.uniform(1, 5_000, n), 2)
+    df['Peso %'] = np.round(rng.uniform(0, 100, n), 2)
+    return df
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(7)
+    lines = build_lines(10_000, rng)
+    for portfolio in PORTFOLIO_TEMPLATE_MAP:
+        timings = {}
+        for label, fast in (('clásico', False), ('rápido', True)):
+            start = time.perf_counter()
+            buffer = create_excel_for_all_invoices(lines, portfolio, fast=fast)
+            timings[label] = (time.perf_counter() - start, len(buffer.getvalue()))
+        print(
+            f"{portfolio} | clásico {timings['clásico'][0]:6.2f} s | rápido {timings['rápido'][0]:6.2f} s | "
+            f"x{timings['clásico'][0] / timings['rápido'][0]:4.1f} | {timings['rápido'][1] / 1024:,.0f} KB"
+        )
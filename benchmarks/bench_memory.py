@@ -0,0 +1,140 @@
+# Memoria por sesión del cálculo de NC (etapas de nc_engine) sobre un extracto sintético.
+# Cada medición corre en un proceso nuevo; se informa el RSS después de cargar el extracto,
+# el pico durante las etapas de una sesión y lo que la sesión deja retenido en su caché.
+# Modos:
+#   actual: el extracto se compacta como en ingest.read_table (category) y las etapas
+#           corren como en la app, con copy-on-write.
+#   base:   sin compactar, sin copy-on-write (solo se puede apagar en pandas < 3) y con
+#           las copias completas que hacía el tab1 antes (df_full.copy(), df_pre_filtros,
+#           df_temp_validation, df_temp_all_lines, df_temp_for_coverage), para volver a
+#           medir el "antes".
+# Uso: python benchmarks/bench_memory.py [filas] [sesiones] [--modo actual|base]
+#      (sin --modo se miden los dos)
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def current_rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 2**20
+
+
+def build_extract(n, seed=0):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    invoices = rng.integers(0, max(1, n // 4), n)
+    return pd.DataFrame({
+        'Factura': [f"{90000000 + i:010d}" for i in invoices],
+        'Org. Ventas': '0702',
+        'Clase de Factura': rng.choice(['ZSPN', 'ZSCC', 'ZXXX'], n),
+        'Solicitante': [str(100 + (i % 50)) for i in invoices],
+        'Material': [f"{(i % 40):08d}" for i in invoices],
+        'Precio Neto': [f"{v:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.') for v in rng.uniform(1, 500, n)],
+        'Texto': [f"ref {90000000 + int(j):010d}" if k < 0.02 else '' for j, k in zip(rng.integers(0, max(1, n // 4), n), rng.random(n))],
+    })
+
+
+def child(n, sessions, mode):
+    import gc
+
+    import pandas as pd
+
+    from amounts import add_amount_column
+    from ingest import compact_frame
+    from ledger import add_ticket_to_ledger
+    from nc_engine import (detect_portfolio_code, detect_columns, prepare_lines, build_index, available_lines,
+                           check_clients, cover_amount, enrich_ticket)
+
+    baseline = mode == 'base'
+    copy_on_write = True
+    if baseline and int(pd.__version__.split('.')[0]) < 3:
+        pd.set_option('mode.copy_on_write', False)
+        copy_on_write = False
+    # Las copias del tab1 anterior; en el modo actual no se copia nada
+    copy = (lambda frame: frame.copy()) if baseline else (lambda frame: frame)
+
+    df = build_extract(n)
+    add_amount_column(df)
+    if not baseline:
+        df = compact_frame(df)
+    gc.collect()
+    after_load = current_rss_mb()
+    kept = []
+    for s in range(sessions):
+        df_session = copy(df)
+        portfolio = detect_portfolio_code(copy(df_session))
+        columns = detect_columns(df_session.columns)
+        lines, columns, _ = prepare_lines(df_session, portfolio, columns)
+        index = build_index(lines, portfolio, columns)
+        ledger = {}
+        available = copy(available_lines(lines, columns, index, ledger))
+        for client in ('100', '101', '102'):
+            check_clients(copy(available), columns, index, [client])
+            candidates = copy(copy(available))
+            ticket = cover_amount(candidates, columns, index, [client], [], 1500.0)
+            ticket = enrich_ticket(ticket, columns, portfolio, 'Grand Slam', 'T1')
+            add_ticket_to_ledger(ledger, ticket)
+            available = copy(available_lines(lines, columns, index, ledger))
+        # Lo que la caché de etapas de la sesión conserva entre reruns
+        kept.append((lines, index, available, ticket))
+    gc.collect()
+    print(json.dumps({
+        'after_load': after_load,
+        'peak': peak_rss_mb(),
+        'retained': current_rss_mb(),
+        'sessions': sessions,
+        'copy_on_write': copy_on_write,
+    }))
+
+
+def measure(rows, sessions, mode):
+    return json.loads(subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', str(rows), str(sessions), mode],
+        capture_output=True, text=True, check=True, cwd=ROOT,
+    ).stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(int(sys.argv[2]), int(sys.argv[3]), sys.argv[4])
+        sys.exit(0)
+
+    args = sys.argv[1:]
+    modes = ['base', 'actual']
+    if '--modo' in args:
+        position = args.index('--modo')
+        modes = [args[position + 1]]
+        del args[position:position + 2]
+    rows = int(args[0]) if len(args) > 0 else 500_000
+    sessions = int(args[1]) if len(args) > 1 else 3
+    for mode in modes:
+        result = measure(rows, sessions, mode)
+        per_session_peak = (result['peak'] - result['after_load'])
+        per_session_retained = (result['retained'] - result['after_load']) / sessions
+        print(
+            f"{mode:6} | {rows:,} filas | extracto cargado {result['after_load']:8.1f} MB | "
+            f"pico {result['peak']:8.1f} MB (+{per_session_peak:,.1f}) | "
+            f"retenido por sesión {per_session_retained:8.1f} MB ({sessions} sesiones"
+            f"{'' if result['copy_on_write'] else ', sin copy-on-write'})"
+        )
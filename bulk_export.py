@@ -0,0 +1,112 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from excel_export import ExportError, create_excel_for_all_invoices
+from template_registry import TEMPLATES
+
+# --- EXPORTACIÓN MASIVA DE TICKETS APILADOS ---
+# Los tickets de la sesión se concatenan, se agrupan por ticket y portafolio y cada
+# grupo se genera como un Excel dentro de un único ZIP. Con muchos tickets los
+# libros se generan en paralelo en varios procesos.
+
+# Columnas internas con el ticket y el portafolio de cada línea apilada
+TICKET_COLUMN = '__ticket__'
+PORTFOLIO_COLUMN = '__portafolio__'
+NO_PORTFOLIO = '--'
+
+# Por debajo de esta cantidad de libros no compensa arrancar procesos
+POOL_MIN_TICKETS = 8
+MAX_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+
+
+def tag_ticket(ticket_df, ticket, portfolio):
+    """Copia del ticket con su número y portafolio en las columnas internas."""
+    return ticket_df.assign(**{TICKET_COLUMN: ticket or '', PORTFOLIO_COLUMN: portfolio or NO_PORTFOLIO})
+
+
+def group_stacked_tickets(stacked_tickets):
+    """Lista de (ticket, portafolio, líneas) en el orden en que se apilaron."""
+    frames = [t for t in stacked_tickets if t is not None and not t.empty]
+    if not frames:
+        return []
+    stacked = pd.concat(frames, ignore_index=True)
+    for col, default in ((TICKET_COLUMN, ''), (PORTFOLIO_COLUMN, NO_PORTFOLIO)):
+        if col not in stacked.columns:
+            stacked[col] = default
+        stacked[col] = stacked[col].fillna(default).astype(str)
+    groups = stacked.groupby([TICKET_COLUMN, PORTFOLIO_COLUMN], sort=False)
+    return [(ticket, portfolio, lines) for (ticket, portfolio), lines in groups]
+
+
+def _init_worker():
+    TEMPLATES.preload()
+
+
+def render_workbook(job):
+    """
+    (bytes del libro, None) o (None, mensaje de error) a partir de (portafolio,
+    líneas); se ejecuta también en los procesos hijos.
+    """
+    portfolio, lines = job
+    try:
+        return create_excel_for_all_invoices(lines, portfolio).getvalue(), None
+    except ExportError as e:
+        return None, str(e)
+
+
+def _render_all(jobs, max_workers):
+    if max_workers > 1 and len(jobs) >= POOL_MIN_TICKETS:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool:
+                return list(pool.map(render_workbook, jobs, chunksize=max(1, len(jobs) // (max_workers * 4))))
+        except (BrokenProcessPool, OSError):
+            # Sin procesos disponibles (p. ej. entorno restringido): se genera en serie
+            pass
+    return [render_workbook(job) for job in jobs]
+
+
+def _unique_name(name, used):
+    if name not in used:
+        used.add(name)
+        return name
+    stem, ext = os.path.splitext(name)
+    n = 2
+    while f"{stem}_{n}{ext}" in used:
+        n += 1
+    unique = f"{stem}_{n}{ext}"
+    used.add(unique)
+    return unique
+
+
+def export_tickets_zip(stacked_tickets, file_name_for, max_workers=MAX_WORKERS):
+    """
+    ZIP (BytesIO) con un Excel por ticket/portafolio, la cantidad de libros
+    incluidos y los errores [(ticket, portafolio, mensaje)] de los que no se
+    pudieron generar. file_name_for(portafolio, ticket) da el nombre de cada archivo.
+    """
+    groups = group_stacked_tickets(stacked_tickets)
+    jobs = [
+        (portfolio, lines.drop(columns=[TICKET_COLUMN, PORTFOLIO_COLUMN]).reset_index(drop=True))
+        for _, portfolio, lines in groups
+    ]
+    workbooks = _render_all(jobs, max_workers)
+
+    output_buffer = io.BytesIO()
+    used_names = set()
+    written = 0
+    errors = []
+    # Los .xlsx ya vienen comprimidos: se guardan sin volver a comprimir
+    with zipfile.ZipFile(output_buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for (ticket, portfolio, _), (content, error) in zip(groups, workbooks):
+            if content is None:
+                errors.append((ticket, portfolio, error))
+                continue
+            archive.writestr(_unique_name(file_name_for(portfolio, ticket), used_names), content)
+            written += 1
+    output_buffer.seek(0)
+    return output_buffer, written, errors
@@ -0,0 +1,168 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from amounts import AMOUNT_COLUMN, add_amount_column
+from ingest import CHUNK_ROWS, compact_frame, iter_table_chunks, memory_mb
+from invoice_index import REFERENCE_PATTERN, normalize_invoice_numbers
+from nc_engine import ALLOWED_INVOICE_CLASSES, NCError, detect_columns, detect_portfolio_code
+
+# --- LECTURA POR BLOQUES DE EXTRACTOS GRANDES ---
+# Para extractos que no caben en memoria: el archivo se recorre por bloques y en
+# cada bloque se filtran las clases de factura del portafolio, se acumula el total
+# por factura y se guardan solo las líneas de los clientes pedidos. Las facturas
+# mencionadas por otra línea (referencias cruzadas) se detectan sobre todo el
+# extracto y sus líneas se descartan al terminar. Si cambian los clientes o el
+# portafolio hay que volver a recorrer el archivo.
+
+INVOICE_TABLE_COLUMNS = ['factura', 'cliente', 'lineas', 'monto', 'referenciada']
+# Cada cuántos bloques se consolidan los totales parciales por factura
+COLLAPSE_EVERY = 8
+
+
+def _allowed_rows(chunk, col_clase_factura, allowed_classes):
+    if not allowed_classes or col_clase_factura not in chunk.columns:
+        return chunk
+    return chunk[chunk[col_clase_factura].str.upper().isin(allowed_classes)]
+
+
+def _chunk_mentions(chunk, col_factura, header_columns):
+    """
+    Números de 7+ dígitos (sin ceros a la izquierda) mencionados en el bloque y la
+    factura de la línea que los menciona; None si los mencionan varias facturas.
+    Como find_invoice_references, se revisan todas las columnas, también la de la
+    factura: que una línea mencione su propia factura no la excluye.
+    """
+    own_codes, own_invoices = pd.factorize(chunk[col_factura])
+    # Las líneas sin número de factura cuentan como una factura más ('')
+    own_invoices = np.append(np.asarray(own_invoices, dtype=object), '')
+    own_codes = np.where(own_codes < 0, len(own_invoices) - 1, own_codes)
+    found = []
+    for col in header_columns:
+        if col not in chunk.columns:
+            continue
+        values = chunk[col]
+        with_number = np.flatnonzero(values.str.contains(r'\d{7}', regex=True, na=False).to_numpy())
+        if not len(with_number):
+            continue
+        # Igual que find_invoice_references: cada valor distinto se analiza una sola vez
+        codes, uniques = pd.factorize(values.take(with_number))
+        matches = pd.Series(uniques, dtype=object).str.extractall(REFERENCE_PATTERN)[0]
+        if matches.empty:
+            continue
+
+        # Factura de las líneas de cada valor distinto (-1 si son varias)
+        pairs = pd.unique(codes.astype(np.int64) * len(own_invoices) + own_codes[with_number])
+        value_codes, invoice_codes = np.divmod(pairs, len(own_invoices))
+        owner = np.full(len(uniques), -1)
+        owner[value_codes] = invoice_codes
+        owner[np.bincount(value_codes, minlength=len(uniques)) > 1] = -1
+
+        matched_owner = owner[matches.index.get_level_values(0).to_numpy()]
+        found.append(pd.DataFrame({
+            'norm': matches.str.lstrip('0').to_numpy(),
+            'own': np.where(matched_owner >= 0, own_invoices[matched_owner], None),
+        }))
+    if not found:
+        return None
+    return pd.concat(found, ignore_index=True)
+
+
+def _merge_mentions(mentioned_by, mentions):
+    # mentioned_by: número -> factura que lo menciona, o None si lo mencionan varias
+    per_norm = mentions.groupby('norm', sort=False)['own'].agg(['first', 'nunique', 'count', 'size'])
+    single = ((per_norm['nunique'] == 1) & (per_norm['count'] == per_norm['size'])).tolist()
+    for norm, own, is_single in zip(per_norm.index.tolist(), per_norm['first'].tolist(), single):
+        owner = own if is_single else None
+        if norm in mentioned_by and mentioned_by[norm] != owner:
+            owner = None
+        mentioned_by[norm] = owner
+
+
+def _collapse(partials):
+    totals = pd.concat(partials, ignore_index=True)
+    return totals.groupby(INVOICE_TABLE_COLUMNS[:2], sort=False, as_index=False).sum()
+
+
+def read_table_chunked(source, client_codes, portfolio=None, chunk_rows=CHUNK_ROWS):
+    """
+    Recorre el extracto por bloques. Devuelve (df, facturas, stats): df con las
+    líneas de client_codes en el mismo formato que ingest.read_table, facturas con
+    una fila por factura de todo el extracto (INVOICE_TABLE_COLUMNS) y stats con el
+    portafolio usado (detectado en el primer bloque si no se indica).
+    """
+    start = time.perf_counter()
+    client_codes = set(client_codes or ())
+    columns = None
+    header = None
+    allowed_classes = []
+    kept = []
+    partials = []
+    mentioned_by = {}
+    rows_read = 0
+
+    for chunk in iter_table_chunks(source, chunk_rows):
+        if columns is None:
+            header = chunk.columns
+            columns = detect_columns(chunk.columns)
+            if not columns['cliente'] or not columns['factura'] or not columns['monto']:
+                raise NCError("Error: Revise los encabezados de su archivo.")
+            portfolio = portfolio or detect_portfolio_code(chunk)
+            if portfolio != '--':
+                allowed_classes = ALLOWED_INVOICE_CLASSES.get(portfolio, [])
+        rows_read += len(chunk)
+
+        col_factura, col_cliente = columns['factura'], columns['cliente']
+        chunk = _allowed_rows(chunk, columns['clase_factura'], allowed_classes)
+        if chunk.empty:
+            continue
+        add_amount_column(chunk, columns['monto'])
+
+        mentions = _chunk_mentions(chunk, col_factura, columns['header'])
+        if mentions is not None:
+            _merge_mentions(mentioned_by, mentions)
+
+        partial = chunk.groupby([col_factura, col_cliente], sort=False)[AMOUNT_COLUMN].agg(lineas='size', monto='sum')
+        partials.append(partial.reset_index().set_axis(INVOICE_TABLE_COLUMNS[:-1], axis=1))
+        if len(partials) >= COLLAPSE_EVERY:
+            partials = [_collapse(partials)]
+
+        if client_codes:
+            selected = chunk[chunk[col_cliente].isin(client_codes)]
+            if not selected.empty:
+                kept.append(selected)
+
+    if columns is None:
+        raise NCError("Error: Revise los encabezados de su archivo.")
+
+    if partials:
+        invoices = _collapse(partials)
+    else:
+        invoices = pd.DataFrame({c: pd.Series(dtype=object) for c in INVOICE_TABLE_COLUMNS[:-1]})
+    norms = normalize_invoice_numbers(invoices['factura'].astype(str))
+    owners = norms.map(mentioned_by)
+    invoices['referenciada'] = norms.isin(list(mentioned_by)) & (owners.isna() | (owners != invoices['factura']))
+    referenced = set(invoices.loc[invoices['referenciada'], 'factura'])
+
+    if kept:
+        df = pd.concat(kept, ignore_index=True)
+    else:
+        df = pd.DataFrame({c: pd.Series(dtype=object) for c in header}).assign(**{AMOUNT_COLUMN: pd.Series(dtype='float64')})
+    if referenced:
+        df = df[~df[columns['factura']].isin(referenced)].reset_index(drop=True)
+    df = compact_frame(df)
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        'motor': 'bloques',
+        'portafolio': portfolio,
+        'columna_monto': columns['monto'],
+        'filas': len(df),
+        'filas_leidas': rows_read,
+        'facturas': len(invoices),
+        'segundos': elapsed,
+        'filas_por_seg': rows_read / elapsed if elapsed > 0 else float(rows_read),
+        'memoria_retenida_mb': memory_mb(df) + memory_mb(invoices),
+    }
+    return df, invoices, stats
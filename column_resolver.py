@@ -0,0 +1,97 @@
+from functools import lru_cache
+
+from config import COLUMN_ALIASES
+
+# --- DETECCIÓN DE COLUMNAS POR ROL ---
+# Cada encabezado se normaliza y se clasifica una sola vez contra todas las reglas;
+# por cada rol gana la regla de mayor puntaje y, a igual puntaje, la columna que
+# aparece primero (como hacían las búsquedas con next()). Las palabras clave de
+# siempre puntúan más que los alias de config.COLUMN_ALIASES, que solo se usan si
+# ninguna palabra clave coincide. El resultado se memoriza por la tupla de
+# encabezados: un archivo con el mismo formato no vuelve a analizarse.
+
+FACTURA_KEYS = ['factura', 'nofactura', 'numerofactura', 'asignacion']
+CLIENTE_KEYS = ['cliente', 'codcliente', 'solicitante']
+PRODUCTO_KEYS = ['producto', 'material', 'codigoproducto']
+UNIDAD_MEDIDA_KEYS = ['u.m venta', 'um venta', 'unidad venta', 'u. medida', 'umedida', 'um']
+CONDICION_KEYS = ['condicion', 'codigocondicion', 'cond']
+CLASE_FACTURA_KEYS = ['clase de factura', 'clasefactura', 'clase_factura', 'clase.factura', 'cl.f']
+AMOUNT_KEYS = ['precio', 'neto', 'valor', 'monto']
+
+ROLES = ['factura', 'monto', 'cliente', 'producto', 'unidad_medida', 'condicion', 'clase_factura', 'org_venta', 'sociedad']
+
+
+def _lower(header):
+    return header.lower()
+
+
+def _no_spaces(header):
+    return header.lower().replace(' ', '')
+
+
+def _invoice_form(header):
+    return header.lower().replace(' ', '').replace('°', '')
+
+
+def _org_form(header):
+    return header.lower().replace(' ', '').replace('.', '').replace('_', '')
+
+
+def _alias_form(header):
+    return ' '.join(header.lower().replace('_', ' ').split())
+
+
+# Alias de config.COLUMN_ALIASES por rol (solo coincidencia exacta). Los de
+# razon_social (nombre del cliente) y monto_usd no se usan: el rol cliente es el
+# código y el monto de la NC es en bolívares, así que una columna de nombre o en
+# dólares no puede reemplazarlos.
+ROLE_ALIASES = {
+    role: {_alias_form(alias) for alias in aliases}
+    for role, aliases in (
+        ('factura', COLUMN_ALIASES.get('numero_factura', [])),
+        ('monto', COLUMN_ALIASES.get('monto_bs', [])),
+    )
+}
+ALIAS_SCORE = 1
+
+
+def _contains_any(keys):
+    return lambda text: any(k in text for k in keys)
+
+
+# (rol, forma normalizada del encabezado, condición, puntaje)
+RULES = [
+    ('factura', _invoice_form, _contains_any(FACTURA_KEYS), 2),
+    ('cliente', _lower, _contains_any(CLIENTE_KEYS), 2),
+    ('producto', _lower, _contains_any(PRODUCTO_KEYS), 2),
+    ('unidad_medida', _lower, _contains_any(UNIDAD_MEDIDA_KEYS), 2),
+    ('condicion', _lower, _contains_any(CONDICION_KEYS), 2),
+    ('clase_factura', _no_spaces, _contains_any(CLASE_FACTURA_KEYS), 2),
+    ('monto', _lower, lambda text: 'precio' in text and 'total' not in text, 4),
+    ('monto', _lower, lambda text: any(k in text for k in AMOUNT_KEYS) and 'total' not in text, 3),
+    ('monto', _lower, lambda text: 'total' in text, 2),
+    ('org_venta', _org_form, lambda text: 'org' in text and ('ven' in text or 'vta' in text), 2),
+    ('sociedad', _no_spaces, lambda text: 'sociedad' in text, 2),
+]
+NORMALIZERS = {rule[1] for rule in RULES} | {_alias_form}
+
+
+@lru_cache(maxsize=128)
+def _resolve(headers):
+    best = {}
+    for position, header in enumerate(headers):
+        text = str(header)
+        forms = {normalize: normalize(text) for normalize in NORMALIZERS}
+        candidates = [(role, score) for role, normalize, matches, score in RULES if matches(forms[normalize])]
+        alias = forms[_alias_form]
+        candidates += [(role, ALIAS_SCORE) for role, aliases in ROLE_ALIASES.items() if alias in aliases]
+        for role, score in candidates:
+            # A igual puntaje se conserva la primera columna
+            if role not in best or score > best[role][0]:
+                best[role] = (score, position)
+    return tuple((role, headers[best[role][1]] if role in best else None) for role in ROLES)
+
+
+def resolve_columns(columns):
+    """Columna de cada rol de ROLES (None si no se encuentra), memorizado por encabezados."""
+    return dict(_resolve(tuple(columns)))
@@ -0,0 +1,137 @@
+import math
+import time
+
+import numpy as np
+
+# --- SELECCIÓN DE FACTURAS PARA CUBRIR EL MONTO DE LA NC ---
+# Cada solver recibe el total disponible por factura y el monto a cubrir, y devuelve
+# las posiciones de las facturas elegidas (de mayor a menor monto) o None si la
+# suma de todas no alcanza.
+
+SOLVER_MODES = {
+    'Rápido (mayor a menor)': 'greedy',
+    'Menor excedente': 'min_overshoot',
+    'Menos facturas': 'fewest',
+}
+DEFAULT_SOLVER_MODE = 'greedy'
+
+# Límite de tiempo y de tamaño de la tabla de programación dinámica
+DEFAULT_TIME_BUDGET = 0.5
+MAX_DP_CELLS = 4_000_000
+
+
+def _descending_order(totals):
+    # mergesort es estable: a igual monto se respeta el orden de entrada
+    return np.argsort(-totals, kind='mergesort')
+
+
+def greedy_cover(totals, target):
+    """La factura más pequeña que cubra el monto; si no hay, acumula de mayor a menor."""
+    totals = np.asarray(totals, dtype='float64')
+    if totals.size == 0:
+        return None
+    sufficient = np.flatnonzero(totals >= target)
+    if sufficient.size:
+        best = sufficient[np.argsort(totals[sufficient], kind='mergesort')[0]]
+        return np.array([best])
+    order = _descending_order(totals)
+    running = np.cumsum(totals[order])
+    if running[-1] < target:
+        return None
+    k = int(np.searchsorted(running, target, side='left')) + 1
+    return order[:k]
+
+
+def fewest_invoices_cover(totals, target):
+    """Mínima cantidad de facturas; la última se elige como la más pequeña que completa el monto."""
+    totals = np.asarray(totals, dtype='float64')
+    chosen = greedy_cover(totals, target)
+    if chosen is None or len(chosen) == 1:
+        return chosen
+    head = chosen[:-1]
+    missing = target - totals[head].sum()
+    rest = np.setdiff1d(np.arange(totals.size), head, assume_unique=True)
+    fits = rest[totals[rest] >= missing]
+    if fits.size == 0:
+        return chosen
+    last = fits[np.argsort(totals[fits], kind='mergesort')[0]]
+    return _sorted_desc(totals, np.append(head, last))
+
+
+def min_overshoot_cover(totals, target, time_budget=DEFAULT_TIME_BUDGET, max_cells=MAX_DP_CELLS):
+    """
+    Subconjunto cuya suma cubre el monto con el menor excedente posible (subset-sum
+    sobre centavos). Si el rango de centavos supera max_cells se trabaja con una
+    resolución más gruesa; si se agota el tiempo se usa lo mejor encontrado hasta
+    entonces. Nunca devuelve algo peor que greedy_cover.
+    """
+    totals = np.asarray(totals, dtype='float64')
+    greedy = greedy_cover(totals, target)
+    if greedy is None:
+        return None
+    greedy_overshoot = totals[greedy].sum() - target
+    if greedy_overshoot < 0.005:
+        return greedy
+
+    deadline = time.perf_counter() + time_budget
+    cents = np.floor(totals * 100 + 1e-6).astype(np.int64)
+    target_cents = math.ceil(target * 100 - 1e-6)
+    upper_cents = int(math.floor((target + greedy_overshoot) * 100 + 1e-6))
+
+    step = max(1, math.ceil((upper_cents + 1) / max_cells))
+    # Redondeo hacia abajo: una suma cuantizada >= objetivo garantiza la cobertura real
+    weights = cents // step
+    target_q = math.ceil(target_cents / step)
+    upper_q = upper_cents // step
+
+    order = _descending_order(totals)
+    order = order[(weights[order] > 0) & (weights[order] <= upper_q)]
+
+    reachable = np.zeros(upper_q + 1, dtype=bool)
+    reachable[0] = True
+    first_item = np.full(upper_q + 1, -1, dtype=np.int32)
+
+    for j, i in enumerate(order):
+        w = weights[i]
+        newly = reachable[:upper_q + 1 - w] & ~reachable[w:]
+        positions = np.flatnonzero(newly) + w
+        if positions.size:
+            reachable[positions] = True
+            first_item[positions] = j
+            if reachable[target_q]:
+                break
+        if time.perf_counter() > deadline:
+            break
+
+    hits = np.flatnonzero(reachable[target_q:])
+    if hits.size == 0:
+        return greedy
+
+    # Reconstrucción: cada suma se alcanzó por primera vez con first_item, y la suma
+    # restante ya era alcanzable con elementos anteriores
+    remaining = target_q + int(hits[0])
+    chosen = []
+    while remaining > 0:
+        j = first_item[remaining]
+        chosen.append(order[j])
+        remaining -= weights[order[j]]
+    chosen = np.array(chosen)
+
+    overshoot = totals[chosen].sum() - target
+    # Tolerancia de medio centavo por el redondeo de la suma en punto flotante
+    if overshoot < -0.005 or overshoot >= greedy_overshoot:
+        return greedy
+    return _sorted_desc(totals, chosen)
+
+
+def _sorted_desc(totals, positions):
+    positions = np.asarray(positions)
+    return positions[np.argsort(-totals[positions], kind='mergesort')]
+
+
+def select_invoices(totals, target, solver_mode=DEFAULT_SOLVER_MODE, time_budget=DEFAULT_TIME_BUDGET):
+    if solver_mode == 'min_overshoot':
+        return min_overshoot_cover(totals, target, time_budget=time_budget)
+    if solver_mode == 'fewest':
+        return fewest_invoices_cover(totals, target)
+    return greedy_cover(totals, target)
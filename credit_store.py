@@ -0,0 +1,357 @@
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from amounts import convert_series_to_float
+from ledger import TICKET_AMOUNT_COLUMN, TICKET_INVOICE_COLUMN
+
+try:
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    BASE_DIR = os.getcwd()
+
+# --- HISTORIAL LOCAL DE NOTAS DE CRÉDITO (historial_creditos.db) ---
+# Cada ticket añadido se guarda en la tabla notas_de_credito, una fila por línea
+# con monto asignado, en una sola transacción (executemany). La base usa WAL para
+# que las lecturas de otras sesiones no esperen a las escrituras, y tiene índices
+# por factura, portafolio y fecha, así que consultar lo ya acreditado a una factura
+# no recorre la tabla. El proceso usa una sola conexión, de un hilo a la vez: Streamlit
+# ejecuta cada rerun en un hilo nuevo y una conexión por hilo se abriría (con sus
+# pragmas) en cada rerun sin cerrarse nunca.
+#
+# consumo_por_factura guarda el total acreditado por portafolio y factura (el mismo
+# número de factura puede existir en dos portafolios) y se actualiza en la misma
+# transacción que cada ticket. En memoria se mantiene una Serie por portafolio
+# (compartida por todas las sesiones del proceso) y en cada consulta solo se suman
+# las notas con id mayor al último visto: las de otras sesiones o de otro equipo con
+# la misma base. Así tab1 descuenta lo acreditado ayer o por otro analista sin
+# recorrer el historial en cada rerun.
+#
+# El código del cliente (Solicitante) va en cod_cliente; razon_social queda para el
+# nombre, que tienen las notas anteriores a esta tabla pero no los tickets.
+#
+# resumen_tickets guarda totales (tickets, líneas, monto) por portafolio, motivo,
+# código de cliente y día, también actualizados con cada ticket, para que la pestaña
+# "Tickets Generados" lea unas pocas filas ya agrupadas en lugar del historial.
+
+# La base vive en la carpeta del usuario (como la caché y el espejo del historial):
+# en el ejecutable BASE_DIR es una carpeta temporal que se borra al cerrar. La copia
+# que viene con la aplicación solo se usa como semilla la primera vez y nunca se
+# modifica.
+DB_PATH = os.environ.get(
+    'NOTAS_HISTORIAL_DB',
+    os.path.join(os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), 'NotasCredito', 'historial_creditos.db'),
+)
+SEED_DB_PATH = os.path.join(BASE_DIR, 'historial_creditos.db')
+
+CREDIT_COLUMNS = ['numero_factura', 'razon_social', 'monto_bs', 'monto_usd', 'fecha', 'portafolio',
+                  'estado_proceso', 'mensaje', 'archivo_origen', 'fecha_procesado', 'ticket', 'motivo',
+                  'cod_cliente']
+# Columnas que no estaban en la tabla original; se agregan al abrir una base antigua
+ADDED_COLUMNS = {'ticket': 'TEXT', 'motivo': 'TEXT', 'cod_cliente': 'TEXT'}
+INDEXES = {
+    'idx_notas_factura': 'numero_factura',
+    'idx_notas_portafolio': 'portafolio',
+    'idx_notas_fecha': 'fecha',
+}
+STATE_GENERATED = 'generado'
+# Límite de parámetros por consulta de SQLite
+MAX_QUERY_PARAMS = 900
+
+USAGE_TABLE = 'consumo_por_factura'
+ROLLUP_TABLE = 'resumen_tickets'
+# Dimensión del resumen -> columna de notas_de_credito
+ROLLUP_DIMENSIONS = {
+    'portafolio': 'portafolio',
+    'motivo': 'motivo',
+    'cliente': 'cod_cliente',
+    'dia': 'fecha',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notas_de_credito (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    numero_factura TEXT,
+    razon_social TEXT,
+    monto_bs REAL,
+    monto_usd REAL,
+    fecha TEXT,
+    portafolio TEXT,
+    estado_proceso TEXT,
+    mensaje TEXT,
+    archivo_origen TEXT,
+    fecha_procesado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+USAGE_SCHEMA = f"""
+CREATE TABLE {USAGE_TABLE} (
+    portafolio TEXT NOT NULL,
+    numero_factura TEXT NOT NULL,
+    monto REAL NOT NULL,
+    PRIMARY KEY (portafolio, numero_factura)
+) WITHOUT ROWID
+"""
+ROLLUP_SCHEMA = f"""
+CREATE TABLE {ROLLUP_TABLE} (
+    dimension TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    tickets INTEGER NOT NULL,
+    lineas INTEGER NOT NULL,
+    monto REAL NOT NULL,
+    PRIMARY KEY (dimension, clave)
+) WITHOUT ROWID
+"""
+
+
+def ticket_records(ticket_df, ticket, portfolio, motivo, archivo_origen, now=None):
+    """Filas de notas_de_credito (en el orden de CREDIT_COLUMNS) de las líneas con monto asignado de un ticket."""
+    if ticket_df is None or ticket_df.empty or TICKET_AMOUNT_COLUMN not in ticket_df.columns:
+        return []
+    now = now or datetime.now()
+    amounts = convert_series_to_float(ticket_df[TICKET_AMOUNT_COLUMN])
+    valid = (amounts.notna() & (amounts != 0)).to_numpy()
+    lines = ticket_df[valid]
+    if lines.empty:
+        return []
+
+    def text(col):
+        if col not in lines.columns:
+            return [None] * len(lines)
+        return lines[col].astype(str).str.strip().tolist()
+
+    header = text('TEXTO CABECERA')
+    fecha, procesado = now.strftime('%Y-%m-%d'), now.strftime('%Y-%m-%d %H:%M:%S')
+    return [
+        (invoice, None, amount, None, fecha, portfolio, STATE_GENERATED, message,
+         archivo_origen, procesado, ticket or None, motivo or None, client)
+        for invoice, client, amount, message in zip(
+            text(TICKET_INVOICE_COLUMN), text('Solicitante'), amounts[valid].tolist(), header)
+    ]
+
+
+def _prepare_db(path, seed_path=SEED_DB_PATH):
+    """Crea la carpeta de la base y, si todavía no existe, la copia desde la semilla."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if not os.path.exists(path) and seed_path and os.path.exists(seed_path) \
+            and os.path.abspath(seed_path) != os.path.abspath(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(seed_path, tmp_path)
+        os.replace(tmp_path, path)
+
+
+def _build_rollup(conn, dimensions):
+    """Arma el resumen de las dimensiones indicadas a partir de las notas existentes."""
+    # Cada ticket se guardó en una transacción con la misma fecha_procesado
+    for dimension in dimensions:
+        col = ROLLUP_DIMENSIONS[dimension]
+        conn.execute(
+            f"INSERT INTO {ROLLUP_TABLE} (dimension, clave, tickets, lineas, monto) "
+            f"SELECT ?, COALESCE({col}, ''), "
+            "COUNT(DISTINCT COALESCE(ticket, '') || '|' || COALESCE(fecha_procesado, '')), "
+            f"COUNT(*), COALESCE(SUM(monto_bs), 0) FROM notas_de_credito GROUP BY COALESCE({col}, '')",
+            (dimension,))
+
+
+class CreditStore:
+    def __init__(self, path=DB_PATH, seed_path=SEED_DB_PATH):
+        self.path = path
+        self.seed_path = seed_path
+        self._conn = None
+        self._lock = threading.RLock()
+        # portafolio -> (Serie factura -> monto, id de la última nota incluida)
+        self._usage = {}
+        # dimensión -> (versión, DataFrame) del último resumen leído
+        self._rollups = {}
+
+    @contextmanager
+    def _connection(self):
+        """Conexión del proceso; se abre (y se prepara el esquema) la primera vez."""
+        with self._lock:
+            if self._conn is None:
+                _prepare_db(self.path, self.seed_path)
+                conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+                try:
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.execute('PRAGMA synchronous=NORMAL')
+                    self._ensure_schema(conn)
+                except Exception:
+                    conn.close()
+                    raise
+                self._conn = conn
+            yield self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _ensure_schema(self, conn):
+        with conn:
+            conn.execute(SCHEMA)
+            existing = {row[1] for row in conn.execute('PRAGMA table_info(notas_de_credito)')}
+            for col, sql_type in ADDED_COLUMNS.items():
+                if col not in existing:
+                    conn.execute(f'ALTER TABLE notas_de_credito ADD COLUMN {col} {sql_type}')
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if 'cod_cliente' not in existing:
+                # Los tickets guardados antes de cod_cliente tenían el código en
+                # razon_social: se mueve y el resumen por cliente se vuelve a armar
+                conn.execute('UPDATE notas_de_credito SET cod_cliente = razon_social, razon_social = NULL '
+                             'WHERE estado_proceso = ?', (STATE_GENERATED,))
+                if ROLLUP_TABLE in tables:
+                    conn.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE dimension = 'cliente'")
+                    _build_rollup(conn, ['cliente'])
+            for name, col in INDEXES.items():
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON notas_de_credito ({col})')
+            if USAGE_TABLE in tables:
+                usage_columns = {row[1] for row in conn.execute(f'PRAGMA table_info({USAGE_TABLE})')}
+                if 'portafolio' not in usage_columns:
+                    # Tabla de consumo anterior, solo por factura: se vuelve a armar
+                    conn.execute(f'DROP TABLE {USAGE_TABLE}')
+                    tables.discard(USAGE_TABLE)
+            if USAGE_TABLE not in tables:
+                # Base sin la tabla de consumo: se arma una vez con las notas existentes
+                conn.execute(USAGE_SCHEMA)
+                conn.execute(f"INSERT INTO {USAGE_TABLE} (portafolio, numero_factura, monto) "
+                             "SELECT COALESCE(portafolio, ''), numero_factura, COALESCE(SUM(monto_bs), 0) "
+                             "FROM notas_de_credito WHERE numero_factura IS NOT NULL "
+                             "GROUP BY COALESCE(portafolio, ''), numero_factura")
+            if ROLLUP_TABLE not in tables:
+                conn.execute(ROLLUP_SCHEMA)
+                _build_rollup(conn, ROLLUP_DIMENSIONS)
+
+    def insert_records(self, records) -> int:
+        """Inserta filas de ticket_records en una sola transacción. Devuelve las filas insertadas."""
+        if not records:
+            return 0
+        placeholders = ', '.join('?' * len(CREDIT_COLUMNS))
+        invoice_pos, amount_pos = CREDIT_COLUMNS.index('numero_factura'), CREDIT_COLUMNS.index('monto_bs')
+        portfolio_pos = CREDIT_COLUMNS.index('portafolio')
+        usage = {}
+        for record in records:
+            if record[invoice_pos] is not None:
+                key = (record[portfolio_pos] or '', record[invoice_pos])
+                usage[key] = usage.get(key, 0.0) + (record[amount_pos] or 0.0)
+        rollup = {}
+        rollup_pos = {dimension: CREDIT_COLUMNS.index(col) for dimension, col in ROLLUP_DIMENSIONS.items()}
+        for record in records:
+            amount = record[amount_pos] or 0.0
+            for dimension, pos in rollup_pos.items():
+                key = (dimension, record[pos] or '')
+                lines, total = rollup.get(key, (0, 0.0))
+                rollup[key] = (lines + 1, total + amount)
+        with self._connection() as conn, conn:
+            conn.executemany(
+                f"INSERT INTO notas_de_credito ({', '.join(CREDIT_COLUMNS)}) VALUES ({placeholders})", records)
+            conn.executemany(
+                f'INSERT INTO {USAGE_TABLE} (portafolio, numero_factura, monto) VALUES (?, ?, ?) '
+                'ON CONFLICT(portafolio, numero_factura) DO UPDATE SET monto = monto + excluded.monto',
+                [(portfolio, invoice, total) for (portfolio, invoice), total in usage.items()])
+            # Las filas de una llamada son un ticket: suma 1 ticket a cada clave que aparece
+            conn.executemany(
+                f'INSERT INTO {ROLLUP_TABLE} (dimension, clave, tickets, lineas, monto) VALUES (?, ?, 1, ?, ?) '
+                'ON CONFLICT(dimension, clave) DO UPDATE SET tickets = tickets + 1, '
+                'lineas = lineas + excluded.lineas, monto = monto + excluded.monto',
+                [(dimension, key, lines, total) for (dimension, key), (lines, total) in rollup.items()])
+        return len(records)
+
+    def add_ticket(self, ticket_df: pd.DataFrame, ticket: str, portfolio: str, motivo: str,
+                   archivo_origen: str) -> int:
+        """Guarda las líneas con monto de un ticket. Devuelve las filas insertadas."""
+        return self.insert_records(ticket_records(ticket_df, ticket, portfolio, motivo, archivo_origen))
+
+    def credits_for_invoice(self, numero_factura: str) -> pd.DataFrame:
+        """Notas de crédito registradas para una factura, de la más antigua a la más reciente."""
+        with self._connection() as conn:
+            return pd.read_sql_query(
+                f"SELECT id, {', '.join(CREDIT_COLUMNS)} FROM notas_de_credito WHERE numero_factura = ? ORDER BY id",
+                conn, params=(str(numero_factura).strip(),))
+
+    def credited_amounts(self, invoices) -> dict:
+        """Monto ya acreditado por factura (solo las que tienen notas), como dict factura -> monto."""
+        keys = list(dict.fromkeys(str(i).strip() for i in invoices))
+        totals = {}
+        with self._connection() as conn:
+            for start in range(0, len(keys), MAX_QUERY_PARAMS):
+                chunk = keys[start:start + MAX_QUERY_PARAMS]
+                rows = conn.execute(
+                    f"SELECT numero_factura, SUM(monto_bs) FROM notas_de_credito "
+                    f"WHERE numero_factura IN ({', '.join('?' * len(chunk))}) GROUP BY numero_factura", chunk)
+                totals.update((invoice, float(total or 0.0)) for invoice, total in rows)
+        return totals
+
+    def is_credited(self, numero_factura: str) -> bool:
+        """True si la factura ya tiene alguna nota de crédito registrada."""
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT 1 FROM notas_de_credito WHERE numero_factura = ? LIMIT 1', (str(numero_factura).strip(),)).fetchone()
+        return row is not None
+
+    def credits_between(self, start: str, end: str, portfolio: str = None) -> pd.DataFrame:
+        """Notas con fecha (AAAA-MM-DD) entre start y end inclusive, opcionalmente de un portafolio."""
+        query = f"SELECT id, {', '.join(CREDIT_COLUMNS)} FROM notas_de_credito WHERE fecha BETWEEN ? AND ?"
+        params = [start, end]
+        if portfolio:
+            query += ' AND portafolio = ?'
+            params.append(portfolio)
+        with self._connection() as conn:
+            return pd.read_sql_query(query + ' ORDER BY id', conn, params=params)
+
+    def consumed_amounts(self, portfolio: str):
+        """
+        (Serie factura -> monto acreditado en todo el historial a las facturas de un
+        portafolio, versión). La versión es el id de la última nota incluida y cambia
+        solo cuando hay notas nuevas.
+        """
+        portfolio = portfolio or ''
+        with self._connection() as conn:
+            usage, usage_id = self._usage.get(portfolio, (None, 0))
+            last_id = conn.execute('SELECT MAX(id) FROM notas_de_credito').fetchone()[0] or 0
+            if usage is None or last_id < usage_id:
+                # Primera carga (o base reemplazada): la tabla de consumo y el último id
+                # se leen en la misma transacción para que coincidan
+                conn.execute('BEGIN')
+                try:
+                    last_id = conn.execute('SELECT MAX(id) FROM notas_de_credito').fetchone()[0] or 0
+                    rows = pd.read_sql_query(f'SELECT numero_factura, monto FROM {USAGE_TABLE} WHERE portafolio = ?',
+                                             conn, params=(portfolio,))
+                finally:
+                    conn.execute('COMMIT')
+                usage = pd.Series(rows['monto'].to_numpy(dtype='float64'), index=rows['numero_factura'].to_numpy(dtype=object))
+            elif last_id > usage_id:
+                new = pd.read_sql_query(
+                    "SELECT numero_factura, COALESCE(SUM(monto_bs), 0) AS monto FROM notas_de_credito "
+                    "WHERE id > ? AND id <= ? AND COALESCE(portafolio, '') = ? AND numero_factura IS NOT NULL "
+                    "GROUP BY numero_factura",
+                    conn, params=(usage_id, last_id, portfolio))
+                added = pd.Series(new['monto'].to_numpy(dtype='float64'), index=new['numero_factura'].to_numpy(dtype=object))
+                usage = usage.add(added, fill_value=0.0)
+            self._usage[portfolio] = (usage, last_id)
+            return usage, last_id
+
+    def rollup(self, dimension: str) -> pd.DataFrame:
+        """Totales precalculados de una dimensión de ROLLUP_DIMENSIONS: clave, tickets, lineas, monto."""
+        with self._connection() as conn:
+            version = conn.execute('SELECT MAX(id) FROM notas_de_credito').fetchone()[0] or 0
+            cached = self._rollups.get(dimension)
+            if cached is None or cached[0] != version:
+                frame = pd.read_sql_query(
+                    f'SELECT clave, tickets, lineas, monto FROM {ROLLUP_TABLE} WHERE dimension = ? ORDER BY monto DESC',
+                    conn, params=(dimension,))
+                cached = self._rollups[dimension] = (version, frame)
+        return cached[1]
+
+    def count(self) -> int:
+        with self._connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM notas_de_credito').fetchone()[0]
+
+
+CREDITS = CreditStore()
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+from parse_cache import hash_file, read_table_cached
+
+# --- ALMACÉN COMPARTIDO DE EXTRACTOS ---
+# Todas las sesiones del servidor que suben el mismo archivo (mismo hash de
+# contenido) usan el mismo DataFrame en lugar de una copia cada una. Cada sesión
+# guarda un DatasetHandle; el extracto se mantiene mientras alguna sesión lo
+# referencie y, sin referencias, queda en un LRU de tamaño limitado por si se
+# vuelve a subir. Cada DatasetHandle recibe su propia copia superficial del
+# extracto: comparte los datos, pero con copy-on-write una sesión que modifica
+# valores o columnas de su df lo hace sobre una copia y las demás no la ven. Los
+# resultados de derived() sí son el mismo objeto para todas las sesiones y no se
+# deben modificar.
+
+# Sin copy-on-write (pandas 2 por defecto) una copia superficial sigue compartiendo
+# los valores con el original; se activa aquí aunque no se haya importado nc_engine
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# Extractos sin sesiones que se conservan en memoria
+MAX_IDLE_DATASETS = int(os.environ.get('NOTAS_MAX_DATASETS_LIBRES', '2'))
+
+
+class DatasetHandle:
+    """Referencia de una sesión a un extracto compartido; se libera con release() o al descartarse."""
+
+    def __init__(self, store, entry, stats):
+        self.key = entry['key']
+        self.df = entry['df'].copy(deep=False)
+        self.stats = stats
+        self._entry = entry
+        self._finalizer = weakref.finalize(self, store._release, self.key)
+
+    def derived(self, key, compute):
+        """Resultado de compute() compartido por todas las sesiones del extracto (p. ej. líneas e índice por portafolio)."""
+        derived = self._entry['derived']
+        if key not in derived:
+            with self._entry['lock']:
+                if key not in derived:
+                    derived[key] = compute()
+        return derived[key]
+
+    def release(self):
+        self._finalizer()
+
+
+class DatasetStore:
+    def __init__(self, max_idle=MAX_IDLE_DATASETS, loader=read_table_cached):
+        self.max_idle = max_idle
+        self.loader = loader
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, source):
+        """DatasetHandle del archivo; solo se lee si ninguna sesión lo tiene ya cargado."""
+        start = time.perf_counter()
+        digest = hash_file(source)
+        entry = self._take(digest)
+        if entry is None:
+            # Dos sesiones que suben el mismo archivo a la vez lo leen una sola vez
+            with self._lock:
+                loading = self._loading.setdefault(digest, threading.Lock())
+            with loading:
+                entry = self._take(digest)
+                if entry is None:
+                    try:
+                        df, stats = self.loader(source, digest)
+                        entry = {'key': digest, 'df': df, 'stats': stats, 'refs': 1,
+                                 'derived': {}, 'lock': threading.Lock()}
+                        with self._lock:
+                            self._entries[digest] = entry
+                            self._evict()
+                    finally:
+                        with self._lock:
+                            self._loading.pop(digest, None)
+                    return DatasetHandle(self, entry, dict(stats, sesiones=1))
+
+        rows = len(entry['df'])
+        elapsed = time.perf_counter() - start
+        stats = dict(entry['stats'])
+        stats.update({
+            'motor': 'memoria compartida',
+            'filas': rows,
+            'segundos': elapsed,
+            'filas_por_seg': rows / elapsed if elapsed > 0 else float(rows),
+            'sesiones': entry['refs'],
+        })
+        return DatasetHandle(self, entry, stats)
+
+    def _take(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                entry['refs'] += 1
+                self._entries.move_to_end(digest)
+            return entry
+
+    def _release(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return
+            entry['refs'] = max(0, entry['refs'] - 1)
+            self._evict()
+
+    def _evict(self):
+        idle = [key for key, entry in self._entries.items() if entry['refs'] == 0]
+        # _entries está en orden de uso: se descartan los libres usados hace más tiempo
+        for key in idle[:max(0, len(idle) - self.max_idle)]:
+            del self._entries[key]
+
+    def info(self):
+        """Extractos en memoria: lista de (hash, filas, sesiones que lo usan)."""
+        with self._lock:
+            return [(key, len(entry['df']), entry['refs']) for key, entry in self._entries.items()]
+
+
+DATASETS = DatasetStore()
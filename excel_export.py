@@ -0,0 +1,265 @@
+import copy
+import io
+
+import openpyxl
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, NamedStyle
+from openpyxl.worksheet.page import PrintPageSetup
+
+from amounts import convert_value_to_float, convert_series_to_float
+from template_registry import DF_COLUMN_MAP, TEMPLATES, TemplateError
+
+START_ROW = 2
+
+DATE_COLUMNS = ["Fecha de Pedido", "Fecha de Precio", "Fecha de Factura"]
+NUMERIC_COLUMNS = ["VARIACION DE PRECIO", "Monto NC Asignado"]
+LEFT_ALIGNED_COLUMNS = ["ASIGNACION", "TEXTO CABECERA", "Observación", "Solicitante", "Material", "Pedido Cliente"]
+RIGHT_ALIGNED_COLUMNS = ["Cantidad", "Peso %", "VARIACION DE PRECIO", "Monto NC Asignado"]
+NUMBER_FORMAT = '0.00'
+
+# Estilos con nombre compartidos por todas las celdas del modo rápido
+STYLE_NUMBER = 'nc_numero'
+STYLE_LEFT = 'nc_izquierda'
+STYLE_RIGHT = 'nc_derecha'
+STYLE_TEXT = 'nc_texto'
+
+
+class ExportError(Exception):
+    """No se pudo generar el Excel; quien llama decide cómo mostrarlo (app, CLI, exportación masiva)."""
+
+
+def _prepare_frame(df_to_export):
+    required_df_cols = [col for col in DF_COLUMN_MAP.keys() if col is not None]
+    return df_to_export.reindex(columns=required_df_cols, fill_value='')
+
+
+def create_excel_for_all_invoices(df_to_export, selected_portfolio, ticket_number_for_name="", multiple_invoices=False, fast=True):
+    try:
+        layout = TEMPLATES.get(selected_portfolio)
+    except TemplateError as e_default:
+        raise ExportError(f"Error: No se pudo cargar ninguna plantilla de Excel (ni específica ni por defecto). Detalles: {e_default}") from e_default
+    if fast:
+        return _create_excel_fast(df_to_export, layout)
+    return _create_excel_classic(df_to_export, layout)
+
+
+# --- MODO RÁPIDO ---
+# Libro write-only: se copia de la plantilla el encabezado (valores y estilos), las
+# dimensiones de filas y columnas, el formato condicional y las propiedades de la
+# hoja, y las filas se escriben en bloque, columna por columna ya convertida, con
+# estilos con nombre compartidos. El resultado tiene el mismo formato que el modo
+# clásico, que parte de la plantilla misma.
+
+def _column_values(series, df_col_name):
+    values = series.to_numpy(dtype=object)
+    empty = pd.isna(series).to_numpy() | (series.astype(str).to_numpy() == '')
+    if df_col_name in NUMERIC_COLUMNS:
+        numeric = convert_series_to_float(series).to_numpy()
+        out = [
+            '' if is_empty else (float(num) if num == num else str(value))
+            for value, num, is_empty in zip(values, numeric, empty)
+        ]
+    else:
+        out = ['' if is_empty else str(value) for value, is_empty in zip(values, empty)]
+    return out
+
+
+def _styled_cell(sheet, style):
+    if style is None:
+        return None
+    cell = WriteOnlyCell(sheet)
+    cell.style = style
+    return cell
+
+
+def _register_styles(workbook, font):
+    # Todas con la fuente por defecto de la plantilla, la que tienen las celdas nuevas en el modo clásico
+    number = NamedStyle(name=STYLE_NUMBER, font=copy.copy(font), number_format=NUMBER_FORMAT, alignment=Alignment(horizontal='right'))
+    left = NamedStyle(name=STYLE_LEFT, font=copy.copy(font), alignment=Alignment(horizontal='left'))
+    right = NamedStyle(name=STYLE_RIGHT, font=copy.copy(font), alignment=Alignment(horizontal='right'))
+    text = NamedStyle(name=STYLE_TEXT, font=copy.copy(font))
+    for style in (number, left, right, text):
+        workbook.add_named_style(style)
+
+
+def _apply_style(target, style):
+    if style is None:
+        return
+    target.font = style['font']
+    target.fill = style['fill']
+    target.border = style['border']
+    target.alignment = style['alignment']
+    target.protection = style['protection']
+    target.number_format = style['number_format']
+
+
+def _apply_dimensions(holder, dimensions):
+    for key, (attributes, style) in dimensions.items():
+        dim = holder[key]
+        for field, value in attributes.items():
+            setattr(dim, field, value)
+        _apply_style(dim, style)
+
+
+def _apply_sheet_properties(sheet, layout):
+    # Copias por libro: la plantilla en memoria la comparten todas las exportaciones
+    for name, value in layout['sheet'].items():
+        setattr(sheet, name, copy.copy(value))
+    sheet.page_setup = PrintPageSetup(worksheet=sheet, **layout['page_setup'])
+    for cell_range in layout['merged_cells']:
+        sheet.merged_cells.add(cell_range)
+    _apply_dimensions(sheet.row_dimensions, layout['row_dimensions'])
+    _apply_dimensions(sheet.column_dimensions, layout['column_dimensions'])
+
+
+def _create_excel_fast(df_to_export, layout):
+    workbook = openpyxl.Workbook(write_only=True)
+    _register_styles(workbook, layout['default_font'])
+    sheet = workbook.create_sheet(layout['title'])
+    _apply_sheet_properties(sheet, layout)
+    if not df_to_export.empty:
+        # Como en el modo clásico, los anchos fijos solo se aplican si hay líneas
+        for letter, width in layout['fixed_widths'].items():
+            sheet.column_dimensions[letter].width = width
+    for sqref, rules in layout['conditional_formatting']:
+        for rule in rules:
+            sheet.conditional_formatting.add(sqref, copy.copy(rule))
+
+    header_row = [None] * layout['max_column']
+    for spec in layout['header']:
+        cell = WriteOnlyCell(sheet, value=spec['value'])
+        cell.font = spec['font']
+        cell.fill = spec['fill']
+        cell.border = spec['border']
+        cell.alignment = spec['alignment']
+        cell.protection = spec['protection']
+        cell.number_format = spec['number_format']
+        header_row[spec['column'] - 1] = cell
+    sheet.append(header_row)
+
+    if not df_to_export.empty:
+        df_final = _prepare_frame(df_to_export)
+        width = max((col['column'] for col in layout['structure']), default=0)
+        columns = []
+        for col_data in layout['structure']:
+            df_col_name = col_data['df_column']
+            if not df_col_name or df_col_name not in df_final.columns:
+                continue
+            if df_col_name in LEFT_ALIGNED_COLUMNS:
+                style = STYLE_LEFT
+            elif df_col_name in RIGHT_ALIGNED_COLUMNS:
+                style = STYLE_RIGHT
+            else:
+                style = STYLE_TEXT
+            numeric_style = STYLE_NUMBER if df_col_name in NUMERIC_COLUMNS else None
+            columns.append((
+                col_data['column'] - 1,
+                _column_values(df_final[df_col_name], df_col_name),
+                _styled_cell(sheet, style),
+                _styled_cell(sheet, numeric_style),
+            ))
+
+        # Cada fila se serializa al hacer append, así que las celdas con estilo se
+        # reutilizan fila tras fila cambiando solo su valor
+        for row_idx in range(len(df_final)):
+            row = [None] * width
+            for position, values, cell, numeric_cell in columns:
+                value = values[row_idx]
+                if numeric_cell is not None and isinstance(value, float):
+                    numeric_cell.value = value
+                    row[position] = numeric_cell
+                elif cell is not None:
+                    cell.value = value
+                    row[position] = cell
+                else:
+                    row[position] = value
+            sheet.append(row)
+
+    # Filas con formato de la plantilla más allá de los datos (el modo clásico las conserva)
+    last_row = max(layout['row_dimensions'], default=0)
+    for _ in range(len(df_to_export) + START_ROW, last_row + 1):
+        sheet.append([])
+
+    output_buffer = io.BytesIO()
+    try:
+        workbook.save(output_buffer)
+        output_buffer.seek(0)
+    except Exception as e:
+        raise ExportError(f"Error al guardar el archivo Excel: {e}") from e
+    return output_buffer
+
+
+# --- MODO CLÁSICO ---
+# Abre una copia de la plantilla (desde su contenido en memoria) y escribe celda por
+# celda sobre ella.
+
+def _create_excel_classic(df_to_export, layout):
+    workbook = openpyxl.load_workbook(io.BytesIO(layout['content']))
+    sheet = workbook.active
+    excel_template_structure = layout['structure']
+
+    max_rows = sheet.max_row
+    if max_rows >= START_ROW:
+        sheet.delete_rows(START_ROW, max_rows - START_ROW + 1)
+
+    if df_to_export.empty:
+        output_buffer = io.BytesIO()
+        workbook.save(output_buffer)
+        output_buffer.seek(0)
+        return output_buffer
+
+    df_final = _prepare_frame(df_to_export)
+
+    for row_idx, data_tuple in enumerate(df_final.itertuples(index=False), start=START_ROW):
+        for col_data in excel_template_structure:
+            excel_col_letter = col_data['letter']
+            df_col_name = col_data['df_column']
+            cell_value = None
+
+            if df_col_name and df_col_name in df_final.columns:
+                try:
+                    col_position_in_tuple = df_final.columns.get_loc(df_col_name)
+                    value = data_tuple[col_position_in_tuple]
+
+                    if pd.isna(value) or value == '':
+                        cell_value = ''
+                    elif df_col_name in DATE_COLUMNS:
+                        cell_value = str(value)
+                    elif df_col_name in NUMERIC_COLUMNS:
+                        try:
+                            numeric_value = convert_value_to_float(value)
+                            if numeric_value is not None:
+                                cell_value = numeric_value
+                                sheet[f"{excel_col_letter}{row_idx}"].number_format = NUMBER_FORMAT
+                            else:
+                                cell_value = str(value)
+                        except Exception:
+                            cell_value = str(value)
+                    else:
+                        cell_value = str(value)
+                except KeyError:
+                    cell_value = ''
+                except IndexError as ie:
+                    raise ExportError(f"Error de índice al acceder a la tupla para la columna '{df_col_name}' en la fila {row_idx}: {ie}. Data tuple length: {len(data_tuple)}, requested index: {col_position_in_tuple}") from ie
+
+            if cell_value is not None:
+                sheet[f"{excel_col_letter}{row_idx}"] = cell_value
+
+            if df_col_name in LEFT_ALIGNED_COLUMNS:
+                sheet[f"{excel_col_letter}{row_idx}"].alignment = Alignment(horizontal='left')
+            if df_col_name in RIGHT_ALIGNED_COLUMNS:
+                sheet[f"{excel_col_letter}{row_idx}"].alignment = Alignment(horizontal='right')
+
+    for col_letter, width in layout['fixed_widths'].items():
+        sheet.column_dimensions[col_letter].width = width
+
+    output_buffer = io.BytesIO()
+
+    try:
+        workbook.save(output_buffer)
+        output_buffer.seek(0)
+    except Exception as e:
+        raise ExportError(f"Error al guardar el archivo Excel: {e}") from e
+
+    return output_buffer
@@ -1,42 +1,68 @@
+import os
+from functools import lru_cache
 import streamlit as st
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import pandas as pd
 from datetime import datetime
 
+from local_sheet import LocalClient
+from history_search import scan
+from sheet_mirror import HISTORY
+from sheet_writer import SheetWriter
+
 SCOPE = [
     "https://spreadsheets.google.com/feeds",
     "https://www.googleapis.com/auth/drive"
 ]
 CREDS_FILE = "credentials.json"
 SPREADSHEET_NAME = "Mi Base de Datos de Creditos" 
+# Ruta de un CSV que reemplaza a Google Sheets (pruebas sin conexión, ver local_sheet.py)
+LOCAL_SHEET_PATH = os.environ.get('NOTAS_SHEETS_LOCAL')
+
+@lru_cache(maxsize=1)
+def _authorize():
+    # Un solo cliente por proceso, compartido con el hilo que envía las filas
+    if LOCAL_SHEET_PATH:
+        return LocalClient(LOCAL_SHEET_PATH)
+    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDS_FILE, SCOPE)
+    return gspread.authorize(creds)
+
+@lru_cache(maxsize=4)
+def history_worksheet(client):
+    # Abrir por nombre hace una búsqueda en Drive: la hoja se abre una vez por cliente
+    return client.open(SPREADSHEET_NAME).get_worksheet(0)
+
+# Cola de filas por enviar (sheet_writer); al enviarse se actualiza el espejo del historial
+WRITER = SheetWriter(lambda: history_worksheet(_authorize()), on_flush=HISTORY.invalidate)
 
 @st.cache_resource
 def connect_to_sheet():
     try:
-        creds = ServiceAccountCredentials.from_json_keyfile_name(CREDS_FILE, SCOPE)
-        client = gspread.authorize(creds)
+        client = _authorize()
+        # Envía las filas que quedaron pendientes de una ejecución anterior
+        WRITER.start()
         return client
     except Exception as e:
         st.error(f"Error de conexión con Google Sheets: {e}")
         st.info("Asegúrate de que el archivo 'credentials.json' esté en la misma carpeta y sea correcto.")
         return None
 
-@st.cache_data(ttl=300)
-def get_all_data(_client):
-    try:
-        spreadsheet = _client.open(SPREADSHEET_NAME)
-        worksheet = spreadsheet.get_worksheet(0)
-        all_data = worksheet.get_all_records()
-        if not all_data:
+def get_all_data(_client, force=False):
+    # El historial sale del espejo local (sheet_mirror); a la hoja solo se le piden
+    # las filas nuevas y como mucho una vez por intervalo de sincronización.
+    if force or HISTORY.due():
+        try:
+            HISTORY.sync(history_worksheet(_client), SPREADSHEET_NAME)
+        except gspread.exceptions.SpreadsheetNotFound:
+            st.error(f"No se encontró la Hoja de Cálculo llamada '{SPREADSHEET_NAME}'. Verifica el nombre y que esté compartida.")
             return pd.DataFrame()
-        return pd.DataFrame(all_data)
-    except gspread.exceptions.SpreadsheetNotFound:
-        st.error(f"No se encontró la Hoja de Cálculo llamada '{SPREADSHEET_NAME}'. Verifica el nombre y que esté compartida.")
-        return pd.DataFrame()
-    except Exception as e:
-        st.error(f"Error al leer los datos de Google Sheet: {e}")
-        return pd.DataFrame()
+        except Exception as e:
+            history_worksheet.cache_clear()
+            # Se sigue mostrando la última copia local del historial
+            st.error(f"Error al leer los datos de Google Sheet: {e}")
+    mostrar_rechazadas()
+    return HISTORY.frame()
 
 def guardar_en_sheet(df: pd.DataFrame, filename: str):
     client = connect_to_sheet()
@@ -44,35 +70,35 @@ def guardar_en_sheet(df: pd.DataFrame, filename: str):
         return
 
     try:
-        spreadsheet = client.open(SPREADSHEET_NAME)
-        worksheet = spreadsheet.get_worksheet(0)
-        
         df_to_save = df.copy()
         df_to_save['archivo_origen'] = filename
         df_to_save['fecha_procesado'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        header = worksheet.row_values(1) if worksheet.row_count > 0 else []
 
-        if not header:
-            worksheet.update([df_to_save.columns.values.tolist()], 'A1')
-
-        data_to_append = df_to_save.values.tolist()
-        if data_to_append:
-            worksheet.append_rows(data_to_append, value_input_option='USER_ENTERED')
-            st.cache_data.clear()
+        # Las filas quedan en la cola en disco y se envían en segundo plano, junto con
+        # las de otros tickets; al enviarse solo se invalida el espejo del historial.
+        WRITER.enqueue(df_to_save.columns.values.tolist(), df_to_save.values.tolist())
     except Exception as e:
         st.error(f"Error al guardar en Google Sheet: {e}")
+    mostrar_rechazadas()
+
+def mostrar_rechazadas():
+    # Lotes que la API rechazó por un error no temporal (ver sheet_writer)
+    estado = WRITER.status()
+    if estado['rechazadas']:
+        st.warning(f"{estado['rechazadas']} fila(s) no se pudieron guardar en Google Sheet "
+                   f"({estado['ultimo_rechazo']}). Quedaron en {estado['archivo_rechazadas']}.")
 
-def buscar_por_palabra_clave(df: pd.DataFrame, keyword: str) -> pd.DataFrame:
+def buscar_por_palabra_clave(df: pd.DataFrame, keyword: str, generacion=None) -> pd.DataFrame:
+    # generacion: HISTORY.generation leída antes de get_all_data, si df es ese historial.
+    # Mientras la hoja no se vuelva a copiar completa se busca con el índice
+    # (history_search); cualquier otro df se recorre con scan. Las dos dan las mismas filas.
     if df.empty or not keyword:
         return pd.DataFrame()
     
     try:
-        mask = (df['razon_social'].astype(str).str.contains(keyword, case=False, na=False) |
-                df['numero_factura'].astype(str).str.contains(keyword, case=False, na=False) |
-                df['portafolio'].astype(str).str.contains(keyword, case=False, na=False) |
-                df['archivo_origen'].astype(str).str.contains(keyword, case=False, na=False))
-        return df[mask]
+        if generacion is not None and generacion == HISTORY.generation:
+            return HISTORY.search(keyword, df)
+        return scan(df, keyword)
     except Exception as e:
         st.error(f"Error durante la búsqueda: {e}")
         return pd.DataFrame()
\ No newline at end of file
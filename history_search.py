@@ -0,0 +1,121 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# --- BÚSQUEDA EN EL HISTORIAL ---
+# En lugar de recorrer el historial con str.contains en cada búsqueda se indexan
+# los valores distintos de cada columna (clientes, archivos y portafolios se repiten
+# mucho) en una tabla FTS5 con tokenizador trigram, que encuentra subcadenas de 3+
+# caracteres sin recorrer la tabla. Cada fila guarda el código de su valor en cada
+# columna, así que pasar de los valores encontrados a las filas es una consulta por
+# código. El índice se extiende con las filas nuevas del historial; si el historial
+# se vuelve a copiar completo, se reconstruye.
+#
+# La búsqueda es la de siempre: la palabra clave completa como subcadena, sin
+# distinguir mayúsculas, en alguna de las columnas. scan() hace lo mismo recorriendo
+# las filas, para los DataFrame que no están indexados.
+
+SEARCH_COLUMNS = ['razon_social', 'numero_factura', 'portafolio', 'archivo_origen']
+# El tokenizador trigram solo usa el índice con términos de al menos 3 caracteres
+MIN_INDEXED_TERM = 3
+
+
+def _term(keyword):
+    return str(keyword).lower()
+
+
+def scan(frame, keyword, columns=SEARCH_COLUMNS):
+    """Filas de frame que contienen keyword en alguna de las columnas, sin índice."""
+    term = _term(keyword)
+    mask = np.zeros(len(frame), dtype=bool)
+    for col in columns:
+        if col in frame.columns:
+            mask |= frame[col].astype(str).str.lower().str.contains(term, regex=False, na=False).to_numpy()
+    return frame[mask]
+
+
+class SubstringIndex:
+    def __init__(self, columns=SEARCH_COLUMNS):
+        self.columns = list(columns)
+        self.rows = 0
+        self.key = None
+        self._conn = None
+        self._ids = {}
+        self._values = {}
+        self._codes = {}
+
+    def _reset(self, key):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self._conn.execute("CREATE VIRTUAL TABLE valores USING fts5(texto, tokenize='trigram')")
+        # Por columna: valor -> código, valores en orden de código y código de cada fila
+        self._ids = {col: {} for col in self.columns}
+        self._values = {col: [] for col in self.columns}
+        self._codes = {col: [] for col in self.columns}
+        self.rows = 0
+        self.key = key
+
+    def update(self, frame, key=None):
+        """Indexa las filas de frame que faltan; key identifica la copia del historial (otra key = reconstruir)."""
+        if self._conn is None or key != self.key or len(frame) < self.rows:
+            self._reset(key)
+        new = frame.iloc[self.rows:]
+        if new.empty:
+            return
+        width = len(self.columns)
+        inserts = []
+        for position, col in enumerate(self.columns):
+            if col not in new.columns:
+                continue
+            # Sin valor (NaN con pandas 3) queda vacío: no coincide con nada, como en scan
+            codes, uniques = pd.factorize(new[col].astype(str).str.lower().fillna(''))
+            ids, values = self._ids[col], self._values[col]
+            local = np.empty(len(uniques), dtype=np.int32)
+            for i, value in enumerate(uniques.tolist()):
+                code = ids.get(value)
+                if code is None:
+                    code = ids[value] = len(values)
+                    values.append(value)
+                    # rowid de la tabla = código del valor * columnas + posición de la columna
+                    inserts.append((code * width + position, value))
+                local[i] = code
+            self._codes[col].append(local[codes])
+        with self._conn:
+            self._conn.executemany('INSERT INTO valores (rowid, texto) VALUES (?, ?)', inserts)
+        self.rows = len(frame)
+
+    def _value_hits(self, term):
+        """Por columna, qué valores distintos contienen el término."""
+        hits = {col: np.zeros(len(values), dtype=bool) for col, values in self._values.items()}
+        if len(term) >= MIN_INDEXED_TERM:
+            query = '"' + term.replace('"', '""') + '"'
+            rowids = np.fromiter((rowid for (rowid,) in self._conn.execute(
+                'SELECT rowid FROM valores WHERE valores MATCH ?', (query,))), dtype=np.int64)
+            width = len(self.columns)
+            for position, col in enumerate(self.columns):
+                hits[col][rowids[rowids % width == position] // width] = True
+        else:
+            # Términos cortos: se recorren los valores distintos, no las filas
+            for col, values in self._values.items():
+                hits[col] = np.fromiter((term in value for value in values), dtype=bool, count=len(values))
+        return hits
+
+    def search(self, keyword):
+        """Posiciones (en orden) de las filas que contienen keyword en alguna de las columnas (como scan)."""
+        term = _term(keyword)
+        if not term or self._conn is None:
+            return np.array([], dtype=np.int64)
+        codes = {}
+        for col, parts in self._codes.items():
+            if parts:
+                if len(parts) > 1:
+                    self._codes[col] = parts = [np.concatenate(parts)]
+                codes[col] = parts[0]
+
+        mask = np.zeros(self.rows, dtype=bool)
+        for col, hit in self._value_hits(term).items():
+            if col in codes and hit.any():
+                mask |= hit[codes[col]]
+        return np.flatnonzero(mask)
@@ -0,0 +1,332 @@
+import csv
+import io
+import os
+import time
+
+import openpyxl
+import pandas as pd
+
+from amounts import AMOUNT_COLUMN, add_amount_column
+
+# --- MOTORES OPCIONALES ---
+# pyarrow lee CSV en paralelo y en C; python-calamine lee xlsx/xls en Rust.
+# Si no están instalados se usa pandas (motor C para CSV, openpyxl/xlrd para Excel).
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pc = None
+    pa_csv = None
+
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = None
+
+SNIFF_BYTES = 64 * 1024
+CSV_DELIMITERS = [',', ';', '\t', '|']
+
+XLSX_MAGIC = b'PK\x03\x04'
+XLS_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+# Columnas de texto con a lo sumo esta proporción de valores distintos pasan a category
+CATEGORY_MAX_RATIO = 0.5
+
+# Filas por bloque en la lectura por bloques (archivos más grandes que la memoria)
+CHUNK_ROWS = 100_000
+
+
+class IngestError(Exception):
+    pass
+
+
+def _open_source(source):
+    """Devuelve (file_obj, debe_cerrarse). Acepta ruta o archivo binario (UploadedFile, BytesIO)."""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb'), True
+    source.seek(0)
+    return source, False
+
+
+def _decode_head(head):
+    # Se descarta la última línea, que puede venir cortada a mitad de un carácter
+    if b'\n' in head:
+        head = head[:head.rfind(b'\n') + 1]
+    for encoding in ('utf-8-sig', 'cp1252'):
+        try:
+            return head.decode(encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    return head.decode('latin-1'), 'latin-1'
+
+
+def sniff_format(head):
+    if head.startswith(XLSX_MAGIC):
+        return 'xlsx'
+    if head.startswith(XLS_MAGIC):
+        return 'xls'
+    return 'csv'
+
+
+def sniff_delimiter(text):
+    # Solo se miran las primeras líneas completas (la última puede venir cortada)
+    lines = [line for line in text.splitlines()[:20] if line.strip()]
+    if not lines:
+        return ','
+    sample = '\n'.join(lines)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=''.join(CSV_DELIMITERS)).delimiter
+    except csv.Error:
+        pass
+    # Fallback: el separador que más aparece en la cabecera
+    header = lines[0]
+    counts = {d: header.count(d) for d in CSV_DELIMITERS}
+    best = max(counts, key=counts.get)
+    return best if counts[best] > 0 else ','
+
+
+def _read_csv_arrow(f, sep, encoding):
+    # pyarrow omite el BOM por sí mismo; otras codificaciones se transcodifican
+    encoding = 'utf8' if encoding == 'utf-8-sig' else encoding
+    read_options = pa_csv.ReadOptions(encoding=encoding, block_size=8 * 1024 * 1024)
+    parse_options = pa_csv.ParseOptions(delimiter=sep)
+    # Se lee la cabecera aparte para forzar todas las columnas a texto (igual que dtype=str)
+    header_table = pa_csv.read_csv(
+        io.BytesIO(_first_line(f)), read_options=pa_csv.ReadOptions(encoding=encoding), parse_options=parse_options
+    )
+    names = header_table.column_names
+    if len(set(names)) != len(names):
+        raise IngestError("Cabeceras duplicadas")
+    f.seek(0)
+    convert_options = pa_csv.ConvertOptions(
+        column_types={name: pa.string() for name in names},
+        strings_can_be_null=True,
+    )
+    table = pa_csv.read_csv(f, read_options=read_options, parse_options=parse_options, convert_options=convert_options)
+    # Limpieza de espacios sobre los buffers de Arrow, antes de crear objetos de Python
+    columns = [pc.utf8_trim_whitespace(col) for col in table.columns]
+    names = [name.strip() for name in table.column_names]
+    return pa.Table.from_arrays(columns, names=names).to_pandas()
+
+
+def _first_line(f):
+    f.seek(0)
+    line = f.readline()
+    f.seek(0)
+    return line
+
+
+def _read_csv_pandas(f, sep, encoding):
+    return pd.read_csv(f, sep=sep, dtype=str, encoding=encoding, engine='c')
+
+
+def _read_excel(f, file_format):
+    engine = EXCEL_ENGINE
+    if engine is None:
+        engine = 'openpyxl' if file_format == 'xlsx' else None
+    return pd.read_excel(f, dtype=str, engine=engine)
+
+
+def strip_frame(df):
+    df.columns = df.columns.astype(str).str.strip()
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        df[col] = df[col].str.strip()
+    return df
+
+
+def compact_frame(df):
+    """
+    Convierte a category las columnas de texto con pocos valores distintos (códigos de
+    cliente, material, clase de factura, organización, unidad...). Los códigos
+    numéricos se dejan como texto: llevan ceros a la izquierda y se comparan como texto.
+    """
+    rows = len(df)
+    if rows == 0:
+        return df
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        if col == AMOUNT_COLUMN:
+            continue
+        codes, uniques = pd.factorize(df[col])
+        if len(uniques) <= rows * CATEGORY_MAX_RATIO:
+            df[col] = pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=object))
+    return df
+
+
+def _cell_text(value):
+    # Igual que read_excel(dtype=str) con openpyxl: los enteros guardados como float van sin '.0'
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _iter_xlsx_chunks(f, chunk_rows):
+    workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = [f"Unnamed: {i}" if name is None else str(name) for i, name in enumerate(header)]
+        width = len(names)
+        batch = []
+        for row in rows:
+            values = [_cell_text(v) for v in row[:width]]
+            if not any(values):
+                continue
+            batch.append(values + [None] * (width - len(values)))
+            if len(batch) >= chunk_rows:
+                yield strip_frame(pd.DataFrame(batch, columns=names, dtype=object))
+                batch = []
+        if batch:
+            yield strip_frame(pd.DataFrame(batch, columns=names, dtype=object))
+    finally:
+        workbook.close()
+
+
+def _iter_csv_arrow_chunks(f, sep, encoding, chunk_rows):
+    # Lector incremental de pyarrow: bloques de bytes que se juntan hasta chunk_rows filas
+    encoding = 'utf8' if encoding == 'utf-8-sig' else encoding
+    parse_options = pa_csv.ParseOptions(delimiter=sep)
+    header_table = pa_csv.read_csv(
+        io.BytesIO(_first_line(f)), read_options=pa_csv.ReadOptions(encoding=encoding), parse_options=parse_options
+    )
+    names = header_table.column_names
+    if len(set(names)) != len(names):
+        raise IngestError("Cabeceras duplicadas")
+    f.seek(0)
+    reader = pa_csv.open_csv(
+        f,
+        read_options=pa_csv.ReadOptions(encoding=encoding, block_size=4 * 1024 * 1024),
+        parse_options=parse_options,
+        convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in names}, strings_can_be_null=True),
+    )
+    stripped_names = [name.strip() for name in names]
+    batches = []
+    rows = 0
+    for batch in reader:
+        batches.append(batch)
+        rows += batch.num_rows
+        if rows >= chunk_rows:
+            yield _batches_to_frame(batches, stripped_names)
+            batches = []
+            rows = 0
+    if batches:
+        yield _batches_to_frame(batches, stripped_names)
+
+
+def _batches_to_frame(batches, names):
+    table = pa.Table.from_batches(batches)
+    columns = [pc.utf8_trim_whitespace(col) for col in table.columns]
+    return pa.Table.from_arrays(columns, names=names).to_pandas()
+
+
+def iter_table_chunks(source, chunk_rows=CHUNK_ROWS):
+    """
+    Lee el extracto por bloques de chunk_rows filas, como texto sin espacios
+    sobrantes y sin la columna de monto. CSV con el lector incremental de pyarrow
+    (o el de pandas si no está instalado) y xlsx fila a fila con openpyxl en modo solo lectura; un .xls no admite lectura
+    por filas y se entrega como un único bloque.
+    """
+    f, should_close = _open_source(source)
+    try:
+        head = f.read(SNIFF_BYTES)
+        f.seek(0)
+        if not head:
+            raise IngestError("El archivo está vacío.")
+
+        file_format = sniff_format(head)
+        if file_format == 'xlsx':
+            yield from _iter_xlsx_chunks(f, chunk_rows)
+        elif file_format == 'xls':
+            yield strip_frame(_read_excel(f, file_format))
+        else:
+            text, encoding = _decode_head(head)
+            sep = sniff_delimiter(text)
+            if pa_csv is not None:
+                yield from _iter_csv_arrow_chunks(f, sep, encoding, chunk_rows)
+            else:
+                reader = pd.read_csv(f, sep=sep, dtype=str, encoding=encoding, engine='c', chunksize=chunk_rows)
+                with reader:
+                    for chunk in reader:
+                        yield strip_frame(chunk)
+    except IngestError:
+        raise
+    except Exception as e:
+        raise IngestError(str(e)) from e
+    finally:
+        if should_close:
+            f.close()
+
+
+def memory_mb(df):
+    return float(df.memory_usage(index=True, deep=True).sum()) / 2**20
+
+
+def read_table(source):
+    """
+    Lee un extracto SAP (xlsx, xls o CSV) detectando formato y separador con los
+    primeros bytes, en una sola pasada. Devuelve (df, stats) con todas las columnas
+    como texto sin espacios sobrantes (las de pocos valores distintos como category),
+    más la columna numérica AMOUNT_COLUMN.
+    """
+    f, should_close = _open_source(source)
+    try:
+        start = time.perf_counter()
+        head = f.read(SNIFF_BYTES)
+        f.seek(0)
+        if not head:
+            raise IngestError("El archivo está vacío.")
+
+        file_format = sniff_format(head)
+        sep = None
+        engine = None
+
+        if file_format in ('xlsx', 'xls'):
+            engine = EXCEL_ENGINE or 'pandas'
+            df = strip_frame(_read_excel(f, file_format))
+        else:
+            text, encoding = _decode_head(head)
+            sep = sniff_delimiter(text)
+            df = None
+            if pa_csv is not None:
+                try:
+                    df = _read_csv_arrow(f, sep, encoding)
+                    engine = 'pyarrow'
+                except Exception:
+                    f.seek(0)
+                    df = None
+            if df is None:
+                engine = 'pandas'
+                df = strip_frame(_read_csv_pandas(f, sep, encoding))
+
+        amount_col = add_amount_column(df)
+        memory_before = memory_mb(df)
+        df = compact_frame(df)
+        memory_after = memory_mb(df)
+        elapsed = time.perf_counter() - start
+    except IngestError:
+        raise
+    except Exception as e:
+        raise IngestError(str(e)) from e
+    finally:
+        if should_close:
+            f.close()
+
+    rows = len(df)
+    stats = {
+        'formato': file_format,
+        'separador': sep,
+        'motor': engine,
+        'columna_monto': amount_col,
+        'filas': rows,
+        'segundos': elapsed,
+        'filas_por_seg': rows / elapsed if elapsed > 0 else float(rows),
+        'memoria_texto_mb': memory_before,
+        'memoria_mb': memory_after,
+    }
+    return df, stats
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+from amounts import AMOUNT_COLUMN
+
+# --- ÍNDICE CLIENTE -> PRODUCTO -> FILAS ---
+# Se construye una sola vez por archivo (y portafolio) sobre las líneas ya filtradas
+# por clase de factura. Guarda las etiquetas de fila de cada cliente, de cada
+# producto y de cada par cliente/producto, además del total por factura, para que
+# consultar un cliente recorra solo sus líneas y no el extracto completo.
+
+
+class InvoiceIndex:
+    def __init__(self, df, col_cliente, col_producto, col_factura, key=None):
+        self.key = key
+        self.col_factura = col_factura
+        # Tabla de find_invoice_references, la asigna quien construye el índice
+        self.references = None
+        labels = df.index.to_numpy()
+
+        clientes = df[col_cliente]
+        productos = df[col_producto].astype(str) if col_producto in df.columns else pd.Series('', index=df.index)
+
+        self._by_client = self._group_labels(clientes, labels)
+        self._by_product = self._group_labels(productos, labels)
+        self._by_invoice = self._group_labels(df[col_factura], labels)
+        self._by_client_product = {
+            pair: labels[positions]
+            for pair, positions in df.groupby([clientes, productos], sort=False, observed=True).indices.items()
+        }
+
+        amounts = df[AMOUNT_COLUMN] if AMOUNT_COLUMN in df.columns else pd.Series(np.nan, index=df.index)
+        self._client_invoice_totals = amounts.groupby([clientes, df[col_factura]], observed=True).sum()
+        self._invoice_totals = amounts.groupby(df[col_factura], observed=True).sum()
+
+    @staticmethod
+    def _group_labels(values, labels):
+        return {key: labels[positions] for key, positions in values.groupby(values, sort=False, observed=True).indices.items()}
+
+    def rows_for(self, clients=None, products=None):
+        """Etiquetas de fila (en orden del archivo) de los clientes/productos pedidos; None = todas."""
+        if clients and products:
+            parts = [self._by_client_product.get((c, p)) for c in clients for p in products]
+        elif clients:
+            parts = [self._by_client.get(c) for c in clients]
+        elif products:
+            parts = [self._by_product.get(p) for p in products]
+        else:
+            return None
+        parts = [p for p in parts if p is not None]
+        if not parts:
+            return np.array([], dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def rows_for_invoices(self, invoices):
+        """Etiquetas de fila (en orden del archivo) de las facturas pedidas."""
+        parts = [self._by_invoice[inv] for inv in invoices if inv in self._by_invoice]
+        if not parts:
+            return np.array([], dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def invoice_totals(self, clients=None):
+        """Total precalculado por factura de los clientes pedidos (de todas las líneas si no se indican)."""
+        if not clients:
+            return self._invoice_totals
+        present = [c for c in clients if c in self._by_client]
+        if not present:
+            return pd.Series(dtype='float64')
+        subset = self._client_invoice_totals.loc[present]
+        return subset.groupby(level=1, observed=True).sum()
+
+
+def take_rows(df, labels):
+    """Filas de df con esas etiquetas (las que sigan presentes), en el orden de df."""
+    if labels is None:
+        return df
+    positions = df.index.get_indexer(labels)
+    return df.take(np.sort(positions[positions >= 0]))
+
+
+# --- REFERENCIAS CRUZADAS ENTRE FACTURAS ---
+# Una factura cuyo número aparece en otra línea del extracto (p. ej. en un texto de
+# referencia de una NC previa) se excluye. Los números de 7+ dígitos se comparan sin
+# ceros a la izquierda.
+
+REFERENCE_PATTERN = r'(\d{7,})'
+
+
+def normalize_invoice_numbers(invoices):
+    """Clave normalizada de cada número de factura: solo dígitos, sin ceros a la izquierda."""
+    digits = invoices.str.replace(r'\D', '', regex=True).str.lstrip('0')
+    return digits.where(digits != '', invoices.str.strip())
+
+
+def find_invoice_references(df, col_factura, columns):
+    """
+    Tabla (label, original) con cada línea que menciona el número de otra factura
+    del extracto. Se calcula una vez por archivo; la exclusión de cada rerun solo
+    filtra esta tabla por las líneas que sigan vigentes.
+    """
+    row_invoices = df[col_factura].astype(str).str.strip()
+    originals = pd.Series(row_invoices.unique())
+    invoice_keys = pd.DataFrame({'norm': normalize_invoice_numbers(originals), 'original': originals})
+
+    labels = df.index.to_numpy()
+    found = []
+    for col in columns:
+        # Cada valor distinto se analiza una sola vez (códigos de cliente, material, etc. se repiten mucho)
+        codes, uniques = pd.factorize(df[col].astype(str))
+        uniques = pd.Series(uniques)
+        candidates = uniques[uniques.str.contains(r'\d{7}', regex=True, na=False)]
+        if candidates.empty:
+            continue
+        matches = candidates.str.extractall(REFERENCE_PATTERN)[0]
+        per_value = pd.DataFrame({
+            'code': matches.index.get_level_values(0),
+            'norm': matches.str.lstrip('0').to_numpy(),
+        })
+        rows = np.flatnonzero(np.isin(codes, per_value['code'].unique()))
+        per_row = pd.DataFrame({'label': labels[rows], 'code': codes[rows]})
+        found.append(per_row.merge(per_value, on='code')[['label', 'norm']])
+
+    if not found:
+        return pd.DataFrame({'label': pd.Series(dtype=df.index.dtype), 'original': pd.Series(dtype=object)})
+
+    mentions = pd.concat(found, ignore_index=True).drop_duplicates()
+    mentions = mentions[mentions['norm'].isin(invoice_keys['norm'])]
+    refs = mentions.merge(invoice_keys, on='norm')[['label', 'original']]
+    own_invoice = row_invoices.loc[refs['label']].to_numpy()
+    return refs[refs['original'].to_numpy() != own_invoice].drop_duplicates().reset_index(drop=True)
+
+
+def referenced_invoices(references, alive_labels=None):
+    """Facturas referenciadas por las líneas vigentes (todas si alive_labels es None)."""
+    if alive_labels is not None:
+        references = references[references['label'].isin(alive_labels)]
+    return set(references['original'])
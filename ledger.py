@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from amounts import AMOUNT_COLUMN, convert_series_to_float
+
+# --- LIBRO DE SALDOS CONSUMIDOS POR LOS TICKETS APILADOS ---
+# dict factura -> monto ya asignado en tickets de la sesión. Se actualiza al pulsar
+# "Añadir Ticket" y en cada rerun solo se tocan las líneas de esas facturas. En
+# tab1 se usa lo acreditado en el historial local más los tickets de la sesión que
+# no llegaron a registrarse (history_ledger).
+
+TICKET_INVOICE_COLUMN = 'ASIGNACION'
+TICKET_AMOUNT_COLUMN = 'Monto NC Asignado'
+MIN_BALANCE = 0.01
+
+
+def add_ticket_to_ledger(ledger, ticket_df, col_factura=TICKET_INVOICE_COLUMN):
+    inv_col_name = TICKET_INVOICE_COLUMN if TICKET_INVOICE_COLUMN in ticket_df.columns else col_factura
+    if inv_col_name not in ticket_df.columns or TICKET_AMOUNT_COLUMN not in ticket_df.columns:
+        return ledger
+    amounts = convert_series_to_float(ticket_df[TICKET_AMOUNT_COLUMN])
+    valid = amounts.notna() & (amounts != 0)
+    invoices = ticket_df[inv_col_name].astype(str).str.strip()
+    for inv_id, used in amounts[valid].groupby(invoices[valid]).sum().items():
+        ledger[inv_id] = ledger.get(inv_id, 0.0) + float(used)
+    return ledger
+
+
+def build_ledger(stacked_tickets, col_factura):
+    ledger = {}
+    for ticket_df in stacked_tickets:
+        add_ticket_to_ledger(ledger, ticket_df, col_factura)
+    return ledger
+
+
+def history_ledger(consumed, invoices, unrecorded=None):
+    """
+    Libro de las facturas del extracto con lo ya acreditado en el historial del
+    portafolio (consumed: Serie factura -> monto, ver credit_store) más lo de los
+    tickets de la sesión que no se pudieron registrar (unrecorded). Los tickets
+    registrados ya están en consumed y no se vuelven a sumar.
+    """
+    ledger = {}
+    if consumed is not None and len(consumed):
+        found = consumed[consumed.index.isin(invoices) & (consumed.to_numpy() > 0)]
+        ledger = dict(zip(found.index.tolist(), found.tolist()))
+    for inv_id, used in (unrecorded or {}).items():
+        ledger[inv_id] = ledger.get(inv_id, 0.0) + used
+    return ledger
+
+
+def apply_ledger(df, col_factura, ledger, labels=None):
+    """
+    Descuenta lo consumido de cada factura repartiéndolo entre sus líneas en orden
+    (cada línea absorbe hasta su monto y el resto pasa a la siguiente) y quita las
+    líneas que quedan sin saldo. labels: filas de las facturas del libro, si ya se
+    conocen por el índice; si no, se buscan en df.
+    """
+    if not ledger:
+        return df
+    if labels is None:
+        touched = df[col_factura].astype(str).str.strip().isin(ledger.keys()).to_numpy()
+        positions = np.flatnonzero(touched)
+    else:
+        positions = df.index.get_indexer(labels)
+        positions = np.sort(positions[positions >= 0])
+
+    # Solo se copia la columna de montos; el resto del extracto no se duplica
+    amounts = df[AMOUNT_COLUMN].to_numpy(dtype='float64', copy=True)
+    if positions.size:
+        invoices = df[col_factura].iloc[positions].astype(str).str.strip().to_numpy()
+        values = amounts[positions]
+        filled = np.nan_to_num(values, nan=0.0)
+        # Consumo acumulado de las líneas anteriores de la misma factura
+        consumed_before = pd.Series(filled).groupby(invoices).cumsum().to_numpy() - filled
+        remaining = pd.Series(invoices).map(ledger).to_numpy(dtype='float64') - consumed_before
+        # Una vez agotado el consumo no se sigue descontando en la factura, aunque una
+        # línea negativa posterior vuelva a subir el saldo pendiente
+        exhausted = pd.Series(remaining <= MIN_BALANCE).groupby(invoices).cummax().to_numpy(dtype=bool)
+        amounts[positions] = np.where(exhausted, values, np.maximum(values - remaining, 0.0))
+    keep = amounts > MIN_BALANCE
+    return df[keep].assign(**{AMOUNT_COLUMN: amounts[keep]})
@@ -0,0 +1,147 @@
+import csv
+import os
+import re
+import threading
+
+# --- HOJA DE CÁLCULO LOCAL (SUSTITUTO DE GOOGLE SHEETS) ---
+# Implementa la parte de la API de gspread que usa google_sheets_db sobre una
+# lista de filas en memoria, guardada en un CSV si se indica una ruta. Sirve para
+# probar la sincronización del historial sin conexión ni credenciales: se activa
+# con la variable de entorno NOTAS_SHEETS_LOCAL=<ruta.csv>. Cuenta las llamadas
+# en .requests para comprobar cuántas consultas haría contra la API real.
+
+DEFAULT_ROW_COUNT = 1000
+
+_RANGE_PATTERN = re.compile(r'^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$')
+
+
+def column_letter(number):
+    """Letra de la columna (1 -> A, 27 -> AA)."""
+    letters = ''
+    while number > 0:
+        number, rest = divmod(number - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number
+
+
+def _parse_range(a1):
+    """(fila inicial, fila final, columna inicial, columna final) en base 1; None = sin límite."""
+    match = _RANGE_PATTERN.match(a1.split('!')[-1].upper())
+    if not match:
+        raise ValueError(f"Rango no soportado: {a1}")
+    col_start, row_start, col_end, row_end = match.groups()
+    if col_end is None and row_end is None:
+        col_end, row_end = col_start, row_start
+    return (int(row_start) if row_start else 1, int(row_end) if row_end else None,
+            _column_number(col_start) if col_start else 1, _column_number(col_end) if col_end else None)
+
+
+def _cell(value):
+    return '' if value is None else str(value)
+
+
+def _trim(row):
+    # La API no devuelve las celdas vacías del final de cada fila
+    end = len(row)
+    while end and row[end - 1] == '':
+        end -= 1
+    return row[:end]
+
+
+class LocalWorksheet:
+    def __init__(self, path=None):
+        self.path = path
+        self.requests = 0
+        self._rows = []
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, newline='', encoding='utf-8') as f:
+                self._rows = [list(row) for row in csv.reader(f)]
+
+    @property
+    def row_count(self):
+        return max(len(self._rows), DEFAULT_ROW_COUNT)
+
+    def _save(self):
+        if self.path:
+            with open(self.path, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(self._rows)
+
+    def _values(self, a1):
+        row_start, row_end, col_start, col_end = _parse_range(a1)
+        rows = self._rows[row_start - 1:row_end]
+        values = [_trim(row[col_start - 1:col_end]) for row in rows]
+        # Igual que la API: sin filas vacías al final del rango
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def row_values(self, row):
+        with self._lock:
+            self.requests += 1
+            return _trim(self._rows[row - 1]) if row <= len(self._rows) else []
+
+    def get(self, range_name):
+        with self._lock:
+            self.requests += 1
+            return self._values(range_name)
+
+    def batch_get(self, ranges):
+        with self._lock:
+            self.requests += 1
+            return [self._values(a1) for a1 in ranges]
+
+    def get_all_values(self):
+        with self._lock:
+            self.requests += 1
+            rows = self._values('A1:')
+            width = max((len(row) for row in rows), default=0)
+            return [row + [''] * (width - len(row)) for row in rows]
+
+    def update(self, values, range_name='A1', **kwargs):
+        with self._lock:
+            self.requests += 1
+            row_start, _, col_start, _ = _parse_range(range_name)
+            for offset, new_row in enumerate(values):
+                index = row_start - 1 + offset
+                while len(self._rows) <= index:
+                    self._rows.append([])
+                row = self._rows[index]
+                end = col_start - 1 + len(new_row)
+                row.extend([''] * max(0, end - len(row)))
+                row[col_start - 1:end] = [_cell(v) for v in new_row]
+            self._save()
+
+    def append_rows(self, values, value_input_option='RAW', **kwargs):
+        with self._lock:
+            self.requests += 1
+            # Como en Sheets, se agrega después de la última fila con datos
+            while self._rows and not _trim(self._rows[-1]):
+                self._rows.pop()
+            self._rows.extend([_cell(v) for v in row] for row in values)
+            self._save()
+
+
+class LocalSpreadsheet:
+    def __init__(self, path=None):
+        self.sheet1 = LocalWorksheet(path)
+
+    def get_worksheet(self, index):
+        return self.sheet1 if index == 0 else None
+
+
+class LocalClient:
+    """Sustituto de gspread.Client: open() devuelve siempre la misma hoja local."""
+
+    def __init__(self, path=None):
+        self.spreadsheet = LocalSpreadsheet(path)
+
+    def open(self, title):
+        return self.spreadsheet
@@ -0,0 +1,511 @@
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from amounts import AMOUNT_COLUMN, add_amount_column, convert_series_to_float, format_monto_local
+from column_resolver import resolve_columns
+from coverage import DEFAULT_SOLVER_MODE, select_invoices
+from invoice_index import InvoiceIndex, take_rows, find_invoice_references, referenced_invoices
+from ledger import apply_ledger
+
+# Copy-on-write (por defecto desde pandas 3): filtrar o agregar columnas no obliga
+# a copiar el extracto completo para protegerlo de modificaciones posteriores
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# --- MOTOR DE NOTAS DE CRÉDITO ---
+# Etapas del cálculo sin dependencias de Streamlit, para usarlas desde la app y
+# desde la línea de comandos: detectar columnas -> preparar líneas (clases
+# permitidas) -> índice -> descontar tickets apilados y facturas referenciadas ->
+# cobertura del monto o consulta -> completar las columnas del ticket.
+
+NCF_MAPPING = {
+    "Diferencia en Precio": "NCF.1",
+    "Descuento no Reflejado": "NCF.2",
+    "Promoción / Sell Out / Reconocimiento": "NCF.3",
+    "Grand Slam": "NCF.4",
+    "Avisos / Cabezales / Publicidad": "NCF.5",
+    "Anulación documento": "NCF.6"
+}
+
+PORTFOLIO_ACRONYM_MAP = {
+    '0700': 'APC',
+    'R100': 'PCV',
+    'C001': 'CYM',
+    '0600': 'EFE',
+    '--': 'SIN_PORTAFOLIO'
+}
+
+ALLOWED_INVOICE_CLASSES = {
+    '0700': ['ZSPN', 'X|', 'ZSCC'],
+    'R100': ['YP01', 'YP04', 'YP10'],
+    'C001': ['YC00'],
+    '0600': ['ZSPN', 'ZSCC'],
+}
+
+PORTFOLIO_DEFAULTS = {
+    'R100': {
+        'Clase de pedido': 'YNCR',
+        'Organizacion de Venta': 'R200',
+        'Canal de Distribucion': 'FB',
+        'Sector': 'E2',
+        'CONDICION': 'YLIQ'
+    },
+    'C001': {
+        'Clase de pedido': 'ZCDF',
+        'Organizacion de Venta': 'C001',
+        'Canal de Distribucion': 'FB',
+        'Sector': 'E2',
+        'CONDICION': 'ZXAM'
+    },
+    '0700': {
+        'Clase de pedido': 'Z1MA',
+        'Organizacion de Venta': '0702',
+        'Canal de Distribucion': 'FB',
+        'Sector': 'E2',
+        'CONDICION': 'ZNOT'
+    },
+    '0600': {
+        'Clase de pedido': 'Z1MA',
+        'Organizacion de Venta': '0602',
+        'Canal de Distribucion': 'FB',
+        'Sector': 'E2',
+        'CONDICION': 'ZNOT'
+    },
+}
+
+TEMPLATE_CONDICION = 'ZNOT'
+DEFAULT_ASSIGNMENT_MODE = 'Prorrateo (Recomendado)'
+DUMMY_PRODUCT_COLUMN = 'Material_Dummy'
+DATE_COLUMNS = ["Fecha de Pedido", "Fecha de Precio", "Fecha de Factura"]
+
+
+class NCError(Exception):
+    """Solicitud que no se puede procesar; el mensaje se muestra tal cual al usuario."""
+
+
+class CoverageError(NCError):
+    """Las facturas disponibles no alcanzan para cubrir el monto de la NC."""
+
+    def __init__(self, available_amount):
+        self.available_amount = available_amount
+        super().__init__(f"Error de Cobertura: {format_monto_local(available_amount)}")
+
+
+# --- FUNCIONES AUXILIARES ---
+
+def clean_leading_zeros(code_str):
+    if pd.isna(code_str) or code_str is None:
+        return ''
+    code_str = str(code_str).strip()
+    if not code_str:
+        return ''
+    return code_str.lstrip('0')
+
+def clean_input_codes(input_raw):
+    """
+    MODIFICADO PARA SAP: Permite saltos de línea (al pegar desde Excel),
+    espacios, tabulaciones y comas.
+    """
+    if not input_raw:
+        return []
+    # Usamos regex para reconocer cualquier separador de espacio/línea o comas
+    codes = re.split(r'[\n\r\s,;]+', input_raw)
+    cleaned_codes = [clean_leading_zeros(c.strip()) for c in codes if c.strip()]
+    return list(set([c for c in cleaned_codes if c]))
+
+# --- DETECCIÓN DEL PORTAFOLIO ---
+# Se mira primero una muestra repartida por todo el extracto: si en ella aparece
+# el portafolio de mayor prioridad de la lista se decide sin recorrer la columna,
+# porque ninguna fila fuera de la muestra puede cambiar el resultado. En cualquier
+# otro caso (otro portafolio, o ninguno) se revisan todos los valores con la
+# prioridad de siempre. En columnas category los valores distintos ya son las
+# categorías.
+
+PORTFOLIO_SAMPLE_ROWS = 20_000
+
+
+def _has_code(*codes):
+    codes = set(codes)
+    return lambda values: not codes.isdisjoint(values)
+
+
+def _has_text(*words):
+    return lambda values: any(all(w in v for w in words) for v in values)
+
+
+# (portafolio, condición sobre los valores distintos) en orden de prioridad
+ORG_VENTA_RULES = [
+    ('0700', _has_code('0702', '702')),
+    ('0600', _has_code('0602', '602')),
+    ('R100', _has_code('R200')),
+    ('C001', _has_code('C001')),
+]
+SOCIEDAD_RULES = [
+    ('0700', _has_text('alimentos', 'polar')),
+    ('R100', _has_text('pepsi')),
+    ('C001', _has_text('cervecer')),
+    ('0600', _has_text('efe')),
+]
+CLASE_FACTURA_RULES = [
+    ('R100', _has_code('YP01', 'YP04', 'YP10')),
+    ('C001', _has_code('YC00')),
+    ('0700', _has_code('ZSPN', 'X|', 'ZSCC')),
+]
+
+
+def _distinct_text(series, sample):
+    """(valores distintos como texto sin espacios, si son todos los de la columna)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Solo las categorías que aparecen (un subconjunto puede arrastrar categorías sin uso)
+        codes = series.cat.codes.to_numpy()
+        used = series.cat.categories.take(np.unique(codes[codes >= 0]))
+        return set(pd.Series(used, dtype=object).astype(str).str.strip()), True
+    if sample and len(series) > PORTFOLIO_SAMPLE_ROWS:
+        series = series.iloc[::len(series) // PORTFOLIO_SAMPLE_ROWS]
+        return set(series.astype(str).str.strip().unique()), False
+    return set(series.astype(str).str.strip().unique()), True
+
+
+def _match_portfolio(series, normalize, rules):
+    values, complete = _distinct_text(series, sample=True)
+    found = [portfolio for portfolio, present in rules if present(normalize(values))]
+    if not complete and found[:1] != [rules[0][0]]:
+        values, _ = _distinct_text(series, sample=False)
+        found = [portfolio for portfolio, present in rules if present(normalize(values))]
+    return found[0] if found else None
+
+
+def _org_values(values):
+    upper = {v.upper() for v in values}
+    return upper | {clean_leading_zeros(v) for v in upper}
+
+
+def detect_portfolio_code(df):
+    roles = resolve_columns(df.columns)
+    strategies = [
+        # ESTRATEGIA 1: Buscar por columna "Organización de Ventas"
+        (roles['org_venta'], _org_values, ORG_VENTA_RULES),
+        # ESTRATEGIA 2: Buscar por columna "Sociedad"
+        (roles['sociedad'], lambda values: {v.lower() for v in values}, SOCIEDAD_RULES),
+        # ESTRATEGIA 3: Fallback por Clase de Factura
+        (roles['clase_factura'], lambda values: {v.upper() for v in values}, CLASE_FACTURA_RULES),
+    ]
+    for column, normalize, rules in strategies:
+        if column:
+            portfolio = _match_portfolio(df[column], normalize, rules)
+            if portfolio:
+                return portfolio
+    return '--'
+
+def find_invoices_by_total_sum(df_candidates, target_amount, invoice_col, price_col, client_col, product_col, assignment_mode, solver_mode=DEFAULT_SOLVER_MODE):
+    if df_candidates.empty or invoice_col not in df_candidates.columns or price_col not in df_candidates.columns:
+        return None, None, 0
+
+    df_candidates_copy = df_candidates
+    if AMOUNT_COLUMN not in df_candidates_copy.columns:
+        df_candidates_copy = df_candidates_copy.assign(**{AMOUNT_COLUMN: convert_series_to_float(df_candidates_copy[price_col])})
+
+    df_candidates_copy = df_candidates_copy[df_candidates_copy[AMOUNT_COLUMN] > 0.01]
+
+    if df_candidates_copy.empty:
+        return None, None, 0
+
+    invoice_sums_df = df_candidates_copy.groupby(invoice_col, observed=True).agg(
+        total_sum=(AMOUNT_COLUMN, 'sum'),
+        client_code=(client_col, 'first'),
+        product_code=(product_col, 'first')
+    ).reset_index()
+
+    invoice_sums_df.columns = [invoice_col, 'total_sum', client_col, product_col]
+
+    chosen_positions = select_invoices(invoice_sums_df['total_sum'].to_numpy(), target_amount, solver_mode)
+    if chosen_positions is None:
+        df_selected_invoices = pd.DataFrame()
+    else:
+        df_selected_invoices = invoice_sums_df.iloc[chosen_positions].copy()
+
+    if df_selected_invoices.empty:
+        total_available_sum = invoice_sums_df['total_sum'].sum()
+        return None, None, total_available_sum
+
+    current_sum = df_selected_invoices['total_sum'].sum()
+    if current_sum + 0.005 < target_amount:
+        total_available_sum = invoice_sums_df['total_sum'].sum()
+        return None, None, total_available_sum
+
+    first_client_code = df_selected_invoices[client_col].iloc[0]
+    monto_cubierto_final = df_selected_invoices['total_sum'].sum()
+
+    if assignment_mode == 'Estricto (Truncar)' and not df_selected_invoices.empty:
+        sum_excluding_last = df_selected_invoices['total_sum'].iloc[:-1].sum() if len(df_selected_invoices) > 1 else 0
+        required_from_last = target_amount - sum_excluding_last
+        required_from_last = max(0, required_from_last)
+
+        df_selected_invoices_copy = df_selected_invoices.copy()
+        last_idx_in_df = df_selected_invoices_copy.index[-1]
+        df_selected_invoices_copy.loc[last_idx_in_df, 'total_sum'] = required_from_last
+
+        monto_cubierto_final = target_amount
+        df_selected_invoices_copy['Monto NC Asignado'] = df_selected_invoices_copy['total_sum']
+        return df_selected_invoices_copy, first_client_code, monto_cubierto_final
+    else:
+        df_selected_invoices['Monto NC Asignado'] = df_selected_invoices['total_sum']
+        return df_selected_invoices, first_client_code, monto_cubierto_final
+
+def get_file_name(portfolio_cod, ticket, is_first=False, multiple_invoices=False):
+    acronym = PORTFOLIO_ACRONYM_MAP.get(portfolio_cod, 'SIN_PORTAFOLIO')
+    if multiple_invoices:
+        return f"NC_Multiples_{acronym}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    elif ticket:
+        return f"TICKET#SR-{ticket}-{acronym}.xlsx"
+    else:
+        return f"TICKET_SIN_NUMERO-{acronym}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+
+
+# --- MEMORIZACIÓN DE ETAPAS ---
+# Cada etapa guarda su último resultado junto con la clave de sus entradas; en un
+# rerun solo se recalculan las etapas cuya clave cambió (p. ej. al cambiar solo el
+# número de ticket no se vuelve a filtrar el extracto ni a calcular la cobertura).
+# Los resultados en caché no se modifican: las etapas siguientes trabajan sobre
+# copias o DataFrames nuevos.
+
+
+class PipelineCache:
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, stage, key, compute):
+        """Resultado de compute() para esa clave; las NCError también se guardan y se vuelven a lanzar."""
+        entry = self._entries.get(stage)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            value, error = entry[1]
+        else:
+            self.misses += 1
+            try:
+                value, error = compute(), None
+            except NCError as e:
+                value, error = None, e
+            self._entries[stage] = (key, (value, error))
+        if error is not None:
+            raise error
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+
+def codes_key(codes):
+    return tuple(sorted(codes or ()))
+
+
+def ledger_key(ledger):
+    return tuple(sorted(ledger.items())) if ledger else ()
+
+
+# --- ETAPAS DEL CÁLCULO ---
+
+def detect_columns(columns):
+    """Columnas del extracto por rol (None si no se encuentra); ver column_resolver."""
+    header_columns = [c for c in columns if c != AMOUNT_COLUMN]
+    roles = resolve_columns(header_columns)
+    return {
+        'header': header_columns,
+        'factura': roles['factura'],
+        'monto': roles['monto'],
+        'cliente': roles['cliente'],
+        'producto': roles['producto'],
+        'unidad_medida': roles['unidad_medida'],
+        'condicion': roles['condicion'],
+        'clase_factura': roles['clase_factura'],
+    }
+
+
+def prepare_lines(df, portfolio, columns):
+    """
+    Copia del extracto lista para buscar: monto numérico, productos sin ceros a la
+    izquierda y solo las clases de factura del portafolio. Devuelve (líneas,
+    columnas, advertencias); columns['producto'] puede pasar a la columna ficticia.
+    """
+    if not columns['cliente'] or not columns['factura'] or not columns['monto']:
+        raise NCError("Error: Revise los encabezados de su archivo.")
+
+    columns = dict(columns)
+    warnings = []
+
+    # Primero se decide qué filas quedan y solo esas se materializan; sin filtro se
+    # usa una copia superficial (con copy-on-write las columnas nuevas no tocan df)
+    col_clase_factura = columns['clase_factura']
+    clases = None
+    if portfolio != '--':
+        allowed_classes = ALLOWED_INVOICE_CLASSES.get(portfolio, [])
+        if allowed_classes:
+            if col_clase_factura is None:
+                warnings.append("Advertencia: No se encontró la columna 'Clase de Factura'.")
+            elif col_clase_factura in df.columns:
+                clases = _map_unique(df[col_clase_factura], _normalize_class)
+                keep = clases.isin(allowed_classes).to_numpy()
+                clases = clases[keep]
+    if clases is None:
+        df_lines = df.copy(deep=False)
+    else:
+        df_lines = df[keep]
+        df_lines[col_clase_factura] = clases
+
+    if AMOUNT_COLUMN not in df_lines.columns:
+        add_amount_column(df_lines, columns['monto'])
+
+    if not columns['producto']:
+        columns['producto'] = DUMMY_PRODUCT_COLUMN
+        df_lines[DUMMY_PRODUCT_COLUMN] = ''
+
+    col_producto = columns['producto']
+    if col_producto in df_lines.columns:
+        df_lines[col_producto] = _map_unique(df_lines[col_producto], clean_leading_zeros)
+
+    return df_lines, columns, warnings
+
+
+# Cómo queda un valor nulo tras astype(str) en esta versión de pandas ('nan' o NaN)
+_NA_AS_TEXT = pd.Series([np.nan], dtype=object).astype(str).iloc[0]
+
+
+def _normalize_class(value):
+    return value.strip().upper() if isinstance(value, str) else value
+
+
+def _map_unique(series, func):
+    """
+    series.astype(str).apply(func) evaluando func una sola vez por valor distinto.
+    Una columna category sigue siendo category (solo se recorren sus códigos).
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    mapped = [func(v) for v in pd.Series(uniques, dtype=object).astype(str)] + [func(_NA_AS_TEXT)]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        new_codes, categories = pd.factorize(pd.Series(mapped, dtype=object), use_na_sentinel=True)
+        return pd.Series(
+            pd.Categorical.from_codes(new_codes[codes], categories=pd.Index(categories, dtype=object)),
+            index=series.index, name=series.name,
+        )
+    mapped = np.array(mapped, dtype=object)
+    return pd.Series(mapped[codes], index=series.index, name=series.name)
+
+
+def index_key(portfolio, columns):
+    return (portfolio, columns['cliente'], columns['producto'], columns['factura'])
+
+
+def build_index(df_lines, portfolio, columns):
+    """Índice cliente/producto/factura con las referencias cruzadas ya calculadas."""
+    invoice_index = InvoiceIndex(
+        df_lines, columns['cliente'], columns['producto'], columns['factura'], key=index_key(portfolio, columns)
+    )
+    invoice_index.references = find_invoice_references(df_lines, columns['factura'], columns['header'])
+    return invoice_index
+
+
+def available_lines(df_lines, columns, invoice_index, ledger=None):
+    """Líneas con saldo: descuenta lo ya usado en tickets y quita las facturas referenciadas."""
+    col_factura = columns['factura']
+    if ledger:
+        ledger_labels = invoice_index.rows_for_invoices(ledger.keys())
+        df_lines = apply_ledger(df_lines, col_factura, ledger, ledger_labels)
+
+    # Referencias precalculadas por archivo; solo cuentan las líneas que siguen vigentes
+    alive_labels = df_lines.index if ledger else None
+    referenced_originals = referenced_invoices(invoice_index.references, alive_labels)
+    if referenced_originals:
+        df_lines = df_lines[~df_lines[col_factura].astype(str).str.strip().isin(referenced_originals)]
+    return df_lines
+
+
+def check_clients(df_available, columns, invoice_index, client_codes):
+    col_cliente = columns['cliente']
+    if client_codes and col_cliente and col_cliente in df_available.columns:
+        if take_rows(df_available, invoice_index.rows_for(client_codes)).empty:
+            raise NCError("Error: Códigos de Cliente no encontrados.")
+
+
+def cover_amount(df_available, columns, invoice_index, client_codes, product_codes, monto_nc,
+                 assignment_mode=DEFAULT_ASSIGNMENT_MODE, solver_mode=DEFAULT_SOLVER_MODE):
+    """
+    Facturas que cubren monto_nc con el monto de la NC ya repartido. None si el
+    cliente/producto no tiene líneas con monto; CoverageError si no alcanzan.
+    """
+    if not client_codes:
+        raise NCError(" **ERROR:** Debe ingresar al menos un **Código de Cliente**.")
+
+    col_factura, col_cliente, col_producto = columns['factura'], columns['cliente'], columns['producto']
+    df_candidates = take_rows(df_available, invoice_index.rows_for(client_codes, product_codes)).dropna(subset=[AMOUNT_COLUMN])
+    if df_candidates.empty:
+        return None
+
+    chosen_invoices_df, cliente_a_usar, monto_cubierto = find_invoices_by_total_sum(
+        df_candidates, monto_nc, col_factura, columns['monto'], col_cliente, col_producto, assignment_mode, solver_mode
+    )
+    if chosen_invoices_df is None:
+        raise CoverageError(monto_cubierto)
+
+    ticket_df = chosen_invoices_df
+    if ticket_df.empty:
+        return ticket_df
+    ticket_df['Monto Filas Selecc.'] = ticket_df['total_sum']
+    total_available_sum = ticket_df['Monto Filas Selecc.'].sum()
+
+    if total_available_sum > 0:
+        if assignment_mode == DEFAULT_ASSIGNMENT_MODE:
+            prorate_factor = monto_nc / monto_cubierto if monto_cubierto != 0 else 0
+            ticket_df['Monto NC Asignado'] = (ticket_df['total_sum'] * prorate_factor).round(2)
+            diff = monto_nc - ticket_df['Monto NC Asignado'].sum()
+            if not np.isclose(diff, 0): ticket_df.loc[ticket_df.index[-1], 'Monto NC Asignado'] += diff
+
+        ticket_df[col_cliente] = cliente_a_usar
+        ticket_df['Peso %'] = ticket_df['Monto NC Asignado'] / monto_nc * 100.0 if monto_nc != 0 else 0.0
+        ticket_df['Cantidad'] = '1'
+        ticket_df['VARIACION DE PRECIO'] = ticket_df['Monto NC Asignado']
+        ticket_df['CONDICION'] = TEMPLATE_CONDICION
+        ticket_df['U. MEDIDA'] = 'UN'
+    return ticket_df
+
+
+def browse_invoices(df_available, columns, invoice_index, client_codes, product_codes, ledger_active=False):
+    """Una línea por factura del cliente/producto con su total vigente (sin monto a cubrir)."""
+    col_factura = columns['factura']
+    df_filtrado = take_rows(df_available, invoice_index.rows_for(client_codes, product_codes))
+    if df_filtrado.empty:
+        return pd.DataFrame()
+    df_para_mostrar = df_filtrado.drop_duplicates(subset=[col_factura])
+    df_para_mostrar['CONDICION'] = TEMPLATE_CONDICION
+    if ledger_active:
+        # Los tickets apilados reducen saldos: se suman las líneas actuales del cliente
+        df_all_client_invoices = take_rows(df_available, invoice_index.rows_for(client_codes))
+        invoice_sums_dict = df_all_client_invoices.groupby(col_factura, observed=True)[AMOUNT_COLUMN].sum().to_dict()
+    else:
+        invoice_sums_dict = invoice_index.invoice_totals(client_codes).to_dict()
+    df_para_mostrar['Monto Filas Selecc.'] = df_para_mostrar[col_factura].map(invoice_sums_dict).astype('float64')
+    return df_para_mostrar
+
+
+def enrich_ticket(ticket_df, columns, portfolio, motivo, ticket_number, today=None):
+    """Columnas de la plantilla: asignación, fechas, texto de cabecera y valores del portafolio."""
+    ticket_df = ticket_df.rename(columns={
+        columns['factura']: 'ASIGNACION', columns['cliente']: 'Solicitante', columns['producto']: 'Material'
+    }, errors='ignore')
+    ticket_df['Observación'] = ''
+    ticket_df['Motivo'] = 'R02'
+    curr_date = (today or datetime.now().date()).strftime('%d/%m/%Y')
+    for col in DATE_COLUMNS: ticket_df[col] = curr_date
+    ncf_code = NCF_MAPPING.get(motivo, "NCF.1")
+    texto_cabecera = f"{ncf_code} {motivo}"
+    if ticket_number: texto_cabecera += f" (Ticket {ticket_number})"
+    ticket_df['TEXTO CABECERA'] = texto_cabecera
+    ticket_df['Pedido Cliente'] = texto_cabecera
+
+    sel_defaults = PORTFOLIO_DEFAULTS.get(portfolio)
+    if sel_defaults: ticket_df = ticket_df.assign(**sel_defaults)
+    return ticket_df
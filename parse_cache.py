@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import time
+
+from ingest import read_table
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = None
+    pa_ipc = None
+
+# --- CACHÉ EN DISCO DE EXTRACTOS YA PROCESADOS ---
+# Cada archivo subido se identifica por el hash de su contenido. El DataFrame ya
+# procesado se guarda como Arrow IPC y al volver a subir el mismo archivo se abre
+# con memory-map en lugar de volver a leer el Excel/CSV.
+
+# Subir este número cuando cambie la forma del DataFrame que devuelve read_table,
+# para que no se reutilicen archivos de caché antiguos.
+CACHE_VERSION = 3
+
+CACHE_DIR = os.environ.get(
+    'NOTAS_CACHE_DIR',
+    os.path.join(os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), 'NotasCredito', 'cache'),
+)
+MAX_CACHE_BYTES = int(os.environ.get('NOTAS_CACHE_MAX_MB', '2048')) * 1024 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
+CACHE_SUFFIX = '.arrow'
+
+
+def hash_file(source):
+    """Hash BLAKE2b del contenido, leído por bloques (no carga el archivo completo dos veces)."""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+                h.update(chunk)
+    elif hasattr(source, 'getbuffer'):
+        # UploadedFile / BytesIO: se hashea el buffer en memoria sin copiarlo
+        h.update(source.getbuffer())
+    else:
+        source.seek(0)
+        for chunk in iter(lambda: source.read(HASH_CHUNK_BYTES), b''):
+            h.update(chunk)
+        source.seek(0)
+    return h.hexdigest()
+
+
+def _cache_path(digest):
+    return os.path.join(CACHE_DIR, f"v{CACHE_VERSION}-{digest}{CACHE_SUFFIX}")
+
+
+def load_cached(digest):
+    if pa is None:
+        return None, None
+    path = _cache_path(digest)
+    if not os.path.exists(path):
+        return None, None
+    start = time.perf_counter()
+    try:
+        with pa.memory_map(path, 'r') as source:
+            table = pa_ipc.open_file(source).read_all()
+        df = table.to_pandas()
+    except Exception:
+        # Archivo de caché corrupto o incompleto: se descarta y se vuelve a procesar
+        _remove_quietly(path)
+        return None, None
+    elapsed = time.perf_counter() - start
+
+    # Se actualiza la fecha de modificación para el orden LRU
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+    metadata = table.schema.metadata or {}
+    original_stats = json.loads(metadata.get(b'load_stats', b'{}'))
+    rows = len(df)
+    stats = dict(original_stats)
+    stats.update({
+        'motor': 'caché',
+        'filas': rows,
+        'segundos': elapsed,
+        'filas_por_seg': rows / elapsed if elapsed > 0 else float(rows),
+    })
+    return df, stats
+
+
+def store(digest, df, stats):
+    if pa is None:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b'load_stats'] = json.dumps(stats).encode()
+        table = table.replace_schema_metadata(metadata)
+
+        path = _cache_path(digest)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa_ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    except Exception:
+        # La caché es una optimización: si falla la escritura se sigue sin ella
+        return
+    evict()
+
+
+def evict(max_bytes=None):
+    """Elimina los archivos usados hace más tiempo hasta quedar por debajo del límite de tamaño."""
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    try:
+        entries = []
+        for name in os.listdir(CACHE_DIR):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(CACHE_DIR, name)
+            st_info = os.stat(path)
+            entries.append((st_info.st_mtime, st_info.st_size, path))
+    except OSError:
+        return
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if _remove_quietly(path):
+            total -= size
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def read_table_cached(source, digest=None):
+    """
+    Como ingest.read_table, pero reutiliza la caché en disco si el contenido ya fue
+    procesado. digest es el hash_file(source) si quien llama ya lo calculó.
+    """
+    digest = digest or hash_file(source)
+    df, stats = load_cached(digest)
+    if df is None:
+        df, stats = read_table(source)
+        store(digest, df, stats)
+    # El hash identifica el contenido para las cachés posteriores (etapas del cálculo)
+    stats['hash'] = digest
+    return df, stats
@@ -1,4 +1,5 @@
 import streamlit.web.cli as stcli
+import multiprocessing
 import sys
 import os
 
@@ -10,6 +11,8 @@ def resolve_path(path):
     return os.path.join(application_path, path)
 
 if __name__ == '__main__':
+    # Necesario en el ejecutable para que la exportación masiva pueda usar procesos hijos
+    multiprocessing.freeze_support()
     main_script_path = resolve_path("app.py") 
     
     sys.argv = [
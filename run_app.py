@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import sys
 import webbrowser
@@ -14,6 +15,10 @@ def open_browser():
     webbrowser.open("http://localhost:8501")
 
 if __name__ == "__main__":
+    # Debe ir primero: en el ejecutable, los procesos hijos de la exportación masiva
+    # (bulk_export) vuelven a entrar por aquí y freeze_support los convierte en
+    # trabajadores en lugar de abrir otro servidor de Streamlit
+    multiprocessing.freeze_support()
     from streamlit.web import cli as stcli
 
     main_script_path = resolve_path("app.py")
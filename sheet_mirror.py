@@ -0,0 +1,210 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from history_search import SubstringIndex
+from local_sheet import column_letter
+
+# --- ESPEJO LOCAL DEL HISTORIAL DE GOOGLE SHEETS ---
+# El historial se guarda en un SQLite local junto con el encabezado de la hoja; la
+# última fila espejada es la cantidad de filas guardadas. Cada sincronización hace
+# una sola consulta (batch_get) con el encabezado, la última fila ya espejada y las
+# filas nuevas: si el encabezado y esa fila no cambiaron solo se agregan las
+# nuevas; si cambiaron (filas borradas, hoja reordenada) se vuelve a copiar la hoja
+# completa. Las ediciones en filas anteriores se recogen en la copia completa
+# periódica (FULL_SYNC_INTERVAL_SECONDS). El DataFrame se arma igual que con
+# get_all_records y se extiende con las filas nuevas sin reconstruirlo; lo mismo el
+# índice de búsqueda (history_search).
+
+MIRROR_PATH = os.environ.get(
+    'NOTAS_HISTORIAL_ESPEJO',
+    os.path.join(os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), 'NotasCredito', 'historial_sheet.db'),
+)
+# Segundos entre consultas a la hoja (guardar una nota fuerza la siguiente)
+SYNC_INTERVAL_SECONDS = int(os.environ.get('NOTAS_HISTORIAL_SYNC_SEG', '60'))
+FULL_SYNC_INTERVAL_SECONDS = int(os.environ.get('NOTAS_HISTORIAL_COPIA_COMPLETA_SEG', str(6 * 3600)))
+
+
+def numericise(value):
+    """Igual que gspread.utils.numericise, que es lo que aplica get_all_records."""
+    if value == '' or '_' in value:
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _pad(row, width):
+    row = list(row[:width])
+    return row + [''] * (width - len(row))
+
+
+def _records_frame(header, rows):
+    records = [dict(zip(header, map(numericise, row))) for row in rows]
+    return pd.DataFrame(records) if records else pd.DataFrame()
+
+
+class SheetMirror:
+    def __init__(self, path=MIRROR_PATH, sync_interval=SYNC_INTERVAL_SECONDS,
+                 full_sync_interval=FULL_SYNC_INTERVAL_SECONDS):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.full_sync_interval = full_sync_interval
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._source = None
+        self._header = []
+        # Filas de la hoja desde la 2, como texto y del ancho del encabezado
+        self._rows = []
+        self._frame = None
+        self._frame_rows = 0
+        # Cambia con cada copia completa: el índice de búsqueda se reconstruye
+        self._generation = 0
+        self._search = SubstringIndex()
+        self._synced_at = 0.0
+        self._full_synced_at = 0.0
+
+    def _connect(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)')
+        conn.execute('CREATE TABLE IF NOT EXISTS filas (fila INTEGER PRIMARY KEY, valores TEXT NOT NULL)')
+        return conn
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with closing(self._connect()) as conn:
+                meta = dict(conn.execute('SELECT clave, valor FROM meta'))
+                rows = [json.loads(values) for (values,) in conn.execute('SELECT valores FROM filas ORDER BY fila')]
+        except (OSError, sqlite3.Error, ValueError):
+            # Espejo ilegible: se empieza vacío y la primera sincronización copia la hoja
+            return
+        self._source = meta.get('hoja')
+        self._header = json.loads(meta.get('encabezado', '[]'))
+        self._rows = rows
+
+    def _persist(self, first_row, rows, reset):
+        try:
+            with closing(self._connect()) as conn, conn:
+                if reset:
+                    conn.execute('DELETE FROM filas')
+                conn.executemany(
+                    'INSERT OR REPLACE INTO filas (fila, valores) VALUES (?, ?)',
+                    ((first_row + i, json.dumps(row, ensure_ascii=False)) for i, row in enumerate(rows)),
+                )
+                conn.executemany('INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)', [
+                    ('hoja', self._source),
+                    ('encabezado', json.dumps(self._header, ensure_ascii=False)),
+                ])
+        except (OSError, sqlite3.Error):
+            # El espejo en disco es una optimización: si falla se sigue con la copia en memoria
+            pass
+
+    def due(self):
+        """True si ya pasó el intervalo desde la última sincronización (o se invalidó)."""
+        return time.monotonic() - self._synced_at >= self.sync_interval
+
+    def invalidate(self):
+        """La próxima lectura vuelve a consultar la hoja (p. ej. después de guardar filas)."""
+        self._synced_at = 0.0
+
+    def _delta(self, worksheet, source):
+        """Filas nuevas de la hoja, o None si el espejo ya no coincide con ella."""
+        if not self._header or source != self._source:
+            return None
+        if time.monotonic() - self._full_synced_at >= self.full_sync_interval:
+            return None
+        width = len(self._header)
+        last = len(self._rows) + 1
+        letter = column_letter(width)
+        header, check, new = worksheet.batch_get(['1:1', f'A{last}:{letter}{last}', f'A{last + 1}:{letter}'])
+        if (list(header[0]) if header else []) != self._header:
+            return None
+        if self._rows and _pad(check[0] if check else [], width) != self._rows[-1]:
+            return None
+        return [_pad(row, width) for row in new]
+
+    def sync(self, worksheet, source=''):
+        """Trae de la hoja solo lo que falta en el espejo. Devuelve las filas agregadas."""
+        with self._lock:
+            self._load()
+            start = time.perf_counter()
+            new_rows = self._delta(worksheet, source)
+            if new_rows is None:
+                values = worksheet.get_all_values()
+                header = list(values[0]) if values else []
+                while header and header[-1] == '':
+                    header.pop()
+                new_rows = [_pad(row, len(header)) for row in values[1:]]
+                while new_rows and not any(new_rows[-1]):
+                    new_rows.pop()
+                self._source, self._header, self._rows = source, header, []
+                self._frame, self._frame_rows = None, 0
+                self._generation += 1
+                self._full_synced_at = time.monotonic()
+                mode = 'completa'
+            else:
+                mode = 'incremental'
+
+            if new_rows or mode == 'completa':
+                self._persist(len(self._rows) + 2, new_rows, reset=mode == 'completa')
+                self._rows.extend(new_rows)
+            self._synced_at = time.monotonic()
+            self.stats = {
+                'modo': mode,
+                'filas': len(self._rows),
+                'filas_nuevas': len(new_rows),
+                'segundos': time.perf_counter() - start,
+            }
+            return len(new_rows)
+
+    def frame(self):
+        """Historial como DataFrame (el mismo que daría get_all_records), extendido con las filas nuevas."""
+        with self._lock:
+            self._load()
+            if self._frame is None or self._frame_rows < len(self._rows):
+                new = _records_frame(self._header, self._rows[self._frame_rows:])
+                if self._frame is None or self._frame.empty:
+                    self._frame = new
+                elif not new.empty:
+                    self._frame = pd.concat([self._frame, new], ignore_index=True)
+                self._frame_rows = len(self._rows)
+            return self._frame
+
+    @property
+    def generation(self):
+        """Cambia con cada copia completa: mientras no cambie, las filas de frame() no se mueven de posición."""
+        return self._generation
+
+    def search(self, keyword, frame=None):
+        """
+        Filas del historial que contienen keyword (ver history_search). frame: un
+        frame() anterior de la misma generación (sus filas son las primeras del
+        actual); por defecto, el historial actual.
+        """
+        current = self.frame()
+        if frame is None:
+            frame = current
+        with self._lock:
+            self._search.update(current, self._generation)
+            positions = self._search.search(keyword)
+        return frame.take(positions[positions < len(frame)])
+
+
+HISTORY = SheetMirror()
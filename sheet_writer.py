@@ -0,0 +1,214 @@
+import atexit
+import json
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+# --- ENVÍO DIFERIDO DE FILAS AL HISTORIAL ---
+# guardar_en_sheet ya no llama a la API: deja las filas en una cola en disco
+# (SQLite) y vuelve enseguida. Un hilo de fondo espera FLUSH_INTERVAL_SECONDS para
+# juntar las filas de todos los tickets y sesiones que lleguen en ese tiempo y las
+# envía en un solo append_rows, con la hoja abierta una sola vez. Si la API falla
+# por algo temporal (cuota, servidor, red) se reintenta con espera exponencial; las
+# filas solo se borran de la cola después de enviarse, así que sobreviven a un
+# cierre del ejecutable y se envían al volver a abrirlo. Solo si la API rechaza el
+# lote mismo (400: datos inválidos) reintentar no sirve: el lote pasa al archivo de
+# rechazadas (una línea JSON por fila, con el error) para no trabar la cola, y
+# status() lo informa. Cualquier otro error (abrir la hoja, credenciales, permisos,
+# red o un error del programa) no depende de las filas: se reintenta con espera y
+# la cola queda intacta.
+
+PENDING_PATH = os.environ.get(
+    'NOTAS_HISTORIAL_PENDIENTE',
+    os.path.join(os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), 'NotasCredito', 'historial_pendiente.db'),
+)
+REJECTED_PATH = os.environ.get(
+    'NOTAS_HISTORIAL_RECHAZADAS',
+    os.path.join(os.path.dirname(PENDING_PATH), 'historial_rechazado.jsonl'),
+)
+FLUSH_INTERVAL_SECONDS = float(os.environ.get('NOTAS_HISTORIAL_ENVIO_SEG', '5'))
+MAX_BATCH_ROWS = 5000
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+# Errores de la API que son temporales (cuota excedida, servidor no disponible)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Errores de la API que indican que el lote mismo no es válido
+REJECT_STATUS = {400}
+
+
+class BatchRejected(Exception):
+    """La API rechazó los datos de un lote (REJECT_STATUS); el lote ya está en rechazadas."""
+
+
+def _status(error):
+    """Código HTTP de un gspread.exceptions.APIError (None si no es un error de la API)."""
+    code = getattr(error, 'code', None)
+    if code is None:
+        code = getattr(getattr(error, 'response', None), 'status_code', None)
+    return code
+
+
+def _cell(value):
+    # Valores que no se pueden enviar (NaN, None) se guardan vacíos para no trabar la cola
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+class SheetWriter:
+    def __init__(self, open_worksheet, on_flush=None, path=PENDING_PATH,
+                 flush_interval=FLUSH_INTERVAL_SECONDS, max_rows=MAX_BATCH_ROWS, rejected_path=REJECTED_PATH):
+        self.open_worksheet = open_worksheet
+        self.on_flush = on_flush
+        self.path = path
+        self.rejected_path = rejected_path
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.last_error = None
+        self.last_flush = None
+        self.rejected = 0
+        self.last_rejection = None
+        self._worksheet = None
+        self._header_ready = False
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def _connect(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute('CREATE TABLE IF NOT EXISTS pendientes '
+                     '(id INTEGER PRIMARY KEY AUTOINCREMENT, encabezado TEXT NOT NULL, valores TEXT NOT NULL)')
+        return conn
+
+    def start(self):
+        """Arranca el hilo de envío (si hay filas de una ejecución anterior, se envían)."""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='historial-envio', daemon=True)
+                self._thread.start()
+                atexit.register(self._flush_at_exit)
+        if self.pending():
+            self._wake.set()
+
+    def enqueue(self, header, rows):
+        """Guarda las filas en la cola en disco; se envían en el siguiente lote."""
+        header = json.dumps([str(h) for h in header], ensure_ascii=False)
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                'INSERT INTO pendientes (encabezado, valores) VALUES (?, ?)',
+                ((header, json.dumps([_cell(v) for v in row], ensure_ascii=False)) for row in rows),
+            )
+        self.start()
+        self._wake.set()
+
+    def pending(self):
+        """Filas que todavía no se enviaron a la hoja."""
+        try:
+            with closing(self._connect()) as conn:
+                return conn.execute('SELECT COUNT(*) FROM pendientes').fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def flush(self):
+        """Envía hasta max_rows filas pendientes en un solo append_rows. Devuelve las filas enviadas."""
+        with self._flush_lock:
+            with closing(self._connect()) as conn:
+                pending = conn.execute('SELECT id, encabezado, valores FROM pendientes ORDER BY id LIMIT ?',
+                                       (self.max_rows,)).fetchall()
+            if not pending:
+                return 0
+            if self._worksheet is None:
+                # Abrir la hoja por nombre hace una búsqueda en Drive: se hace una vez. Si
+                # falla (credenciales, permisos, red) el error se propaga y se reintenta
+                self._worksheet = self.open_worksheet()
+                self._header_ready = False
+            try:
+                if not self._header_ready:
+                    if not self._worksheet.row_values(1):
+                        self._worksheet.update([json.loads(pending[0][1])], 'A1')
+                    self._header_ready = True
+                self._worksheet.append_rows([json.loads(values) for _, _, values in pending],
+                                            value_input_option='USER_ENTERED')
+            except Exception as e:
+                if _status(e) in REJECT_STATUS:
+                    self._reject(pending, e)
+                    raise BatchRejected(str(e)) from e
+                if _status(e) not in RETRY_STATUS:
+                    # Puede ser la conexión o los permisos: la próxima vez se vuelve a abrir la hoja
+                    self._worksheet = None
+                raise
+            with closing(self._connect()) as conn, conn:
+                conn.execute('DELETE FROM pendientes WHERE id <= ?', (pending[-1][0],))
+            self.last_flush = time.time()
+            if self.on_flush:
+                self.on_flush()
+            return len(pending)
+
+    def _reject(self, pending, error):
+        """Pasa un lote que la API no acepta al archivo de rechazadas y lo quita de la cola."""
+        folder = os.path.dirname(self.rejected_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        when = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(self.rejected_path, 'a', encoding='utf-8') as f:
+            for _, header, values in pending:
+                f.write(json.dumps({'fecha': when, 'error': str(error), 'encabezado': json.loads(header),
+                                    'valores': json.loads(values)}, ensure_ascii=False) + '\n')
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM pendientes WHERE id <= ?', (pending[-1][0],))
+        self.rejected += len(pending)
+        self.last_rejection = error
+
+    def _run(self):
+        failures = 0
+        while True:
+            self._wake.wait()
+            # Se esperan las filas que lleguen en el intervalo para enviarlas juntas
+            time.sleep(self.flush_interval)
+            self._wake.clear()
+            while True:
+                try:
+                    sent = self.flush()
+                except BatchRejected as e:
+                    # El lote ya pasó a rechazadas: se sigue con el siguiente sin esperar
+                    self.last_error = e.__cause__
+                    failures = 0
+                    continue
+                except Exception as e:
+                    self.last_error = e
+                    failures += 1
+                    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (failures - 1))
+                    time.sleep(delay + random.random())
+                    continue
+                failures = 0
+                self.last_error = None
+                if sent < self.max_rows:
+                    break
+
+    def _flush_at_exit(self):
+        # Último intento al cerrar; si falla las filas quedan en disco para la próxima vez
+        try:
+            while self.flush() >= self.max_rows:
+                pass
+        except Exception:
+            pass
+
+    def status(self):
+        return {
+            'pendientes': self.pending(),
+            'ultimo_envio': self.last_flush,
+            'ultimo_error': str(self.last_error) if self.last_error else None,
+            'rechazadas': self.rejected,
+            'ultimo_rechazo': str(self.last_rejection) if self.last_rejection else None,
+            'archivo_rechazadas': self.rejected_path,
+        }
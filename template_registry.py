@@ -0,0 +1,265 @@
+import copy
+import io
+import os
+import threading
+
+import openpyxl
+from openpyxl.cell.cell import Cell
+
+try:
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    BASE_DIR = os.getcwd()
+
+# --- REGISTRO DE PLANTILLAS ---
+# Cada plantilla se lee y analiza una sola vez: contenido, encabezados y su columna
+# del DataFrame, estilos del encabezado, dimensiones de filas y columnas (alto,
+# ancho, estilo), formato condicional y propiedades de la hoja (página, márgenes,
+# vistas, protección) quedan en memoria. En cada exportación solo se consulta la
+# fecha de modificación del archivo; si cambió, la plantilla se vuelve a cargar.
+
+PORTFOLIO_TEMPLATE_MAP = {
+    '0700': 'plantilla_APC.xlsx',
+    'R100': 'plantilla_PCV.xlsx',
+    'C001': 'plantilla_CYM.xlsx',
+    '0600': 'plantilla_EFE.xlsx',
+}
+DEFAULT_TEMPLATE_NAME = 'plantilla_default.xlsx'
+
+HEADER_ROW = 1
+
+DF_COLUMN_MAP = {
+    "Clase de pedido": "Clase de pedido",
+    "Organizacion de Venta": "Organizacion de Venta",
+    "Canal de Distribucion": "Canal de Distribucion",
+    "Sector": "Sector",
+    "Solicitante": "Solicitante",
+    "Fecha de Pedido": "Fecha de Pedido",
+    "Fecha de Precio": "Fecha de Precio",
+    "Fecha de Factura": "Fecha de Factura",
+    "Motivo": "Motivo",
+    "Pedido Cliente": "Pedido Cliente",
+    "Material": "Material",
+    "Cantidad": "Cantidad",
+    "U. MEDIDA": "U. MEDIDA",
+    "CONDICION": "CONDICION",
+    "VARIACION DE PRECIO": "VARIACION DE PRECIO",
+    "ASIGNACION": "ASIGNACION",
+    "UTILIZACION": "UTILIZACION",
+    "TEXTO CABECERA": "TEXTO CABECERA",
+    "Peso %": "Peso %",
+    "Monto NC Asignado": "Monto NC Asignado",
+    "Observación": "Observación",
+}
+
+COLS_TO_RESIZE = [
+    "Clase de pedido", "Organizacion de Venta", "Canal de Distribucion", "Sector", "Solicitante",
+    "Fecha de Pedido", "Fecha de Precio", "Fecha de Factura", "Material", "Pedido Cliente",
+    "Cantidad", "U. MEDIDA", "CONDICION", "VARIACION DE PRECIO", "ASIGNACION", "Peso %",
+    "Monto NC Asignado"
+]
+LARGE_TEXT_COLS = {
+    "VARIACION DE PRECIO": 18,
+    "TEXTO CABECERA": 35,
+    "Pedido Cliente": 35,
+    "Observación": 25,
+    "Motivo": 8
+}
+DEFAULT_WIDTH = 15
+
+ROW_DIMENSION_FIELDS = ['height', 'hidden', 'outlineLevel', 'collapsed', 'thickBot', 'thickTop']
+COLUMN_DIMENSION_FIELDS = ['min', 'max', 'width', 'bestFit', 'hidden', 'outlineLevel', 'collapsed']
+# Propiedades de la hoja que el modo rápido copia de la plantilla (objetos de openpyxl)
+SHEET_PROPERTIES = ['sheet_format', 'sheet_properties', 'views', 'page_margins',
+                    'print_options', 'HeaderFooter', 'protection', 'auto_filter', 'data_validations']
+# La configuración de página pertenece a su hoja: se guardan los atributos y el modo
+# rápido arma una nueva (PrintPageSetup) para cada libro
+PAGE_SETUP_FIELDS = ['orientation', 'paperSize', 'scale', 'fitToHeight', 'fitToWidth', 'firstPageNumber',
+                     'useFirstPageNumber', 'paperHeight', 'paperWidth', 'pageOrder', 'usePrinterDefaults',
+                     'blackAndWhite', 'draft', 'cellComments', 'errors', 'horizontalDpi', 'verticalDpi',
+                     'copies', 'id']
+
+
+class TemplateError(Exception):
+    """No se pudo cargar ni la plantilla del portafolio ni la plantilla por defecto."""
+
+
+def map_template_headers(header_cells):
+    """Relaciona cada encabezado de la plantilla con su columna del DataFrame."""
+    excel_template_structure = []
+    template_headers = {}
+    used_df_columns = set()
+
+    for cell in header_cells:
+        template_header = str(cell.value).strip() if cell.value is not None else ''
+        if not template_header:
+            continue
+        normalized_template_header = template_header.replace(' ', '').lower()
+        df_column_name = None
+
+        for df_col, template_col_match in DF_COLUMN_MAP.items():
+            if template_col_match.replace(' ', '').lower() == normalized_template_header:
+                df_column_name = df_col
+                break
+
+        if df_column_name is None:
+            if "clase" in normalized_template_header and "pedido" in normalized_template_header:
+                df_column_name = "Clase de pedido"
+            elif "org" in normalized_template_header and ("ven" in normalized_template_header or "vta" in normalized_template_header):
+                df_column_name = "Organizacion de Venta"
+            elif "canal" in normalized_template_header:
+                df_column_name = "Canal de Distribucion"
+            elif "sector" in normalized_template_header:
+                df_column_name = "Sector"
+
+        if df_column_name == "TEXTO CABECERA" and "TEXTO CABECERA" in used_df_columns:
+            continue
+
+        excel_template_structure.append({
+            'letter': cell.column_letter,
+            'column': cell.column,
+            'df_column': df_column_name,
+        })
+        template_headers[template_header] = cell.column_letter
+
+        if df_column_name:
+            used_df_columns.add(df_column_name)
+
+    return excel_template_structure, template_headers
+
+
+def column_widths(template_headers):
+    """Anchos fijos de las columnas conocidas de la plantilla, por letra."""
+    widths = {}
+    for col_name, col_letter in template_headers.items():
+        if col_name in LARGE_TEXT_COLS:
+            widths[col_letter] = LARGE_TEXT_COLS[col_name]
+        elif col_name in COLS_TO_RESIZE:
+            widths[col_letter] = DEFAULT_WIDTH
+    return widths
+
+
+def _style(obj):
+    """Estilo (copiado) de una celda o dimensión, o None si usa el estilo por defecto."""
+    if not obj.has_style:
+        return None
+    return {
+        'font': copy.copy(obj.font),
+        'fill': copy.copy(obj.fill),
+        'border': copy.copy(obj.border),
+        'alignment': copy.copy(obj.alignment),
+        'protection': copy.copy(obj.protection),
+        'number_format': obj.number_format,
+    }
+
+
+def _dimensions(holder, fields):
+    """Dimensiones con algo distinto del valor por defecto: índice -> (atributos, estilo)."""
+    dimensions = {}
+    for key, dim in holder.items():
+        attributes = {field: getattr(dim, field) for field in fields}
+        style = _style(dim)
+        if style is not None or any(attributes[field] for field in fields if field not in ('min', 'max')):
+            dimensions[key] = (attributes, style)
+    return dimensions
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def parse_template(path):
+    """Lee la plantilla una vez y devuelve su estructura (dict) con el contenido del archivo incluido."""
+    mtime = _mtime(path)
+    with open(path, 'rb') as f:
+        content = f.read()
+    sheet = openpyxl.load_workbook(io.BytesIO(content)).active
+    header_cells = list(sheet[HEADER_ROW])
+    structure, template_headers = map_template_headers(header_cells)
+
+    fixed_widths = column_widths(template_headers)
+
+    return {
+        'path': path,
+        'mtime': mtime,
+        'content': content,
+        'title': sheet.title,
+        # Fuente de una celda sin estilo (la del estilo Normal del libro)
+        'default_font': copy.copy(Cell(sheet).font),
+        'max_column': sheet.max_column,
+        'header': [
+            {
+                'column': cell.column,
+                'value': cell.value,
+                'font': copy.copy(cell.font),
+                'fill': copy.copy(cell.fill),
+                'border': copy.copy(cell.border),
+                'alignment': copy.copy(cell.alignment),
+                'protection': copy.copy(cell.protection),
+                'number_format': cell.number_format,
+            }
+            for cell in header_cells
+        ],
+        'structure': structure,
+        'template_headers': template_headers,
+        'fixed_widths': fixed_widths,
+        'conditional_formatting': [
+            (str(cf.sqref), [copy.copy(rule) for rule in cf.rules]) for cf in sheet.conditional_formatting
+        ],
+        'row_dimensions': _dimensions(sheet.row_dimensions, ROW_DIMENSION_FIELDS),
+        'column_dimensions': _dimensions(sheet.column_dimensions, COLUMN_DIMENSION_FIELDS),
+        'sheet': {name: copy.copy(getattr(sheet, name)) for name in SHEET_PROPERTIES},
+        'page_setup': {name: getattr(sheet.page_setup, name) for name in PAGE_SETUP_FIELDS},
+        'merged_cells': [str(cell_range) for cell_range in sheet.merged_cells.ranges],
+    }
+
+
+class TemplateRegistry:
+    def __init__(self, base_dir=BASE_DIR, portfolio_map=None, default_name=DEFAULT_TEMPLATE_NAME):
+        self.base_dir = base_dir
+        self.portfolio_map = dict(PORTFOLIO_TEMPLATE_MAP if portfolio_map is None else portfolio_map)
+        self.default_path = os.path.join(base_dir, default_name)
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def preload(self):
+        """Carga todas las plantillas conocidas (las que falten o fallen se omiten)."""
+        paths = [os.path.join(self.base_dir, name) for name in self.portfolio_map.values()]
+        for path in paths + [self.default_path]:
+            try:
+                self._layout(path)
+            except Exception:
+                continue
+
+    def _layout(self, path):
+        mtime = _mtime(path)
+        if mtime is None:
+            raise FileNotFoundError(path)
+        layout = self._templates.get(path)
+        if layout is not None and layout['mtime'] == mtime:
+            return layout
+        with self._lock:
+            layout = self._templates.get(path)
+            if layout is None or layout['mtime'] != mtime:
+                layout = parse_template(path)
+                self._templates[path] = layout
+        return layout
+
+    def get(self, selected_portfolio):
+        """Plantilla del portafolio o, si no existe o no se puede leer, la plantilla por defecto."""
+        specific_template_name = self.portfolio_map.get(selected_portfolio)
+        if specific_template_name:
+            try:
+                return self._layout(os.path.join(self.base_dir, specific_template_name))
+            except Exception:
+                pass
+        try:
+            return self._layout(self.default_path)
+        except Exception as e_default:
+            raise TemplateError(str(e_default)) from e_default
+
+
+TEMPLATES = TemplateRegistry()
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from amounts import convert_series_to_float, convert_value_to_float
+
+VALUES = [
+    # Miles y decimales
+    '1.234,56', '1,234.56', '1.234.567,89', '1234,5', '1234.5', '1,5', '$ 1,5', '€1.000', ' 12 ',
+    '1234.', '.5', ',5', '0,00', '000123',
+    # Negativos
+    '-1.234,56', '-5', '(5,00)',
+    # Vacíos
+    '', ' ', None, np.nan,
+    # Texto no válido
+    'abc', 'N/A', '1.2.3', '1,2,3', '..', ',', '1,,5', '12abc34',
+]
+
+
+def scalar(values):
+    return pd.Series([convert_value_to_float(v) for v in values], dtype='float64')
+
+
+@pytest.mark.parametrize('dtype', [object, 'string'])
+def test_series_parser_matches_scalar_parser(dtype):
+    series = pd.Series(VALUES * 3, dtype=dtype)
+    expected = scalar(series.astype(object).where(series.notna(), None))
+    pd.testing.assert_series_equal(convert_series_to_float(series), expected, check_names=False)
+
+
+def test_numbers_in_text_columns():
+    values = ['1.234,56', 1500, 2.5, True, None, 'x']
+    pd.testing.assert_series_equal(convert_series_to_float(pd.Series(values, dtype=object)), scalar(values))
+
+
+def test_numeric_columns_are_returned_as_float():
+    series = pd.Series([1, 2, 3])
+    assert convert_series_to_float(series).tolist() == [1.0, 2.0, 3.0]
@@ -0,0 +1,37 @@
+from batch_cli import load_context
+from nc_engine import available_lines
+
+CLIENTS = ['100', '101']
+
+
+def write_extract(path):
+    rows = [
+        'Solicitante;ASIGNACION;Material;Precio;Clase Factura;Texto cabecera',
+        # La línea menciona su propia factura: no se excluye
+        '100;0090000189;000000000000000001;1.500,00;ZSPN;REF 0090000189',
+        '100;0090000190;000000000000000002;300,00;ZSPN;',
+        # La factura 0090000191 de 101 menciona a 0090000190: se excluye 0090000190
+        '101;0090000191;000000000000000002;250,00;ZSPN;ANULA 0090000190',
+        # El mismo número con y sin ceros en la columna de factura: se excluyen las dos
+        '101;0090000192;000000000000000003;80,00;ZSPN;',
+        '102;90000192;000000000000000003;80,00;ZSPN;',
+        '101;0090000193;000000000000000004;10,00;ZSCC;',
+        # Clase no permitida para 0700: no cuenta
+        '101;0090000194;000000000000000004;10,00;YP01;MENCIONA 0090000193',
+    ]
+    path.write_text('\n'.join(rows) + '\n', encoding='utf-8')
+    return path
+
+
+def available_invoices(context):
+    lines = available_lines(context['lines'], context['columns'], context['index'])
+    lines = lines[lines[context['columns']['cliente']].isin(CLIENTS)]
+    return sorted(lines[context['columns']['factura']].astype(str).str.strip().unique())
+
+
+def test_chunked_and_full_reads_offer_the_same_invoices(tmp_path):
+    path = str(write_extract(tmp_path / 'extracto.csv'))
+    full = load_context(path, '0700')
+    chunked = load_context(path, '0700', client_codes=CLIENTS)
+    assert available_invoices(full) == ['0090000189', '0090000191', '0090000193']
+    assert available_invoices(chunked) == available_invoices(full)
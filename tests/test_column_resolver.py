@@ -0,0 +1,37 @@
+import pandas as pd
+
+from column_resolver import resolve_columns
+from nc_engine import detect_columns, prepare_lines
+
+
+def sap_extract():
+    # Extracto con el código del cliente (Solicitante) y su nombre (Razón Social),
+    # y con el monto en bolívares (Precio) y en dólares
+    return pd.DataFrame({
+        'Razón Social': ['Bodega La Esquina', 'Abasto El Sol'],
+        'Solicitante': ['100', '101'],
+        'ASIGNACION': ['0090000189', '0090000190'],
+        'Material': ['000000000000000001', '000000000000000002'],
+        'Monto USD': ['10,00', '20,00'],
+        'Precio': ['1.500,00', '3.000,00'],
+    })
+
+
+def test_code_column_wins_over_name_column():
+    columns = detect_columns(sap_extract().columns)
+    assert columns['cliente'] == 'Solicitante'
+    assert columns['factura'] == 'ASIGNACION'
+    assert columns['monto'] == 'Precio'
+
+
+def test_name_and_usd_columns_are_not_used_as_code_and_amount():
+    roles = resolve_columns(['Nombre', 'Razón Social', 'Factura', 'USD', 'Dólares'])
+    assert roles['cliente'] is None
+    assert roles['monto'] is None
+    assert roles['factura'] == 'Factura'
+
+
+def test_prepare_lines_keeps_client_codes():
+    df = sap_extract()
+    lines, columns, _ = prepare_lines(df, '0700', detect_columns(df.columns))
+    assert lines[columns['cliente']].astype(str).tolist() == ['100', '101']
@@ -0,0 +1,96 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from coverage import fewest_invoices_cover, greedy_cover, min_overshoot_cover
+
+
+def legacy_greedy(totals, target):
+    # Selección de find_invoices_by_total_sum antes de coverage.py (sort_values + iterrows)
+    sums = pd.DataFrame({'total_sum': totals})
+    sufficient = sums[sums['total_sum'] >= target]
+    if not sufficient.empty:
+        return list(sufficient.sort_values(by='total_sum', ascending=True).index[:1])
+    chosen, current = [], 0
+    for position, row in sums.sort_values(by='total_sum', ascending=False).iterrows():
+        if current >= target:
+            break
+        chosen.append(position)
+        current += row['total_sum']
+    return chosen if current >= target else None
+
+
+def cases(count=200, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        n = int(rng.integers(1, 11))
+        # Montos en centavos exactos y distintos (el orden con empates no era estable)
+        totals = rng.choice(np.arange(100, 200_000), size=n, replace=False) / 100
+        target = float(rng.uniform(0.01, totals.sum() * 1.1))
+        yield totals, round(target, 2)
+
+
+def best_cover(totals, target):
+    """(menor excedente, menor cantidad de facturas) recorriendo todos los subconjuntos."""
+    overshoots, sizes = [], []
+    for size in range(1, len(totals) + 1):
+        for subset in combinations(range(len(totals)), size):
+            total = totals[list(subset)].sum()
+            if total >= target - 0.005:
+                overshoots.append(total - target)
+                sizes.append(size)
+    return (min(overshoots), min(sizes)) if sizes else (None, None)
+
+
+def test_greedy_matches_the_previous_selection():
+    for totals, target in cases():
+        chosen = greedy_cover(totals, target)
+        expected = legacy_greedy(totals, target)
+        if expected is None:
+            assert chosen is None
+        else:
+            assert chosen.tolist() == expected
+
+
+def overshoot(totals, chosen, target):
+    return totals[chosen].sum() - target
+
+
+def invoices(totals, chosen, target):
+    return len(chosen)
+
+
+# Cada solver optimiza su criterio y nunca queda peor que greedy en él
+@pytest.mark.parametrize('solver, criterion', [(min_overshoot_cover, overshoot), (fewest_invoices_cover, invoices)])
+def test_solvers_cover_the_amount_and_are_never_worse_than_greedy(solver, criterion):
+    for totals, target in cases(seed=1):
+        chosen = solver(totals, target)
+        greedy = greedy_cover(totals, target)
+        if greedy is None:
+            assert chosen is None
+            continue
+        assert totals[chosen].sum() >= target - 0.005
+        assert len(set(chosen.tolist())) == len(chosen)
+        assert criterion(totals, chosen, target) <= criterion(totals, greedy, target) + 1e-9
+
+
+def test_min_overshoot_finds_the_smallest_overshoot():
+    for totals, target in cases(seed=2):
+        chosen = min_overshoot_cover(totals, target, time_budget=10)
+        best_overshoot, _ = best_cover(totals, target)
+        if best_overshoot is None:
+            assert chosen is None
+        else:
+            assert totals[chosen].sum() - target == pytest.approx(best_overshoot, abs=1e-6)
+
+
+def test_fewest_uses_the_fewest_invoices():
+    for totals, target in cases(seed=3):
+        chosen = fewest_invoices_cover(totals, target)
+        _, fewest = best_cover(totals, target)
+        if fewest is None:
+            assert chosen is None
+        else:
+            assert len(chosen) == fewest
@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+from credit_store import CreditStore
+
+OLD_SCHEMA = """
+CREATE TABLE notas_de_credito (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    numero_factura TEXT,
+    razon_social TEXT,
+    monto_bs REAL,
+    monto_usd REAL,
+    fecha TEXT,
+    portafolio TEXT,
+    estado_proceso TEXT,
+    mensaje TEXT,
+    archivo_origen TEXT,
+    fecha_procesado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def make_store(tmp_path):
+    return CreditStore(path=str(tmp_path / 'historial.db'), seed_path=None)
+
+
+def ticket(invoices, amounts, client='100'):
+    return pd.DataFrame({
+        'ASIGNACION': invoices,
+        'Solicitante': [client] * len(invoices),
+        'Monto NC Asignado': amounts,
+        'TEXTO CABECERA': ['NC'] * len(invoices),
+    })
+
+
+def test_ticket_stores_client_code_and_rolls_up_by_code(tmp_path):
+    store = make_store(tmp_path)
+    store.add_ticket(ticket(['F1', 'F2'], [10.0, 5.0]), 'T1', '0700', 'Grand Slam', 'extracto.xlsx')
+
+    credits = store.credits_for_invoice('F1')
+    assert credits.loc[0, 'cod_cliente'] == '100'
+    assert pd.isna(credits.loc[0, 'razon_social'])
+    by_client = store.rollup('cliente')
+    assert by_client.to_dict('records') == [{'clave': '100', 'tickets': 1, 'lineas': 2, 'monto': 15.0}]
+
+
+def test_old_database_is_migrated_and_client_code_backfilled(tmp_path):
+    path = tmp_path / 'historial.db'
+    conn = sqlite3.connect(path)
+    conn.execute(OLD_SCHEMA)
+    conn.execute('ALTER TABLE notas_de_credito ADD COLUMN ticket TEXT')
+    conn.execute('ALTER TABLE notas_de_credito ADD COLUMN motivo TEXT')
+    conn.executemany(
+        'INSERT INTO notas_de_credito (numero_factura, razon_social, monto_bs, fecha, portafolio, estado_proceso, '
+        'fecha_procesado, ticket) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [
+            # Nota anterior a los tickets: nombre del cliente
+            ('F1', 'Bodega La Esquina', 7.0, '2026-01-02', '0700', 'procesado', '2026-01-02 10:00:00', None),
+            # Ticket guardado con el código en razon_social
+            ('F1', '100', 3.0, '2026-01-03', '0700', 'generado', '2026-01-03 10:00:00', 'T1'),
+            ('F2', '100', 2.0, '2026-01-03', '0600', 'generado', '2026-01-03 10:00:00', 'T1'),
+        ])
+    conn.commit()
+    conn.close()
+
+    store = CreditStore(path=str(path), seed_path=None)
+    credits = store.credits_for_invoice('F1').set_index('estado_proceso')
+    assert credits.loc['procesado', 'razon_social'] == 'Bodega La Esquina'
+    assert pd.isna(credits.loc['procesado', 'cod_cliente'])
+    assert credits.loc['generado', 'cod_cliente'] == '100'
+    assert pd.isna(credits.loc['generado', 'razon_social'])
+
+    by_client = store.rollup('cliente').set_index('clave')
+    assert by_client.loc['100', 'monto'] == 5.0
+    assert 'Bodega La Esquina' not in by_client.index
+    consumed, _ = store.consumed_amounts('0700')
+    assert consumed.to_dict() == {'F1': 10.0}
+
+
+def test_old_usage_and_rollup_tables_are_rebuilt_from_existing_notes(tmp_path):
+    path = tmp_path / 'historial.db'
+    conn = sqlite3.connect(path)
+    conn.execute(OLD_SCHEMA)
+    # Tabla de consumo anterior, solo por factura
+    conn.execute('CREATE TABLE consumo_por_factura (numero_factura TEXT PRIMARY KEY, monto REAL NOT NULL) WITHOUT ROWID')
+    conn.executemany('INSERT INTO notas_de_credito (numero_factura, monto_bs, portafolio) VALUES (?, ?, ?)',
+                     [('F1', 10.0, '0700'), ('F1', 5.0, '0600'), ('F2', 3.0, '0700'), ('F3', 1.0, None)])
+    conn.execute("INSERT INTO consumo_por_factura VALUES ('F1', 15.0)")
+    conn.commit()
+    conn.close()
+
+    store = CreditStore(path=str(path), seed_path=None)
+    assert store.consumed_amounts('0700')[0].to_dict() == {'F1': 10.0, 'F2': 3.0}
+    assert store.consumed_amounts('0600')[0].to_dict() == {'F1': 5.0}
+    assert store.consumed_amounts(None)[0].to_dict() == {'F3': 1.0}
+    by_portfolio = store.rollup('portafolio').set_index('clave')['monto'].to_dict()
+    assert by_portfolio == {'0700': 13.0, '0600': 5.0, '': 1.0}
+    store.close()
+
+
+def test_usage_table_accumulates_per_portfolio_and_invoice(tmp_path):
+    store = make_store(tmp_path)
+    store.add_ticket(ticket(['F1', 'F1', 'F2'], [10.0, 2.0, 5.0]), 'T1', '0700', 'Grand Slam', None)
+    store.add_ticket(ticket(['F1'], [3.0]), 'T2', '0700', 'Grand Slam', None)
+    store.add_ticket(ticket(['F1'], [4.0]), 'T3', '0600', 'Grand Slam', None)
+
+    with store._connection() as conn:
+        usage = dict(((p, f), m) for p, f, m in conn.execute('SELECT portafolio, numero_factura, monto FROM consumo_por_factura'))
+    assert usage == {('0700', 'F1'): 15.0, ('0700', 'F2'): 5.0, ('0600', 'F1'): 4.0}
+    by_portfolio = store.rollup('portafolio').set_index('clave')
+    assert by_portfolio.loc['0700', 'tickets'] == 2
+    assert by_portfolio.loc['0700', 'lineas'] == 4
+
+
+def test_insert_records_is_all_or_nothing(tmp_path):
+    store = make_store(tmp_path)
+    store.add_ticket(ticket(['F1'], [10.0]), 'T1', '0700', 'Grand Slam', None)
+    good = ('F2', None, 5.0, None, '2026-01-01', '0700', 'generado', None, None, None, 'T2', None, '100')
+    bad = good[:7] + (object(),) + good[8:]
+    with pytest.raises(sqlite3.Error):
+        # La segunda fila tiene un mensaje que SQLite no puede guardar: no se guarda ninguna
+        store.insert_records([good, bad])
+
+    assert store.count() == 1
+    assert store.consumed_amounts('0700')[0].to_dict() == {'F1': 10.0}
+    assert store.rollup('portafolio').set_index('clave').loc['0700', 'tickets'] == 1
+
+
+def test_threads_share_one_connection(tmp_path):
+    store = make_store(tmp_path)
+    connections = []
+
+    def add(n):
+        store.add_ticket(ticket([f'F{n}'], [1.0]), f'T{n}', '0700', 'Grand Slam', None)
+        with store._connection() as conn:
+            connections.append(conn)
+
+    threads = [threading.Thread(target=add, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.count() == 8
+    assert len({id(conn) for conn in connections}) == 1
+    store.close()
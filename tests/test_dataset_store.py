@@ -0,0 +1,43 @@
+import io
+
+import pandas as pd
+
+from dataset_store import DatasetStore
+
+
+def make_store():
+    loads = []
+
+    def loader(source, digest):
+        loads.append(digest)
+        return pd.DataFrame({'Solicitante': ['100', '101'], 'Precio': [1.0, 2.0]}), {'motor': 'prueba'}
+
+    return DatasetStore(loader=loader), loads
+
+
+def test_sessions_share_one_load():
+    store, loads = make_store()
+    first = store.acquire(io.BytesIO(b'extracto'))
+    second = store.acquire(io.BytesIO(b'extracto'))
+    assert len(loads) == 1
+    assert store.info()[0][2] == 2
+    first.release()
+    assert store.info()[0][2] == 1
+    second.release()
+
+
+def test_changes_of_one_session_are_not_visible_to_another():
+    store, _ = make_store()
+    first = store.acquire(io.BytesIO(b'extracto'))
+    second = store.acquire(io.BytesIO(b'extracto'))
+
+    first.df.loc[0, 'Precio'] = 99.0
+    first.df['Precio'] *= 10
+    first.df['Nueva'] = 'x'
+    first.df.rename(columns={'Solicitante': 'Cliente'}, inplace=True)
+
+    assert second.df['Precio'].tolist() == [1.0, 2.0]
+    assert list(second.df.columns) == ['Solicitante', 'Precio']
+    third = store.acquire(io.BytesIO(b'extracto'))
+    assert third.df['Precio'].tolist() == [1.0, 2.0]
+    assert list(third.df.columns) == ['Solicitante', 'Precio']
@@ -0,0 +1,57 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+from excel_export import create_excel_for_all_invoices
+from template_registry import DF_COLUMN_MAP, PAGE_SETUP_FIELDS, PORTFOLIO_TEMPLATE_MAP
+
+
+def ticket_lines(n=25):
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({col: [f"{col[:4].upper()}{i % 7}" for i in range(n)] for col in DF_COLUMN_MAP})
+    df['Fecha de Factura'] = '2024-05-17'
+    df['Cantidad'] = rng.integers(1, 50, n).astype(str)
+    df['VARIACION DE PRECIO'] = ['1.234,56'] * n
+    df['Monto NC Asignado'] = np.round(rng.uniform(1, 5_000, n), 2)
+    df.loc[3, 'Monto NC Asignado'] = np.nan
+    return df
+
+
+def style_of(obj):
+    return (obj.font.b, obj.font.color.rgb if obj.font.color else None, obj.fill.fgColor.rgb,
+            getattr(obj.border.left, 'style', None), obj.alignment.horizontal, obj.number_format)
+
+
+def sheet_snapshot(sheet):
+    """Lo que se ve del libro: valores y estilos de las celdas, dimensiones y propiedades de la hoja."""
+    return {
+        'title': sheet.title,
+        'cells': [[(cell.value, style_of(cell)) for cell in row] for row in sheet.iter_rows()],
+        'rows': {key: (dim.height, dim.hidden, style_of(dim) if dim.has_style else None)
+                 for key, dim in sheet.row_dimensions.items() if dim.height or dim.hidden or dim.has_style},
+        'columns': {key: (dim.min, dim.max, dim.width, dim.bestFit, dim.hidden, style_of(dim) if dim.has_style else None)
+                    for key, dim in sheet.column_dimensions.items() if dim.width or dim.hidden or dim.has_style},
+        'format': (sheet.sheet_format.defaultRowHeight, sheet.sheet_format.baseColWidth, sheet.sheet_format.defaultColWidth),
+        'page': tuple(getattr(sheet.page_setup, name) for name in PAGE_SETUP_FIELDS),
+        'margins': (sheet.page_margins.left, sheet.page_margins.right, sheet.page_margins.top, sheet.page_margins.bottom),
+        'view': (sheet.freeze_panes, sheet.sheet_view.zoomScale, sheet.sheet_view.showGridLines),
+        'protection': sheet.protection.sheet,
+        'merged': sorted(str(r) for r in sheet.merged_cells.ranges),
+        'conditional': sorted(str(cf.sqref) for cf in sheet.conditional_formatting),
+    }
+
+
+@pytest.mark.parametrize('portfolio', sorted(PORTFOLIO_TEMPLATE_MAP))
+@pytest.mark.parametrize('lines', [ticket_lines(), ticket_lines().iloc[:0]], ids=['lineas', 'vacio'])
+def test_fast_mode_matches_classic_mode(portfolio, lines):
+    classic = openpyxl.load_workbook(create_excel_for_all_invoices(lines, portfolio, fast=False)).active
+    fast = openpyxl.load_workbook(create_excel_for_all_invoices(lines, portfolio, fast=True)).active
+    expected, actual = sheet_snapshot(classic), sheet_snapshot(fast)
+    for key in expected:
+        assert actual[key] == expected[key], key
+
+
+def test_fast_mode_keeps_header_row_height():
+    sheet = openpyxl.load_workbook(create_excel_for_all_invoices(ticket_lines(), '0700', fast=True)).active
+    assert sheet.row_dimensions[1].height == 24.0
@@ -0,0 +1,51 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from history_search import SubstringIndex, scan
+
+KEYWORDS = ['esperanza', 'ÑANDÚ', 'ñandú 1', 'la esperanza 1', 'esperanza apc', 'r1', '07', '0700', 'apc',
+            'Ticket_00', '.xlsx', 'c.a.', '(', 'e', ' ', 'nan', '1234', 'zzz', 'sol  ']
+
+
+def history(rows=3000, seed=0):
+    rng = random.Random(seed)
+    names = ['El Sol', 'La Esperanza', 'Ñandú', 'San José']
+    return pd.DataFrame({
+        'numero_factura': [rng.randint(10 ** 7, 10 ** 8 - 1) for _ in range(rows)],
+        'razon_social': [f"{rng.choice(['Comercial', 'Bodega'])} {rng.choice(names)} {rng.randint(1, 300)} C.A."
+                         for _ in range(rows)],
+        'monto_bs': [rng.random() * 1000 for _ in range(rows)],
+        'portafolio': [rng.choice(['0700', '0600', 'R100', 'C001', '']) for _ in range(rows)],
+        'archivo_origen': [rng.choice([f"Ticket_{d:03d}_{rng.choice(['APC', 'PCV'])}.xlsx" for d in range(40)] + [np.nan])
+                           for _ in range(rows)],
+    })
+
+
+@pytest.mark.parametrize('keyword', KEYWORDS)
+def test_index_returns_the_same_rows_as_the_scan(keyword):
+    frame = history()
+    index = SubstringIndex()
+    index.update(frame)
+    expected = scan(frame, keyword)
+    assert index.search(keyword).tolist() == frame.index.get_indexer(expected.index).tolist()
+
+
+def test_index_extended_with_new_rows_matches_the_scan():
+    frame = history(4000)
+    index = SubstringIndex()
+    index.update(frame.iloc[:2500], key=1)
+    index.update(frame, key=1)
+    for keyword in KEYWORDS:
+        expected = scan(frame, keyword)
+        assert index.search(keyword).tolist() == expected.index.tolist()
+
+
+def test_scan_treats_the_keyword_as_text():
+    frame = history(200)
+    # Sin expresiones regulares: '.' es un punto y '(' no es un error
+    assert scan(frame, '.').equals(frame)
+    assert scan(frame, '(').empty
+    assert scan(frame, '').equals(frame)
@@ -0,0 +1,61 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from invoice_index import find_invoice_references, referenced_invoices
+from nc_engine import clean_leading_zeros
+
+COLUMNS = ['ASIGNACION', 'Solicitante', 'TEXTO CABECERA', 'Referencia', 'Precio']
+
+
+def legacy_references(df, col_factura):
+    # Bucle de la app antes del índice: cada celda de cada línea con re.findall
+    norm_to_originals = {}
+    for orig in df[col_factura].astype(str).fillna('').str.strip().unique().tolist():
+        norm = clean_leading_zeros(re.sub(r'\D', '', orig))
+        norm_to_originals.setdefault(norm or orig.strip(), set()).add(orig)
+    referenced = set()
+    for _, row in df.iterrows():
+        row_invoice = str(row.get(col_factura, '')).strip()
+        for col_name in df.columns:
+            cell_content = str(row[col_name]).strip()
+            for num_in_cell in re.findall(r'\d{7,}', cell_content):
+                for original in norm_to_originals.get(clean_leading_zeros(num_in_cell), ()):
+                    if str(original).strip() != row_invoice:
+                        referenced.add(original)
+    return referenced
+
+
+def random_extract(rng, rows=120):
+    numbers = rng.choice(np.arange(9_000_000, 9_000_200), size=40, replace=False)
+    # Mismo número con y sin ceros a la izquierda, y facturas con texto
+    invoices = [f"00{n}" for n in numbers[:30]] + [str(n) for n in numbers[:3]] + [f"F-{n}" for n in numbers[30:35]]
+    texts = ['', 'ANULA {}', 'REF. {} / {}', 'NC {}', 'PEDIDO 123456', 'sin referencia']
+
+    def text():
+        template = texts[rng.integers(len(texts))]
+        return template.format(*(f"{rng.choice(['', '0', '00'])}{rng.choice(numbers)}" for _ in range(2)))
+
+    return pd.DataFrame({
+        'ASIGNACION': [invoices[i] for i in rng.integers(len(invoices), size=rows)],
+        'Solicitante': [str(c) for c in rng.integers(100, 110, size=rows)],
+        'TEXTO CABECERA': [text() for _ in range(rows)],
+        'Referencia': [text() if rng.random() < 0.2 else np.nan for _ in range(rows)],
+        'Precio': [f"{v:,.2f}" for v in rng.uniform(1, 900_000, size=rows)],
+    })
+
+
+def test_references_match_the_previous_cell_scan():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        df = random_extract(rng)
+        references = find_invoice_references(df, 'ASIGNACION', COLUMNS)
+        assert referenced_invoices(references) == legacy_references(df, 'ASIGNACION')
+
+        # Después de quitar líneas (tickets apilados) solo cuentan las que siguen vigentes;
+        # se comparan las líneas que quedan excluidas
+        alive = df[rng.random(len(df)) < 0.6]
+        invoices = alive['ASIGNACION'].str.strip()
+        excluded = invoices.isin(referenced_invoices(references, alive.index))
+        assert excluded.equals(invoices.isin(legacy_references(alive, 'ASIGNACION')))
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+from amounts import AMOUNT_COLUMN
+from credit_store import CreditStore
+from ledger import add_ticket_to_ledger, apply_ledger, history_ledger
+
+
+def ticket(invoices, amounts):
+    return pd.DataFrame({
+        'ASIGNACION': invoices,
+        'Solicitante': ['100'] * len(invoices),
+        'Monto NC Asignado': amounts,
+    })
+
+
+def extract_lines():
+    return pd.DataFrame({
+        'Asignación': ['F1', 'F1', 'F2', 'F3'],
+        AMOUNT_COLUMN: [6.0, 8.0, 5.0, 3.0],
+    })
+
+
+def available(store, portfolio, unrecorded=None):
+    lines = extract_lines()
+    consumed, _ = store.consumed_amounts(portfolio)
+    ledger = history_ledger(consumed, lines['Asignación'].unique(), unrecorded)
+    return ledger, apply_ledger(lines, 'Asignación', ledger)
+
+
+def test_invoice_number_reused_in_another_portfolio_is_not_subtracted(tmp_path):
+    store = CreditStore(path=str(tmp_path / 'historial.db'), seed_path=None)
+    store.add_ticket(ticket(['F1'], [10.0]), 'T1', '0700', 'Grand Slam', None)
+    store.add_ticket(ticket(['F1', 'F2'], [4.0, 5.0]), 'T2', '0600', 'Grand Slam', None)
+
+    ledger, lines = available(store, '0700')
+    assert ledger == {'F1': 10.0}
+    # 10 de F1 se descuentan en orden: la primera línea (6) queda sin saldo y a la segunda le quedan 4
+    assert lines['Asignación'].tolist() == ['F1', 'F2', 'F3']
+    assert lines[AMOUNT_COLUMN].tolist() == [4.0, 5.0, 3.0]
+
+
+def test_unrecorded_session_ticket_is_added_on_top_of_history(tmp_path):
+    store = CreditStore(path=str(tmp_path / 'historial.db'), seed_path=None)
+    store.add_ticket(ticket(['F1'], [6.0]), 'T1', '0700', 'Grand Slam', None)
+    # Ticket que no se pudo registrar: solo está en el libro de la sesión
+    unrecorded = add_ticket_to_ledger({}, ticket(['F1', 'F3'], [2.0, 3.0]))
+
+    ledger, lines = available(store, '0700', unrecorded)
+    assert ledger == {'F1': 8.0, 'F3': 3.0}
+    assert lines['Asignación'].tolist() == ['F1', 'F2']
+    assert lines[AMOUNT_COLUMN].tolist() == [6.0, 5.0]
+
+
+def test_recorded_ticket_is_not_counted_twice(tmp_path):
+    store = CreditStore(path=str(tmp_path / 'historial.db'), seed_path=None)
+    store.add_ticket(ticket(['F2'], [2.0]), 'T1', '0700', 'Grand Slam', None)
+
+    ledger, lines = available(store, '0700', {})
+    assert ledger == {'F2': 2.0}
+    assert lines.set_index('Asignación').loc['F2', AMOUNT_COLUMN] == 3.0
+
+
+def test_notes_from_another_session_are_added_incrementally(tmp_path):
+    path = str(tmp_path / 'historial.db')
+    store = CreditStore(path=path, seed_path=None)
+    other = CreditStore(path=path, seed_path=None)
+    store.add_ticket(ticket(['F1'], [1.0]), 'T1', '0700', 'Grand Slam', None)
+    first, first_version = store.consumed_amounts('0700')
+
+    # Otra sesión (u otro equipo con la misma base) registra más notas
+    other.add_ticket(ticket(['F1', 'F2'], [2.0, 5.0]), 'T2', '0700', 'Grand Slam', None)
+    other.add_ticket(ticket(['F1'], [7.0]), 'T3', '0600', 'Grand Slam', None)
+    updated, version = store.consumed_amounts('0700')
+    assert version > first_version
+    assert updated.sort_index().to_dict() == {'F1': 3.0, 'F2': 5.0}
+    assert first.to_dict() == {'F1': 1.0}
+
+    # Sin notas nuevas la versión no cambia, y el resultado coincide con una lectura completa
+    again, same_version = store.consumed_amounts('0700')
+    assert same_version == version
+    fresh, _ = CreditStore(path=path, seed_path=None).consumed_amounts('0700')
+    assert again.sort_index().to_dict() == fresh.sort_index().to_dict()
+
+
+def legacy_reduce_balance(df, col_factura, used_amount_map):
+    # reduce_balance de la app antes de apply_ledger: recorre las líneas de cada factura
+    amounts = df[AMOUNT_COLUMN].copy()
+    for name, positions in df.groupby(col_factura, sort=False).indices.items():
+        total_used = used_amount_map.get(str(name).strip())
+        if total_used is None:
+            continue
+        for idx in df.index[positions]:
+            if total_used <= 0.01:
+                break
+            current_val = amounts.at[idx]
+            if pd.isna(current_val):
+                continue
+            if current_val > total_used:
+                amounts.at[idx] = current_val - total_used
+                total_used = 0
+            else:
+                amounts.at[idx] = 0
+                total_used -= current_val
+    return amounts[amounts > 0.01]
+
+
+def random_lines(rng, rows=300):
+    # Algunas facturas vienen con espacios (siempre igual: el ciclo anterior agrupaba el valor sin limpiar)
+    invoices = [f" F{i} " if i % 7 == 0 else f"F{i}" for i in range(40)]
+    amounts = rng.choice([0.0, 0.005, 10.0, 25.5, 100.0, -5.0, np.nan], size=rows) * rng.integers(1, 4, size=rows)
+    return pd.DataFrame({
+        'Asignación': [invoices[i] for i in rng.integers(len(invoices), size=rows)],
+        AMOUNT_COLUMN: amounts,
+    }, index=rng.permutation(rows) + 1000)
+
+
+def test_apply_ledger_matches_the_previous_per_invoice_loop():
+    rng = np.random.default_rng(0)
+    for _ in range(30):
+        lines = random_lines(rng)
+        ledger = {f"F{i}": float(rng.choice([0.005, 5.0, 30.0, 60.0, 500.0])) for i in rng.choice(40, size=15, replace=False)}
+        expected = legacy_reduce_balance(lines, 'Asignación', ledger)
+
+        result = apply_ledger(lines, 'Asignación', ledger)
+        pd.testing.assert_series_equal(result[AMOUNT_COLUMN].sort_index(), expected.sort_index())
+
+        # Con las filas de las facturas del libro ya conocidas (índice) el resultado es el mismo
+        labels = lines.index[lines['Asignación'].str.strip().isin(ledger)]
+        result = apply_ledger(lines, 'Asignación', ledger, labels=labels)
+        pd.testing.assert_series_equal(result[AMOUNT_COLUMN].sort_index(), expected.sort_index())
+
+
+def test_apply_ledger_spends_the_consumed_amount_once_across_padded_copies():
+    lines = pd.DataFrame({'Asignación': ['F1', ' F1 '], AMOUNT_COLUMN: [25.0, 30.0]}, index=[10, 11])
+    result = apply_ledger(lines, 'Asignación', {'F1': 40.0})
+    # El ciclo anterior descontaba 40 a cada variante y no dejaba ninguna línea
+    assert result[AMOUNT_COLUMN].to_dict() == {11: 15.0}
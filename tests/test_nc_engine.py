@@ -0,0 +1,33 @@
+import pandas as pd
+
+from nc_engine import PORTFOLIO_SAMPLE_ROWS, detect_portfolio_code
+
+
+def org_extract(values):
+    return pd.DataFrame({'Organización de Ventas': values})
+
+
+def test_higher_priority_portfolio_outside_the_sample_wins():
+    # 0702 (0700) tiene prioridad sobre 0602 (0600) aunque aparezca en una sola fila
+    # que la muestra no toma
+    rows = PORTFOLIO_SAMPLE_ROWS * 15
+    values = ['0602'] * rows
+    values[1] = '0702'
+    assert detect_portfolio_code(org_extract(values)) == '0700'
+
+
+def test_highest_priority_portfolio_in_the_sample_decides():
+    rows = PORTFOLIO_SAMPLE_ROWS * 15
+    values = ['0702'] * rows
+    values[1] = '0602'
+    assert detect_portfolio_code(org_extract(values)) == '0700'
+
+
+def test_single_portfolio_extract():
+    assert detect_portfolio_code(org_extract(['0602'] * (PORTFOLIO_SAMPLE_ROWS * 3))) == '0600'
+    assert detect_portfolio_code(org_extract(['R200', 'R200'])) == 'R100'
+
+
+def test_categorical_column_uses_its_categories():
+    values = pd.Categorical(['0602'] * (PORTFOLIO_SAMPLE_ROWS * 3) + ['0702'])
+    assert detect_portfolio_code(org_extract(values)) == '0700'
@@ -0,0 +1,125 @@
+import pandas as pd
+
+from local_sheet import LocalClient
+from sheet_mirror import SheetMirror, numericise
+
+HEADER = ['numero_factura', 'razon_social', 'monto_bs', 'portafolio']
+ROWS = [
+    ['0090000189', 'Bodega La Esquina', '1500.5', '0700'],
+    ['0090000190', 'Abasto El Sol', '300', 'R100'],
+    ['F_12', '', '12', '0600'],
+]
+
+
+def make_sheet(rows=ROWS):
+    worksheet = LocalClient().open('historial').sheet1
+    worksheet.update([HEADER] + rows, 'A1')
+    worksheet.requests = 0
+    return worksheet
+
+
+def make_mirror(tmp_path, **kwargs):
+    return SheetMirror(path=str(tmp_path / 'espejo.db'), sync_interval=0, **kwargs)
+
+
+def expected_frame(worksheet):
+    # Lo mismo que get_all_records: valores numericise por encabezado
+    header, *rows = worksheet.get_all_values()
+    return pd.DataFrame([dict(zip(header, map(numericise, row))) for row in rows])
+
+
+def test_numericise_matches_get_all_records():
+    assert numericise('300') == 300
+    assert numericise('1500.5') == 1500.5
+    assert numericise('0090000189') == 90000189
+    assert numericise('F_12') == 'F_12'
+    assert numericise('1_000') == '1_000'
+    assert numericise('') == ''
+
+
+def test_first_sync_copies_the_whole_sheet(tmp_path):
+    worksheet = make_sheet()
+    mirror = make_mirror(tmp_path)
+    assert mirror.sync(worksheet, 'historial') == 3
+    assert worksheet.requests == 1
+    assert mirror.stats['modo'] == 'completa'
+    worksheet.requests = 0
+    pd.testing.assert_frame_equal(mirror.frame(), expected_frame(worksheet))
+    assert mirror.frame().loc[1, 'monto_bs'] == 300
+
+
+def test_new_rows_are_fetched_in_one_request(tmp_path):
+    worksheet = make_sheet()
+    mirror = make_mirror(tmp_path)
+    mirror.sync(worksheet, 'historial')
+    before = mirror.frame()
+    generation = mirror.generation
+
+    worksheet.append_rows([['0090000191', 'Kiosko Centro', '45', '0700'], ['0090000192', 'Mini Polar', '', 'C001']])
+    worksheet.requests = 0
+    assert mirror.sync(worksheet, 'historial') == 2
+    assert worksheet.requests == 1
+    assert mirror.stats['modo'] == 'incremental'
+    assert mirror.generation == generation
+    frame = mirror.frame()
+    pd.testing.assert_frame_equal(frame, expected_frame(worksheet))
+    # Las filas ya espejadas no cambian de posición ni de valor
+    pd.testing.assert_frame_equal(frame.head(len(before)), before, check_dtype=False)
+
+    worksheet.requests = 0
+    assert mirror.sync(worksheet, 'historial') == 0
+    assert worksheet.requests == 1
+
+
+def test_header_change_forces_a_full_copy(tmp_path):
+    worksheet = make_sheet()
+    mirror = make_mirror(tmp_path)
+    mirror.sync(worksheet, 'historial')
+    generation = mirror.generation
+
+    worksheet.update([HEADER + ['ticket']], 'A1')
+    worksheet.requests = 0
+    mirror.sync(worksheet, 'historial')
+    # batch_get detecta el cambio y get_all_values copia la hoja
+    assert worksheet.requests == 2
+    assert mirror.stats['modo'] == 'completa'
+    assert mirror.generation == generation + 1
+    assert list(mirror.frame().columns) == HEADER + ['ticket']
+
+
+def test_changed_last_row_forces_a_full_copy(tmp_path):
+    worksheet = make_sheet()
+    mirror = make_mirror(tmp_path)
+    mirror.sync(worksheet, 'historial')
+
+    # Se borró una fila: la que era la última espejada ahora es otra
+    worksheet.update([ROWS[0], ROWS[2], [''] * len(HEADER)], 'A2')
+    worksheet.requests = 0
+    assert mirror.sync(worksheet, 'historial') == 2
+    assert mirror.stats['modo'] == 'completa'
+    pd.testing.assert_frame_equal(mirror.frame(), expected_frame(worksheet))
+
+
+def test_mirror_on_disk_is_reused_by_a_new_process(tmp_path):
+    worksheet = make_sheet()
+    make_mirror(tmp_path).sync(worksheet, 'historial')
+
+    worksheet.append_rows([['0090000191', 'Kiosko Centro', '45', '0700']])
+    worksheet.requests = 0
+    mirror = make_mirror(tmp_path)
+    assert mirror.sync(worksheet, 'historial') == 1
+    assert worksheet.requests == 1
+    assert mirror.stats['modo'] == 'incremental'
+    pd.testing.assert_frame_equal(mirror.frame(), expected_frame(worksheet))
+
+
+def test_periodic_full_copy_and_other_sheet(tmp_path):
+    worksheet = make_sheet()
+    mirror = make_mirror(tmp_path, full_sync_interval=0)
+    mirror.sync(worksheet, 'historial')
+    mirror.sync(worksheet, 'historial')
+    assert mirror.stats['modo'] == 'completa'
+
+    mirror = make_mirror(tmp_path)
+    mirror.sync(worksheet, 'otra hoja')
+    assert mirror.stats['modo'] == 'completa'
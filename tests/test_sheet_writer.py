@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from local_sheet import LocalClient
+from sheet_writer import BatchRejected, SheetWriter
+
+HEADER = ['numero_factura', 'monto_bs']
+
+
+class APIError(Exception):
+    """Como gspread.exceptions.APIError: el código HTTP en .code."""
+
+    def __init__(self, code):
+        super().__init__(f"APIError: [{code}]")
+        self.code = code
+
+
+class FlakyWorksheet:
+    """Hoja local cuyo append_rows lanza los errores de failures antes de funcionar."""
+
+    def __init__(self, worksheet, failures=()):
+        self.worksheet = worksheet
+        self.failures = list(failures)
+
+    def __getattr__(self, name):
+        return getattr(self.worksheet, name)
+
+    def append_rows(self, values, **kwargs):
+        if self.failures:
+            raise self.failures.pop(0)
+        return self.worksheet.append_rows(values, **kwargs)
+
+
+def make_writer(tmp_path, failures=(), open_failures=()):
+    worksheet = LocalClient().open('historial').sheet1
+    flaky = FlakyWorksheet(worksheet, failures)
+    open_failures = list(open_failures)
+    opened = []
+
+    def open_worksheet():
+        if open_failures:
+            raise open_failures.pop(0)
+        opened.append(flaky)
+        return flaky
+
+    # Intervalo largo: el hilo de fondo no envía durante la prueba, se llama a flush()
+    writer = SheetWriter(open_worksheet, path=str(tmp_path / 'pendiente.db'), flush_interval=3600,
+                         rejected_path=str(tmp_path / 'rechazadas.jsonl'))
+    return writer, worksheet, opened
+
+
+def rejected_lines(writer):
+    try:
+        with open(writer.rejected_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def test_queued_rows_are_sent_in_one_request(tmp_path):
+    writer, worksheet, opened = make_writer(tmp_path)
+    writer.enqueue(HEADER, [['F1', 10.0], ['F2', float('nan')]])
+    writer.enqueue(HEADER, [['F3', 5]])
+    assert writer.pending() == 3
+
+    assert writer.flush() == 3
+    # Encabezado (row_values + update) y un solo append_rows
+    assert worksheet.requests == 3
+    assert worksheet.get_all_values() == [HEADER, ['F1', '10.0'], ['F2', ''], ['F3', '5']]
+    assert writer.pending() == 0
+
+    worksheet.requests = 0
+    writer.enqueue(HEADER, [['F4', 1]])
+    assert writer.flush() == 1
+    assert worksheet.requests == 1
+    assert len(opened) == 1
+
+
+def test_batch_rejected_by_the_api_goes_to_the_rejected_file(tmp_path):
+    writer, worksheet, _ = make_writer(tmp_path, failures=[APIError(400)])
+    writer.enqueue(HEADER, [['F1', 10.0]])
+    with pytest.raises(BatchRejected):
+        writer.flush()
+
+    assert writer.pending() == 0
+    assert [line['valores'] for line in rejected_lines(writer)] == [['F1', 10.0]]
+    status = writer.status()
+    assert status['rechazadas'] == 1
+    assert '400' in status['ultimo_rechazo']
+
+
+@pytest.mark.parametrize('error', [APIError(429), APIError(503), APIError(403), APIError(401),
+                                   ConnectionError('sin red'), TypeError('error del programa')])
+def test_other_errors_keep_the_queue(tmp_path, error):
+    writer, worksheet, opened = make_writer(tmp_path, failures=[error])
+    writer.enqueue(HEADER, [['F1', 10.0]])
+    with pytest.raises(type(error)):
+        writer.flush()
+    assert writer.pending() == 1
+    assert rejected_lines(writer) == []
+
+    assert writer.flush() == 1
+    assert worksheet.get_all_values() == [HEADER, ['F1', '10.0']]
+    # Solo los errores temporales de la API conservan la hoja abierta
+    assert len(opened) == (1 if getattr(error, 'code', None) in (429, 503) else 2)
+
+
+def test_failure_to_open_the_sheet_keeps_the_queue(tmp_path):
+    class SpreadsheetNotFound(Exception):
+        pass
+
+    writer, worksheet, opened = make_writer(tmp_path, open_failures=[SpreadsheetNotFound('historial'), APIError(400)])
+    writer.enqueue(HEADER, [['F1', 10.0]])
+    with pytest.raises(SpreadsheetNotFound):
+        writer.flush()
+    # Un 400 al autorizar o abrir la hoja no es un rechazo del lote
+    with pytest.raises(APIError):
+        writer.flush()
+    assert writer.pending() == 1
+    assert rejected_lines(writer) == []
+
+    assert writer.flush() == 1
+    assert worksheet.get_all_values() == [HEADER, ['F1', '10.0']]